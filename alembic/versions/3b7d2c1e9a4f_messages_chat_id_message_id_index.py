@@ -0,0 +1,26 @@
+"""messages chat_id message_id index
+
+Revision ID: 3b7d2c1e9a4f
+Revises: 90f28bc5c96f
+Create Date: 2026-10-16 10:12:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7d2c1e9a4f'
+down_revision: Union[str, None] = '90f28bc5c96f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_messages_chat_id_message_id', 'messages', ['chat_id', 'message_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_chat_id_message_id', table_name='messages')
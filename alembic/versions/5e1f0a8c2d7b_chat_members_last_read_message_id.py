@@ -0,0 +1,26 @@
+"""chat_members last_read_message_id
+
+Revision ID: 5e1f0a8c2d7b
+Revises: 3b7d2c1e9a4f
+Create Date: 2026-10-16 13:40:05.217904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e1f0a8c2d7b'
+down_revision: Union[str, None] = '3b7d2c1e9a4f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('chat_members', sa.Column('last_read_message_id', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('chat_members', 'last_read_message_id')
@@ -0,0 +1,37 @@
+"""messages search_vector
+
+Revision ID: 7c4a9e2f1b6d
+Revises: 5e1f0a8c2d7b
+Create Date: 2026-10-16 15:12:44.103518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c4a9e2f1b6d'
+down_revision: Union[str, None] = '5e1f0a8c2d7b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('messages', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed(
+            "to_tsvector('russian'::regconfig, content) || to_tsvector('english'::regconfig, content)",
+            persisted=True,
+        ),
+        nullable=True,
+    ))
+    op.create_index('ix_messages_search_vector', 'messages', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_search_vector', table_name='messages', postgresql_using='gin')
+    op.drop_column('messages', 'search_vector')
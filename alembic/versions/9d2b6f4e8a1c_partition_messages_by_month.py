@@ -0,0 +1,101 @@
+"""partition messages by month
+
+Revision ID: 9d2b6f4e8a1c
+Revises: 7c4a9e2f1b6d
+Create Date: 2026-10-16 16:05:31.480217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d2b6f4e8a1c'
+down_revision: Union[str, None] = '7c4a9e2f1b6d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_VECTOR = "to_tsvector('russian'::regconfig, content) || to_tsvector('english'::regconfig, content)"
+
+# Сколько месяцев вперёд создаётся секций; дальше их создаёт PartitionMaintainer
+PARTITIONS_AHEAD = 3
+
+
+def upgrade() -> None:
+    # Старая таблица отдаёт новой последовательность message_id
+    op.execute("ALTER TABLE messages RENAME TO messages_unpartitioned")
+    op.execute("ALTER TABLE messages_unpartitioned RENAME CONSTRAINT messages_pkey TO messages_unpartitioned_pkey")
+    op.execute("ALTER SEQUENCE messages_message_id_seq OWNED BY NONE")
+    op.execute("ALTER INDEX ix_messages_chat_id_message_id RENAME TO ix_messages_unpartitioned_chat_id_message_id")
+    op.execute("ALTER INDEX ix_messages_search_vector RENAME TO ix_messages_unpartitioned_search_vector")
+
+    op.execute(f"""
+        CREATE TABLE messages (
+            message_id INTEGER NOT NULL DEFAULT nextval('messages_message_id_seq'),
+            chat_id INTEGER REFERENCES chats (chat_id),
+            user_id INTEGER REFERENCES users (user_id),
+            content VARCHAR(2000) NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+            search_vector TSVECTOR GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED,
+            PRIMARY KEY (message_id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("ALTER SEQUENCE messages_message_id_seq OWNED BY messages.message_id")
+    op.create_index('ix_messages_chat_id_message_id', 'messages', ['chat_id', 'message_id'], unique=False)
+    op.create_index('ix_messages_search_vector', 'messages', ['search_vector'], unique=False, postgresql_using='gin')
+    op.execute("CREATE TABLE messages_default PARTITION OF messages DEFAULT")
+
+    # Секции на каждый месяц с существующими сообщениями и на несколько месяцев вперёд
+    op.execute(f"""
+        DO $$
+        DECLARE
+            month DATE;
+            last_month DATE := date_trunc('month', now()) + interval '{PARTITIONS_AHEAD} months';
+        BEGIN
+            SELECT date_trunc('month', coalesce(min(created_at), now())) INTO month FROM messages_unpartitioned;
+            WHILE month <= last_month LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+                    'messages_y' || to_char(month, 'YYYY') || 'm' || to_char(month, 'MM'),
+                    month, month + interval '1 month'
+                );
+                month := month + interval '1 month';
+            END LOOP;
+        END $$
+    """)
+
+    op.execute("""
+        INSERT INTO messages (message_id, chat_id, user_id, content, created_at)
+        SELECT message_id, chat_id, user_id, content, coalesce(created_at, now())
+        FROM messages_unpartitioned
+    """)
+    op.execute("DROP TABLE messages_unpartitioned")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE messages RENAME TO messages_partitioned")
+    op.execute("ALTER TABLE messages_partitioned RENAME CONSTRAINT messages_pkey TO messages_partitioned_pkey")
+    op.execute("ALTER SEQUENCE messages_message_id_seq OWNED BY NONE")
+    op.execute("ALTER INDEX ix_messages_chat_id_message_id RENAME TO ix_messages_partitioned_chat_id_message_id")
+    op.execute("ALTER INDEX ix_messages_search_vector RENAME TO ix_messages_partitioned_search_vector")
+
+    op.execute(f"""
+        CREATE TABLE messages (
+            message_id INTEGER NOT NULL DEFAULT nextval('messages_message_id_seq') PRIMARY KEY,
+            chat_id INTEGER REFERENCES chats (chat_id),
+            user_id INTEGER REFERENCES users (user_id),
+            content VARCHAR(2000) NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE,
+            search_vector TSVECTOR GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED
+        )
+    """)
+    op.execute("ALTER SEQUENCE messages_message_id_seq OWNED BY messages.message_id")
+    op.execute("""
+        INSERT INTO messages (message_id, chat_id, user_id, content, created_at)
+        SELECT message_id, chat_id, user_id, content, created_at FROM messages_partitioned
+    """)
+    op.create_index('ix_messages_chat_id_message_id', 'messages', ['chat_id', 'message_id'], unique=False)
+    op.create_index('ix_messages_search_vector', 'messages', ['search_vector'], unique=False, postgresql_using='gin')
+    op.execute("DROP TABLE messages_partitioned CASCADE")
@@ -0,0 +1,49 @@
+"""chats creator_id and last_activity_at
+
+Revision ID: a7d3b9e5c2f8
+Revises: f4c9e1a3b8d2
+Create Date: 2026-10-17 12:02:47.190355
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d3b9e5c2f8'
+down_revision: Union[str, None] = 'f4c9e1a3b8d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('chats', sa.Column('creator_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('chats_creator_id_fkey', 'chats', 'users', ['creator_id'], ['user_id'])
+    # Создатель добавляется в чат первым участником
+    op.execute(
+        """
+        UPDATE chats c SET creator_id = (
+            SELECT cm.user_id FROM chat_members cm WHERE cm.chat_id = c.chat_id ORDER BY cm.id LIMIT 1
+        )
+        """
+    )
+
+    op.add_column('chats', sa.Column('last_activity_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True))
+    op.execute(
+        """
+        UPDATE chats c SET last_activity_at = COALESCE((
+            SELECT m.created_at FROM messages m WHERE m.chat_id = c.chat_id ORDER BY m.message_id DESC LIMIT 1
+        ), c.created_at)
+        """
+    )
+    op.alter_column('chats', 'last_activity_at', nullable=False)
+    op.create_index('ix_chats_last_activity_at_chat_id', 'chats', ['last_activity_at', 'chat_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_chats_last_activity_at_chat_id', table_name='chats')
+    op.drop_column('chats', 'last_activity_at')
+    op.drop_constraint('chats_creator_id_fkey', 'chats', type_='foreignkey')
+    op.drop_column('chats', 'creator_id')
@@ -0,0 +1,40 @@
+"""image_blobs
+
+Revision ID: b3e8d1a7c5f2
+Revises: 9d2b6f4e8a1c
+Create Date: 2026-10-16 17:22:09.615042
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e8d1a7c5f2'
+down_revision: Union[str, None] = '9d2b6f4e8a1c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('image_blobs',
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('content_type', sa.String(length=100), nullable=True),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(), nullable=True),
+    sa.Column('unreferenced_at', sa.TIMESTAMP(), nullable=True),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+    op.add_column('article_images', sa.Column('blob_sha256', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_article_images_blob_sha256'), 'article_images', ['blob_sha256'], unique=False)
+    op.create_foreign_key('article_images_blob_sha256_fkey', 'article_images', 'image_blobs', ['blob_sha256'], ['sha256'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('article_images_blob_sha256_fkey', 'article_images', type_='foreignkey')
+    op.drop_index(op.f('ix_article_images_blob_sha256'), table_name='article_images')
+    op.drop_column('article_images', 'blob_sha256')
+    op.drop_table('image_blobs')
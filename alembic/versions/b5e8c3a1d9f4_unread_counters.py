@@ -0,0 +1,45 @@
+"""chats message_count and chat_members read_count
+
+Revision ID: b5e8c3a1d9f4
+Revises: a7d3b9e5c2f8
+Create Date: 2026-10-17 12:48:30.551926
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e8c3a1d9f4'
+down_revision: Union[str, None] = 'a7d3b9e5c2f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('chats', sa.Column('message_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('chat_members', sa.Column('read_count', sa.Integer(), server_default='0', nullable=False))
+    # Единственный полный подсчёт — при миграции; дальше счётчики ведутся инкрементально
+    op.execute(
+        """
+        UPDATE chats c SET message_count = counts.total
+        FROM (SELECT chat_id, count(*) AS total FROM messages GROUP BY chat_id) counts
+        WHERE counts.chat_id = c.chat_id
+        """
+    )
+    op.execute(
+        """
+        UPDATE chat_members cm SET read_count = (
+            SELECT count(*) FROM messages m
+            WHERE m.chat_id = cm.chat_id AND m.message_id <= cm.last_read_message_id
+        )
+        WHERE cm.last_read_message_id IS NOT NULL
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('chat_members', 'read_count')
+    op.drop_column('chats', 'message_count')
@@ -0,0 +1,40 @@
+"""trigram search indexes
+
+Revision ID: c6f2a9d4e8b3
+Revises: b3e8d1a7c5f2
+Create Date: 2026-10-16 18:40:52.337190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6f2a9d4e8b3'
+down_revision: Union[str, None] = 'b3e8d1a7c5f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRIGRAM_INDEXES = (
+    ('articles', 'title'),
+    ('tasks', 'title'),
+    ('users', 'username'),
+    ('users', 'full_name'),
+    ('users', 'email'),
+)
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table, column in TRIGRAM_INDEXES:
+        op.create_index(
+            f'ix_{table}_{column}_trgm', table, [column], unique=False,
+            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'},
+        )
+
+
+def downgrade() -> None:
+    for table, column in TRIGRAM_INDEXES:
+        op.drop_index(f'ix_{table}_{column}_trgm', table_name=table)
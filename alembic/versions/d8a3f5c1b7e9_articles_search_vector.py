@@ -0,0 +1,43 @@
+"""articles search_vector
+
+Revision ID: d8a3f5c1b7e9
+Revises: c6f2a9d4e8b3
+Create Date: 2026-10-16 19:27:05.418263
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8a3f5c1b7e9'
+down_revision: Union[str, None] = 'c6f2a9d4e8b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('articles', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed(
+            "setweight(to_tsvector('russian'::regconfig, title), 'A') || "
+            "setweight(to_tsvector('english'::regconfig, title), 'A') || "
+            "setweight(to_tsvector('russian'::regconfig, content), 'B') || "
+            "setweight(to_tsvector('english'::regconfig, content), 'B')",
+            persisted=True,
+        ),
+        nullable=True,
+    ))
+    op.create_index(
+        'ix_articles_search_vector', 'articles', ['search_vector'], unique=False,
+        postgresql_using='gin', postgresql_where=sa.text('is_deleted = false'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_articles_search_vector', table_name='articles', postgresql_using='gin')
+    op.drop_column('articles', 'search_vector')
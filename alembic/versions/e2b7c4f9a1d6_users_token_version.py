@@ -0,0 +1,26 @@
+"""users token_version
+
+Revision ID: e2b7c4f9a1d6
+Revises: d8a3f5c1b7e9
+Create Date: 2026-10-17 10:05:31.772940
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b7c4f9a1d6'
+down_revision: Union[str, None] = 'd8a3f5c1b7e9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'token_version')
@@ -0,0 +1,34 @@
+"""chat_members unique (chat_id, user_id)
+
+Revision ID: f4c9e1a3b8d2
+Revises: e2b7c4f9a1d6
+Create Date: 2026-10-17 11:20:14.605817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4c9e1a3b8d2'
+down_revision: Union[str, None] = 'e2b7c4f9a1d6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Дубликаты, успевшие появиться без ограничения: оставляем самую раннюю запись
+    op.execute(
+        """
+        DELETE FROM chat_members a
+        USING chat_members b
+        WHERE a.chat_id = b.chat_id AND a.user_id = b.user_id AND a.id > b.id
+        """
+    )
+    op.create_unique_constraint('uq_chat_members_chat_id_user_id', 'chat_members', ['chat_id', 'user_id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_chat_members_chat_id_user_id', 'chat_members', type_='unique')
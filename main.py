@@ -5,11 +5,19 @@ from src.chat.routes import router as chat_router
 from src.article.routes import router as article_router
 from src.task.routes import router as task_router
 from src.admin.routes import router as admin_router
+from src.media.routes import router as media_router, uploads_router
 from src.db.database import engine, startup as db_startup
 from src.db.models import Role, User
 from sqlalchemy.future import select
-from src.auth.routes import hash_password
+from src.auth.passwords import hash_password, shutdown_executor
 from src.core.config import settings
+from src.chat.websocket import broker as chat_broker
+from src.chat.ingest import message_writer
+from src.chat.unread import last_read_persister
+from src.chat.partitions import partition_maintainer
+from src.media.uploads import UploadLimitMiddleware
+from src.media.blobs import blob_collector
+from src.media.derivatives import shutdown_executor as shutdown_media_executor
 import logging
 import asyncio
 
@@ -20,6 +28,7 @@ logging.basicConfig(
 )
 
 app = FastAPI(title=settings.PROJECT_NAME, version=settings.PROJECT_VERSION)
+app.add_middleware(UploadLimitMiddleware, max_body_size=settings.UPLOAD_MAX_REQUEST_SIZE)
 
 app.include_router(auth_router)
 app.include_router(user_router)
@@ -27,6 +36,8 @@ app.include_router(chat_router)
 app.include_router(article_router)
 app.include_router(task_router)
 app.include_router(admin_router)
+app.include_router(media_router)
+app.include_router(uploads_router)
 
 async def wait_for_db(max_attempts=10, delay=2):
     attempt = 1
@@ -66,7 +77,7 @@ async def startup():
             result = await conn.execute(select(User).where(User.email == "admin@example.com"))
             admin_user = result.scalar_one_or_none()
             if not admin_user:
-                hashed_password = hash_password("string111")
+                hashed_password = await hash_password("string111")
                 await conn.execute(
                     User.__table__.insert().values({
                         "username": "admin",
@@ -81,6 +92,11 @@ async def startup():
                 logger.info("Стандартный администратор уже существует")
 
         await db_startup()
+        await chat_broker.start()
+        message_writer.start()
+        last_read_persister.start()
+        partition_maintainer.start()
+        blob_collector.start()
         logger.info("Приложение успешно запущено")
     except Exception as e:
         logger.error(f"Ошибка при запуске приложения: {e}")
@@ -90,8 +106,18 @@ async def startup():
 async def shutdown():
     logger.info("Завершение работы приложения начато")
     try:
+        await chat_broker.stop()
+        logger.info("Брокер сообщений чата остановлен")
+        await message_writer.stop()
+        await last_read_persister.stop()
+        await partition_maintainer.stop()
+        await blob_collector.stop()
         await engine.dispose()
         logger.info("Соединение с базой данных закрыто")
+        shutdown_executor()
+        logger.info("Пул хэширования паролей остановлен")
+        shutdown_media_executor()
+        logger.info("Пул обработки изображений остановлен")
     except Exception as e:
         logger.error(f"Ошибка при завершении работы приложения: {e}")
         raise
@@ -100,4 +126,7 @@ async def shutdown():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
\ No newline at end of file
+    uvicorn.run(
+        app, host="0.0.0.0", port=8000, log_level="info", ws_per_message_deflate=True,
+        ws_ping_interval=settings.WS_PING_INTERVAL, ws_ping_timeout=settings.WS_PING_TIMEOUT,
+    )
\ No newline at end of file
@@ -0,0 +1,83 @@
+import argparse
+import asyncio
+import hashlib
+import statistics
+import time
+from typing import List, Tuple
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql import text
+from src.db.database import engine
+
+# Замер поиска по подстроке (ILIKE) и по похожести (оператор % pg_trgm) на
+# временной таблице до и после создания GIN-индекса gin_trgm_ops — того же,
+# что ставит миграция c6f2a9d4e8b3 на users/articles/tasks.
+# Таблица временная и живёт только в соединении скрипта, рабочие данные не трогаются.
+# Запуск: python -m scripts.bench_trigram [--rows N] [--runs N]
+
+QUERIES: Tuple[Tuple[str, str], ...] = (
+    ("ILIKE", "SELECT id FROM bench_trgm WHERE username ILIKE :pattern LIMIT 10"),
+    ("%", "SELECT id FROM bench_trgm WHERE username % :term ORDER BY similarity(username, :term) DESC LIMIT 10"),
+)
+
+async def seed(conn: AsyncConnection, rows: int) -> None:
+    await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    await conn.execute(text("DROP TABLE IF EXISTS bench_trgm"))
+    await conn.execute(text("CREATE TEMP TABLE bench_trgm (id INTEGER PRIMARY KEY, username VARCHAR(50))"))
+    started = time.perf_counter()
+    await conn.execute(text(
+        "INSERT INTO bench_trgm "
+        "SELECT i, 'user_' || substr(md5(i::text), 1, 12) FROM generate_series(1, :rows) AS i"
+    ), {"rows": rows})
+    await conn.execute(text("ANALYZE bench_trgm"))
+    print(f"Вставлено {rows} строк за {time.perf_counter() - started:.1f} с")
+
+async def explain(conn: AsyncConnection, query: str, params: dict) -> List[str]:
+    result = await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {query}"), params)
+    return [row[0] for row in result]
+
+async def timings(conn: AsyncConnection, query: str, params: dict, runs: int) -> List[float]:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await conn.execute(text(query), params)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+async def measure(conn: AsyncConnection, label: str, params: dict, runs: int) -> None:
+    print(f"\n=== {label} ===")
+    for name, query in QUERIES:
+        plan = await explain(conn, query, params)
+        samples = await timings(conn, query, params, runs)
+        print(f"\n--- {name}: медиана {statistics.median(samples):.2f} мс, максимум {max(samples):.2f} мс ({runs} запусков)")
+        print("\n".join(plan))
+
+async def run(rows: int, runs: int, term: str) -> None:
+    params = {"pattern": f"%{term[5:10]}%", "term": term}
+    try:
+        async with engine.connect() as conn:
+            await seed(conn, rows)
+            await measure(conn, "без индекса", params, runs)
+            started = time.perf_counter()
+            await conn.execute(text(
+                "CREATE INDEX ix_bench_trgm_username_trgm ON bench_trgm USING gin (username gin_trgm_ops)"
+            ))
+            await conn.execute(text("ANALYZE bench_trgm"))
+            print(f"\nИндекс построен за {time.perf_counter() - started:.1f} с")
+            await measure(conn, "с индексом gin_trgm_ops", params, runs)
+            await conn.rollback()
+    finally:
+        await engine.dispose()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Замер ILIKE и % pg_trgm с индексом и без")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Сколько строк сгенерировать")
+    parser.add_argument("--runs", type=int, default=20, help="Сколько раз выполнить каждый запрос")
+    parser.add_argument(
+        "--term", default="user_" + hashlib.md5(b"500000").hexdigest()[:12],
+        help="Строка для %%; для ILIKE берутся её символы с 6-го по 10-й",
+    )
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.runs, args.term))
+
+if __name__ == "__main__":
+    main()
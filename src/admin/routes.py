@@ -1,11 +1,16 @@
 from fastapi import APIRouter, Depends, Form, HTTPException, Query
-from sqlalchemy import func
+from sqlalchemy import func, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from src.auth.auth import get_current_user
-from src.auth.routes import hash_password
+from src.auth.auth import get_current_principal, revoke_user_tokens
+from src.auth.schemas import Principal
+from src.auth.cache import principal_cache
+from src.auth.passwords import hash_password
 from src.db.models import User
-from src.db.database import get_db
+from src.db.database import engine, get_db
+from src.core import metrics
+from src.core.config import settings
+from src.core.search import matches, similarity
 from src.user.schemas import UserProfile
 from typing import Optional
 
@@ -14,9 +19,11 @@ router = APIRouter(prefix="/admin", tags=["admin"])
 @router.get("/users", response_model=list[UserProfile])
 async def get_users(
     role: Optional[int] = None,
+    q: Optional[str] = Query(None, min_length=settings.SEARCH_MIN_LENGTH),
+    ranked: bool = False,
     limit: int = 10,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     if current_user.role_id != 2:
         raise HTTPException(status_code=403, detail="Не авторизовано")
@@ -24,6 +31,12 @@ async def get_users(
     query = select(User).where(User.is_deleted == False)
     if role:
         query = query.where(User.role_id == role)
+    if q:
+        # Каждая колонка проверяется своим триграммным индексом, результаты объединяются
+        columns = (User.username, User.full_name, User.email)
+        query = query.where(or_(*(matches(column, q, fuzzy=ranked) for column in columns)))
+        if ranked:
+            query = query.order_by(similarity([(column, q) for column in columns]).desc())
     
     query = query.limit(limit)
     result = await db.execute(query)
@@ -35,7 +48,7 @@ async def update_user_password(
     user_id: int,
     new_password: str = Query(...),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     if current_user.role_id != 2:
         raise HTTPException(status_code=403, detail="Не авторизовано")
@@ -45,8 +58,10 @@ async def update_user_password(
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
-    user.hashed_password = hash_password(new_password)
+    user.hashed_password = await hash_password(new_password)
+    await revoke_user_tokens(db, user.user_id)
     await db.commit()
+    await principal_cache.invalidate(user.email)
     return {"message": "Пароль обновлен"}
 
 @router.put("/users/{user_id}", response_model=UserProfile)
@@ -58,7 +73,7 @@ async def update_user(
     avatar: Optional[str] = Form(None),
     role_id: Optional[int] = Form(None),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     # Проверка прав доступа (только админ)
     if current_user.role_id != 2:
@@ -78,6 +93,8 @@ async def update_user(
     if user.role_id == 2 and user.user_id != current_user.user_id:
         raise HTTPException(status_code=403, detail="Нельзя редактировать других администраторов")
     
+    old_email = user.email
+
     # Обновляем поля, если они переданы
     if username is not None:
         # Проверяем уникальность username
@@ -110,15 +127,18 @@ async def update_user(
             raise HTTPException(status_code=403, detail="Нельзя назначать роль администратора через этот эндпоинт")
         user.role_id = role_id
     
+    if email is not None or role_id is not None:
+        await revoke_user_tokens(db, user.user_id)
     await db.commit()
     await db.refresh(user)
+    await principal_cache.invalidate(old_email, user.email)
     return user
 
 @router.delete("/users/{user_id}", response_model=dict)
 async def delete_user(
     user_id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     if current_user.role_id != 2:
         raise HTTPException(status_code=403, detail="Не авторизовано")
@@ -130,5 +150,29 @@ async def delete_user(
     
     user.is_deleted = True
     user.deleted_at = func.now()
+    await revoke_user_tokens(db, user.user_id)
     await db.commit()
-    return {"message": "Пользователь помечен как удаленный"}
\ No newline at end of file
+    await principal_cache.invalidate(user.email)
+    return {"message": "Пользователь помечен как удаленный"}
+
+@router.get("/metrics", response_model=dict)
+async def get_metrics(current_user: Principal = Depends(get_current_principal)):
+    if current_user.role_id != 2:
+        raise HTTPException(status_code=403, detail="Не авторизовано")
+
+    snapshot = metrics.snapshot()
+    snapshot["gauges"]["db.pool.checked_out"] = engine.pool.checkedout()
+    snapshot["ratios"] = {
+        "auth.principal_cache.hit_ratio": metrics.ratio(
+            ("auth.principal_cache.local_hits", "auth.principal_cache.redis_hits"),
+            "auth.principal_cache.misses",
+        ),
+        "chat.history_cache.hit_ratio": metrics.ratio(
+            ("chat.history_cache.hits",), "chat.history_cache.misses"
+        ),
+        "chat.membership_cache.hit_ratio": metrics.ratio(
+            ("chat.membership_cache.local_hits", "chat.membership_cache.redis_hits"),
+            "chat.membership_cache.misses",
+        ),
+    }
+    return snapshot
\ No newline at end of file
@@ -1,30 +1,40 @@
 import os
+from collections import Counter
 from typing import List, Optional
-import aiofiles
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
-from src.auth.auth import get_current_user
+from src.auth.auth import get_current_principal
+from src.auth.schemas import Principal
 from src.db.models import User, Article, ArticleHistory, ArticleImage
 from src.db.database import get_db
 from src.core.config import settings
-from src.article.schemas import ArticleResponse, ArticleHistoryResponse
+from src.core.pagination import decode_cursor, encode_cursor
+from src.core.search import matches, similarity
+from src.article.schemas import ArticleResponse, ArticleHistoryResponse, ArticleSearchHit, ArticleSearchResponse
+from src.article.search import search_articles
+from src.media.blobs import acquire_blob, release_blobs
+from src.media.derivatives import schedule_derivatives
+from src.media.uploads import FILE_SCHEMA, multipart_body, stage_uploads
 from datetime import datetime
 
 router = APIRouter(prefix="/articles", tags=["articles"])
 
 @router.get("/", response_model=List[ArticleResponse])
 async def get_articles(
-    title: Optional[str] = None,
+    title: Optional[str] = Query(None, min_length=settings.SEARCH_MIN_LENGTH),
     author_id: Optional[int] = None,
+    ranked: bool = False,
     limit: int = 10,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     query = select(Article).where(Article.is_deleted == False)
     if title:
-        query = query.where(Article.title.ilike(f"%{title}%"))
+        query = query.where(matches(Article.title, title, fuzzy=ranked))
+        if ranked:
+            query = query.order_by(similarity([(Article.title, title)]).desc())
     if author_id:
         query = query.where(Article.author_id == author_id)
     query = query.limit(limit)
@@ -32,43 +42,70 @@ async def get_articles(
     articles = result.scalars().all()
     return articles
 
-@router.post("/", response_model=ArticleResponse)
-async def create_article(
-    title: str = Form(...),
-    content: str = Form(...),
-    images: List[UploadFile] = File([]),
+@router.get("/search", response_model=ArticleSearchResponse)
+async def full_text_search(
+    q: str = Query(..., min_length=2, max_length=200),
+    cursor: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    # Create article
-    article = Article(title=title, content=content, author_id=current_user.user_id)
-    db.add(article)
-    await db.commit()
-    await db.refresh(article)
-
-    # Save images
-    for image in images:
-        file_path = f"{settings.UPLOAD_DIR}/article_{article.id}_{image.filename}"
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)  # Ensure directory exists
-        
-        async with aiofiles.open(file_path, 'wb') as out_file:
-            content = await image.read()
-            await out_file.write(content)
+    after = None
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != 2 or not isinstance(values[0], (int, float)) or not isinstance(values[1], int):
+            raise HTTPException(status_code=400, detail="Некорректный курсор")
+        after = (float(values[0]), values[1])
+    rows = await search_articles(db, q, limit, after=after)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return ArticleSearchResponse(
+        articles=[ArticleSearchHit.model_validate(row) for row in rows],
+        next_cursor=encode_cursor(rows[-1].rank, rows[-1].id) if has_more else None,
+        limit=limit,
+    )
 
-        db.add(ArticleImage(article_id=article.id, image_path=file_path))
+ARTICLE_FORM = {
+    "title": {"type": "string"},
+    "content": {"type": "string"},
+    "images": {"type": "array", "items": FILE_SCHEMA},
+}
 
-    await db.commit()
-    await db.refresh(article)
+@router.post("/", response_model=ArticleResponse, openapi_extra=multipart_body(ARTICLE_FORM, ("title", "content")))
+async def create_article(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    # Images are streamed to temp files first, so an oversized upload fails before the article exists
+    async with stage_uploads(request) as form:
+        title, content = form.value("title"), form.value("content")
+        if title is None or content is None:
+            raise HTTPException(status_code=422, detail="title and content are required")
+        staged = form.uploads("images")
+
+        # Create article
+        article = Article(title=title, content=content, author_id=current_user.user_id)
+        db.add(article)
+        await db.commit()
+        await db.refresh(article)
+
+        # Save images
+        for image in staged:
+            file_path = await acquire_blob(db, image)
+            db.add(ArticleImage(article_id=article.id, image_path=file_path, blob_sha256=image.sha256))
+
+        await db.commit()
+        await db.refresh(article)
+    schedule_derivatives(image.sha256 for image in staged)
     return article
 
-@router.put("/{article_id}", response_model=ArticleResponse)
+@router.put("/{article_id}", response_model=ArticleResponse, openapi_extra=multipart_body(ARTICLE_FORM))
 async def update_article(
     article_id: int,
-    title: Optional[str] = Form(None),
-    content: Optional[str] = Form(None),
-    images: List[UploadFile] = File([]),
+    request: Request,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     result = await db.execute(
         select(Article)
@@ -83,55 +120,65 @@ async def update_article(
     if article.author_id != current_user.user_id and current_user.role_id != 2:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    # Create history entry before updating
-    history_entry = ArticleHistory(
-        article_id=article.id,
-        user_id=current_user.user_id,
-        event="update",
-        changed_title=article.title,
-        changed_content=article.content,
-    )
-    db.add(history_entry)
-
-    # Update article fields
-    if title is not None:
-        article.title = title
-    if content is not None:
-        article.content = content
-    article.updated_at = datetime.utcnow()
-
-    # Remove existing images
-    if article.images:
+    # New images are streamed to temp files before the old ones are removed
+    async with stage_uploads(request) as form:
+        title, content = form.value("title"), form.value("content")
+        staged = form.uploads("images")
+
+        # Create history entry before updating
+        history_entry = ArticleHistory(
+            article_id=article.id,
+            user_id=current_user.user_id,
+            event="update",
+            changed_title=article.title,
+            changed_content=article.content,
+        )
+        db.add(history_entry)
+
+        # Update article fields
+        if title is not None:
+            article.title = title
+        if content is not None:
+            article.content = content
+        article.updated_at = datetime.utcnow()
+
+        # Images whose content was uploaded again are kept as is
+        needed = Counter(image.sha256 for image in staged)
+        released = []
         for image in article.images:
-            # Delete physical file
-            try:
-                if os.path.exists(image.image_path):
-                    os.remove(image.image_path)
-            except Exception as e:
-                print(f"Error deleting image file: {e}")
+            if image.blob_sha256 is not None and needed[image.blob_sha256] > 0:
+                needed[image.blob_sha256] -= 1
+                continue
+            if image.blob_sha256 is not None:
+                released.append(image.blob_sha256)
+            else:
+                # Delete physical file of an image stored before the blob store
+                try:
+                    if os.path.exists(image.image_path):
+                        os.remove(image.image_path)
+                except Exception as e:
+                    print(f"Error deleting image file: {e}")
             # Remove database record
             await db.delete(image)
-
-    # Add new images
-    for image in images:
-        file_path = f"{settings.UPLOAD_DIR}/article_{article.id}_{image.filename}"
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        
-        async with aiofiles.open(file_path, 'wb') as out_file:
-            content = await image.read()
-            await out_file.write(content)
-        
-        db.add(ArticleImage(article_id=article.id, image_path=file_path))
-
-    await db.commit()
-    await db.refresh(article)
+        await release_blobs(db, released)
+
+        # Add references to new content only
+        for image in staged:
+            if needed[image.sha256] > 0:
+                needed[image.sha256] -= 1
+                file_path = await acquire_blob(db, image)
+                db.add(ArticleImage(article_id=article.id, image_path=file_path, blob_sha256=image.sha256))
+
+        await db.commit()
+        await db.refresh(article)
+    schedule_derivatives(image.sha256 for image in staged)
     return article
-    
+
 @router.delete("/{id}", response_model=dict)
 async def delete_article(
     id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     result = await db.execute(select(Article).where(Article.id == id, Article.is_deleted == False))
     article = result.scalar_one_or_none()
@@ -149,7 +196,7 @@ async def delete_article(
 async def restore_article(
     id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     result = await db.execute(
         select(Article).where(
@@ -173,7 +220,7 @@ async def restore_article(
 async def get_article_history(
     id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     result = await db.execute(
         select(Article)
@@ -1,6 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, computed_field
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
+from src.media.derivatives import variant_urls
+from src.media.uploads import upload_url
 
 class ArticleCreate(BaseModel):
     title: str
@@ -14,6 +16,17 @@ class ArticleUpdate(BaseModel):
 class ArticleImage(BaseModel):
     id: int
     image_path: str
+    blob_sha256: Optional[str] = None
+
+    @computed_field
+    @property
+    def url(self) -> Optional[str]:
+        return upload_url(self.image_path)
+
+    @computed_field
+    @property
+    def variants(self) -> Optional[Dict[str, str]]:
+        return variant_urls(self.blob_sha256)
 
     class Config:
         from_attributes = True 
@@ -31,6 +44,23 @@ class ArticleResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class ArticleSearchHit(BaseModel):
+    id: int
+    title: str
+    author_id: int
+    created_at: datetime
+    rank: float
+    title_highlight: str
+    snippet: str
+
+    class Config:
+        from_attributes = True
+
+class ArticleSearchResponse(BaseModel):
+    articles: List[ArticleSearchHit]
+    next_cursor: Optional[str] = None
+    limit: int
+
 class ArticleHistoryResponse(BaseModel):
     id: int
     article_id: int
@@ -0,0 +1,50 @@
+from typing import List, Optional, Tuple
+from sqlalchemy import cast, func, tuple_
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from src.core.search import search_query
+from src.db.models import Article
+
+# Фрагменты с подсветкой строит ts_headline; он перечитывает и разбирает
+# весь текст статьи, поэтому вызывается только для строк текущей страницы.
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, MaxFragments=2"
+TITLE_HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, HighlightAll=true"
+
+async def search_articles(
+    db: AsyncSession,
+    q: str,
+    limit: int,
+    after: Optional[Tuple[float, int]] = None,
+) -> List[tuple]:
+    """Статьи по убыванию (rank, id), на одну больше limit.
+
+    Каждая строка — (id, title, author_id, created_at, rank, title_highlight, snippet).
+    Условие is_deleted = false совпадает с предикатом частичного индекса
+    ix_articles_search_vector, так что удалённые статьи отсекает сам индекс.
+    """
+    tsquery = search_query(q)
+    rank = func.ts_rank(Article.search_vector, tsquery).label("rank")
+    page = (
+        select(Article.id, Article.title, Article.content, Article.author_id, Article.created_at, rank)
+        .where(Article.is_deleted == False, Article.search_vector.op("@@")(tsquery))
+    )
+    if after is not None:
+        page = page.where(tuple_(rank, Article.id) < tuple_(*after))
+    page = page.order_by(rank.desc(), Article.id.desc()).limit(limit + 1).subquery()
+
+    config = cast("russian", REGCONFIG)
+    query = (
+        select(
+            page.c.id,
+            page.c.title,
+            page.c.author_id,
+            page.c.created_at,
+            page.c.rank,
+            func.ts_headline(config, page.c.title, tsquery, TITLE_HEADLINE_OPTIONS).label("title_highlight"),
+            func.ts_headline(config, page.c.content, tsquery, HEADLINE_OPTIONS).label("snippet"),
+        )
+        .order_by(page.c.rank.desc(), page.c.id.desc())
+    )
+    result = await db.execute(query)
+    return list(result.all())
@@ -4,9 +4,32 @@ from src.core.config import settings
 from fastapi import HTTPException, Depends, Request
 from fastapi.responses import Response
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import update
 from sqlalchemy.future import select
 from src.db.models import User
-from src.db.database import get_db
+from src.db.database import get_db, get_redis
+from src.auth.cache import principal_cache, user_from_cache, user_to_cache
+from src.auth.schemas import Principal
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Текущие версии токенов пользователей: user_id -> версия.
+# Токены с версией ниже текущей считаются отозванными. Источник истины —
+# users.token_version, а хэш в Redis — его кэш, который заполняется заново
+# после перезапуска или очистки Redis.
+TOKEN_VERSIONS_KEY = "auth:token_versions"
+
+# Версия в Redis только растёт: отставшая запись (заполнение кэша из БД или
+# параллельный отзыв) не откатывает её назад
+_STORE_VERSION = """
+local current = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '-1')
+if tonumber(ARGV[2]) > current then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+end
+return 1
+"""
 
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
@@ -15,15 +38,71 @@ def create_access_token(data: dict) -> str:
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str) -> str:
+def decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=401, detail="Недействительный токен")
-        return email
     except JWTError:
         raise HTTPException(status_code=401, detail="Недействительный токен")
+    if payload.get("sub") is None:
+        raise HTTPException(status_code=401, detail="Недействительный токен")
+    return payload
+
+def verify_token(token: str) -> str:
+    return decode_token(token)["sub"]
+
+async def _store_token_version(user_id: int, version: int) -> None:
+    redis_client = await get_redis()
+    if not redis_client:
+        return
+    try:
+        await redis_client.eval(_STORE_VERSION, 1, TOKEN_VERSIONS_KEY, str(user_id), version)
+    except Exception as e:
+        logger.error(f"Ошибка при записи версии токена в Redis: {e}")
+
+async def get_token_version(user_id: int, db: AsyncSession) -> int:
+    """Текущая версия токенов пользователя: из Redis, а при промахе или недоступности — из БД."""
+    redis_client = await get_redis()
+    if redis_client:
+        try:
+            version = await redis_client.hget(TOKEN_VERSIONS_KEY, str(user_id))
+            if version is not None:
+                return int(version)
+        except Exception as e:
+            logger.error(f"Ошибка при чтении версии токена из Redis: {e}")
+            redis_client = None
+    result = await db.execute(select(User.token_version).where(User.user_id == user_id))
+    version = result.scalar_one_or_none() or 0
+    if redis_client:
+        await _store_token_version(user_id, version)
+    return version
+
+async def revoke_user_tokens(db: AsyncSession, user_id: int) -> None:
+    """Повышает версию токенов в текущей транзакции; вызывается до commit."""
+    result = await db.execute(
+        update(User)
+        .where(User.user_id == user_id)
+        .values(token_version=User.token_version + 1)
+        .returning(User.token_version)
+    )
+    version = result.scalar_one_or_none()
+    if version is not None:
+        await _store_token_version(user_id, version)
+
+async def create_user_token(user: User, db: AsyncSession) -> str:
+    data = {"sub": user.email}
+    if settings.AUTH_STATELESS_TOKENS:
+        version = await get_token_version(user.user_id, db)
+        data.update({"uid": user.user_id, "role": user.role_id, "ver": version})
+    return create_access_token(data)
+
+async def _check_token_version(payload: dict, db: AsyncSession) -> bool:
+    """True — версия актуальна, False — токен старого формата без версии."""
+    if "uid" not in payload:
+        return False
+    current = await get_token_version(payload["uid"], db)
+    if payload.get("ver", 0) < current:
+        raise HTTPException(status_code=401, detail="Токен отозван")
+    return True
 
 def set_auth_cookie(response: Response, token: str) -> None:
     response.set_cookie(
@@ -34,13 +113,52 @@ def set_auth_cookie(response: Response, token: str) -> None:
         expires=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
     )
 
-async def get_current_user(request: Request, db: AsyncSession = Depends(get_db)) -> User:
+def _get_token(request: Request) -> str:
     token = request.cookies.get("access_token")
     if not token:
         raise HTTPException(status_code=401, detail="Не аутентифицирован")
-    email = verify_token(token)
+    return token
+
+async def _load_user(email: str, db: AsyncSession) -> User:
+    cached = await principal_cache.get(email)
+    if cached is not None:
+        # Присоединяем восстановленный объект к сессии запроса без SELECT,
+        # чтобы обработчики могли изменять и коммитить current_user
+        user = user_from_cache(cached)
+        db.add(user)
+        return user
+
     result = await db.execute(select(User).where(User.email == email))
     user = result.scalar_one_or_none()
     if not user:
         raise HTTPException(status_code=401, detail="Пользователь не найден")
-    return user
\ No newline at end of file
+    await principal_cache.set(email, user_to_cache(user))
+    return user
+
+async def authenticate_token(token: Optional[str], db: AsyncSession) -> User:
+    """Проверка токена вне HTTP-зависимостей, например для WebSocket."""
+    if not token:
+        raise HTTPException(status_code=401, detail="Не аутентифицирован")
+    payload = decode_token(token)
+    await _check_token_version(payload, db)
+    return await _load_user(payload["sub"], db)
+
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_db)) -> User:
+    return await authenticate_token(request.cookies.get("access_token"), db)
+
+async def get_current_principal(request: Request, db: AsyncSession = Depends(get_db)) -> Principal:
+    """Облегчённая зависимость: для токенов с uid/role не обращается к БД.
+
+    Без Redis версия токена читается из users.token_version. Старые токены
+    (только email в sub) обслуживаются через обычную загрузку пользователя.
+    """
+    payload = decode_token(_get_token(request))
+    if await _check_token_version(payload, db):
+        return Principal(
+            user_id=payload["uid"],
+            email=payload["sub"],
+            role_id=payload["role"],
+            token_version=payload.get("ver", 0),
+        )
+    user = await _load_user(payload["sub"], db)
+    return Principal(user_id=user.user_id, email=user.email, role_id=user.role_id)
@@ -0,0 +1,129 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.orm import make_transient_to_detached
+from src.core import metrics
+from src.core.config import settings
+from src.db.database import get_redis
+from src.db.models import User
+
+logger = logging.getLogger(__name__)
+
+# Поля пользователя, которые кладём в кэш. Хэш пароля в кэш не попадает.
+_CACHED_FIELDS = (
+    "user_id", "username", "full_name", "email", "avatar",
+    "role_id", "registered_at", "is_deleted", "deleted_at", "token_version",
+)
+_DATETIME_FIELDS = ("registered_at", "deleted_at")
+
+def _redis_key(email: str) -> str:
+    return f"auth:principal:{email}"
+
+def user_to_cache(user: User) -> dict:
+    data = {field: getattr(user, field) for field in _CACHED_FIELDS}
+    for field in _DATETIME_FIELDS:
+        if isinstance(data[field], datetime):
+            data[field] = data[field].isoformat()
+    return data
+
+def user_from_cache(data: dict) -> User:
+    """Восстанавливает User из кэша как detached-объект без обращения к БД.
+
+    hashed_password в кэше нет и остаётся незагруженным: колонка объявлена с
+    deferred_raiseload, поэтому обращение к нему сразу поднимает
+    InvalidRequestError, а не пытается лениво догрузить значение в async-сессии
+    (MissingGreenlet). Код, которому нужен хэш, загружает пользователя сам.
+    """
+    values = dict(data)
+    for field in _DATETIME_FIELDS:
+        if values.get(field):
+            values[field] = datetime.fromisoformat(values[field])
+    user = User(**values)
+    make_transient_to_detached(user)
+    return user
+
+class PrincipalCache:
+    """Двухуровневый кэш пользователей: локальный LRU с TTL и общий Redis.
+
+    Локальный уровень не инвалидируется в других воркерах, поэтому его TTL
+    держим коротким — он ограничивает время жизни устаревших данных.
+    invalidate() удаляет запись из Redis и из LRU текущего воркера, а
+    остальные воркеры продолжают отдавать старую копию до истечения
+    PRINCIPAL_CACHE_TTL (по умолчанию 5 секунд).
+    """
+
+    def __init__(self, maxsize: int, ttl: float, redis_ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.redis_ttl = redis_ttl
+        self._local: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+
+    def _get_local(self, email: str) -> Optional[dict]:
+        entry = self._local.get(email)
+        if entry is None:
+            return None
+        expires_at, data = entry
+        if expires_at < time.monotonic():
+            del self._local[email]
+            return None
+        self._local.move_to_end(email)
+        return data
+
+    def _set_local(self, email: str, data: dict) -> None:
+        self._local[email] = (time.monotonic() + self.ttl, data)
+        self._local.move_to_end(email)
+        while len(self._local) > self.maxsize:
+            self._local.popitem(last=False)
+
+    async def get(self, email: str) -> Optional[dict]:
+        data = self._get_local(email)
+        if data is not None:
+            metrics.inc("auth.principal_cache.local_hits")
+            return data
+
+        redis_client = await get_redis()
+        if redis_client:
+            try:
+                cached = await redis_client.get(_redis_key(email))
+                if cached:
+                    data = json.loads(cached)
+                    self._set_local(email, data)
+                    metrics.inc("auth.principal_cache.redis_hits")
+                    return data
+            except Exception as e:
+                logger.error(f"Ошибка при чтении пользователя из Redis: {e}")
+
+        metrics.inc("auth.principal_cache.misses")
+        return None
+
+    async def set(self, email: str, data: dict) -> None:
+        self._set_local(email, data)
+        redis_client = await get_redis()
+        if redis_client:
+            try:
+                await redis_client.set(_redis_key(email), json.dumps(data), ex=self.redis_ttl)
+            except Exception as e:
+                logger.error(f"Ошибка при записи пользователя в Redis: {e}")
+
+    async def invalidate(self, *emails: Optional[str]) -> None:
+        emails = [email for email in emails if email]
+        for email in emails:
+            self._local.pop(email, None)
+        metrics.inc("auth.principal_cache.invalidations", len(emails))
+        if not emails:
+            return
+        redis_client = await get_redis()
+        if redis_client:
+            try:
+                await redis_client.delete(*[_redis_key(email) for email in emails])
+            except Exception as e:
+                logger.error(f"Ошибка при инвалидации пользователя в Redis: {e}")
+
+principal_cache = PrincipalCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL,
+    redis_ttl=settings.PRINCIPAL_CACHE_REDIS_TTL,
+)
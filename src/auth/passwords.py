@@ -0,0 +1,66 @@
+import asyncio
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+from fastapi import HTTPException
+from src.core import metrics
+from src.core.config import settings
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+# Хэширование bcrypt занимает сотни миллисекунд CPU, поэтому выполняем его
+# в отдельном пуле, а не в цикле событий. Очередь ограничена: при переполнении
+# отвечаем 503, чтобы не копить запросы бесконечно.
+
+_executor: Optional[Executor] = None
+_slots = asyncio.Semaphore(settings.PASSWORD_HASH_MAX_PENDING)
+
+def _hash_sync(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+def _verify_sync(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+def get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if settings.PASSWORD_HASH_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+            )
+        logger.info(
+            f"Пул хэширования паролей запущен: {settings.PASSWORD_HASH_EXECUTOR}, "
+            f"воркеров: {settings.PASSWORD_HASH_WORKERS}"
+        )
+    return _executor
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+async def _run(func, *args):
+    if _slots.locked():
+        metrics.inc("auth.password_pool.rejected")
+        raise HTTPException(status_code=503, detail="Сервер перегружен, повторите попытку позже")
+    async with _slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), func, *args)
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash_sync, password, settings.BCRYPT_ROUNDS)
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run(_verify_sync, plain_password, hashed_password)
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Проверяет, отличается ли cost-фактор хэша ($2b$<rounds>$...) от текущего."""
+    try:
+        rounds = int(hashed_password.split("$")[2])
+    except (IndexError, ValueError):
+        return True
+    return rounds != settings.BCRYPT_ROUNDS
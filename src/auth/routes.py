@@ -2,23 +2,18 @@ import logging
 from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy.orm import undefer
 from src.db.database import get_db
 from src.auth.schemas import UserCreate, UserLogin
 from src.user.schemas import UserProfile
 from src.db.models import User
-from src.auth.auth import create_access_token, set_auth_cookie, get_current_user
-import bcrypt
+from src.auth.auth import create_user_token, set_auth_cookie, get_current_user
+from src.auth.passwords import hash_password, verify_password, needs_rehash
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
-
 @router.post("/register", response_model=UserProfile)
 async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     result = await db.execute(
@@ -27,7 +22,7 @@ async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     if result.scalar_one_or_none():
         raise HTTPException(status_code=400, detail="Email or username already registered")
     
-    hashed_password = hash_password(user.password)
+    hashed_password = await hash_password(user.password)
     
     new_user = User(
         username=user.username,
@@ -40,7 +35,7 @@ async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     await db.commit()
     await db.refresh(new_user)
     
-    token = create_access_token(data={"sub": user.email})
+    token = await create_user_token(new_user, db)
     response = Response(status_code=201)
     set_auth_cookie(response, token)
     return new_user
@@ -48,16 +43,26 @@ async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
 @router.post("/login")
 async def login(user: UserLogin, db: AsyncSession = Depends(get_db)):
     try:
-        result = await db.execute(select(User).where(User.email == user.email))
+        result = await db.execute(
+            select(User).where(User.email == user.email).options(undefer(User.hashed_password))
+        )
         db_user = result.scalar_one_or_none()
-        if not db_user or not verify_password(user.password, db_user.hashed_password):
+        if not db_user or not await verify_password(user.password, db_user.hashed_password):
             raise HTTPException(status_code=401, detail="Неверные учетные данные")
+
+        # Пароль известен только сейчас, поэтому перехэшируем при смене cost-фактора
+        if needs_rehash(db_user.hashed_password):
+            db_user.hashed_password = await hash_password(user.password)
+            await db.commit()
+            logger.info(f"Хэш пароля пользователя {user.email} обновлен")
         
-        token = create_access_token(data={"sub": user.email})
+        token = await create_user_token(db_user, db)
         response = Response(status_code=200)
         set_auth_cookie(response, token)
         logger.info(f"Пользователь {user.email} успешно вошел в систему")
         return response
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Ошибка при входе пользователя: {e}")
         raise HTTPException(status_code=500, detail="Ошибка сервера при входе")
@@ -29,4 +29,10 @@ class UserCreate(BaseModel):
 
 class UserLogin(BaseModel):
     email: EmailStr = "user@example.com"
-    password: str = "string111"
\ No newline at end of file
+    password: str = "string111"
+
+class Principal(BaseModel):
+    user_id: int
+    email: str
+    role_id: int
+    token_version: int = 0
\ No newline at end of file
@@ -0,0 +1,167 @@
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import shutil
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.sql import text
+from src.core.config import settings
+from src.chat.partitions import add_months, list_partitions, partition_month
+from src.db.database import engine
+
+logger = logging.getLogger(__name__)
+
+# Архив старых сообщений: для каждой отсоединённой секции каталог
+# CHAT_ARCHIVE_DIR/messages_yYYYYmMM с файлами chat_{id}.jsonl.gz (строки по
+# возрастанию message_id) и manifest.json вида {chat_id: [min_id, max_id]}.
+# Запуск: python -m src.chat.archive [--older-than N] [--dry-run]
+
+MANIFEST = "manifest.json"
+
+_manifests: Tuple[Optional[float], List[Tuple[str, Dict[int, Tuple[int, int]]]]] = (None, [])
+
+def chat_file(directory: str, chat_id: int) -> str:
+    return os.path.join(directory, f"chat_{chat_id}.jsonl.gz")
+
+def load_manifests() -> List[Tuple[str, Dict[int, Tuple[int, int]]]]:
+    """Манифесты всех архивов по возрастанию месяца; перечитываются при изменении каталога.
+
+    Функция блокирующая — вызывать через asyncio.to_thread.
+    """
+    global _manifests
+    try:
+        mtime = os.stat(settings.CHAT_ARCHIVE_DIR).st_mtime
+    except FileNotFoundError:
+        return []
+    if _manifests[0] == mtime:
+        return _manifests[1]
+    manifests = []
+    for name in sorted(os.listdir(settings.CHAT_ARCHIVE_DIR)):
+        path = os.path.join(settings.CHAT_ARCHIVE_DIR, name, MANIFEST)
+        if partition_month(name) is None or not os.path.exists(path):
+            continue
+        with open(path) as f:
+            chats = {int(chat_id): tuple(bounds) for chat_id, bounds in json.load(f).items()}
+        manifests.append((name, chats))
+    _manifests = (mtime, manifests)
+    return manifests
+
+def archive_bounds(chat_id: int) -> Optional[Tuple[int, int]]:
+    """Диапазон message_id чата в архиве. Читает каталог архива — вызывать через asyncio.to_thread."""
+    bounds = [chats[chat_id] for _, chats in load_manifests() if chat_id in chats]
+    if not bounds:
+        return None
+    return min(low for low, _ in bounds), max(high for _, high in bounds)
+
+def _read_chat(name: str, chat_id: int) -> List[dict]:
+    path = chat_file(os.path.join(settings.CHAT_ARCHIVE_DIR, name), chat_id)
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def read_archive(chat_id: int, before_id: Optional[int], after_id: Optional[int], limit: int) -> List[dict]:
+    """До limit архивных сообщений чата: после after_id по возрастанию или до before_id по убыванию.
+
+    Читаются только месяцы, чей диапазон из манифеста пересекается с запросом.
+    Функция блокирующая — вызывать через asyncio.to_thread.
+    """
+    rows: List[dict] = []
+    manifests = [(name, chats[chat_id]) for name, chats in load_manifests() if chat_id in chats]
+    if after_id is not None:
+        for name, (_, high) in manifests:
+            if high <= after_id:
+                continue
+            rows.extend(row for row in _read_chat(name, chat_id) if row["message_id"] > after_id)
+            if len(rows) >= limit:
+                break
+        return rows[:limit]
+    for name, (low, _) in reversed(manifests):
+        if before_id is not None and low >= before_id:
+            continue
+        rows.extend(
+            row for row in reversed(_read_chat(name, chat_id))
+            if before_id is None or row["message_id"] < before_id
+        )
+        if len(rows) >= limit:
+            break
+    return rows[:limit]
+
+async def archive_partition(conn, name: str) -> int:
+    """Выгружает секцию в архив, затем отсоединяет и удаляет её."""
+    target = os.path.join(settings.CHAT_ARCHIVE_DIR, name)
+    staging = target + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    manifest: Dict[int, List[int]] = {}
+    current_chat, output, count = None, None, 0
+    result = await conn.stream(text(
+        f"SELECT message_id, chat_id, user_id, content, created_at FROM {name} "
+        "ORDER BY chat_id, message_id"
+    ))
+    try:
+        async for message_id, chat_id, user_id, content, created_at in result:
+            if chat_id != current_chat:
+                if output:
+                    output.close()
+                current_chat = chat_id
+                output = gzip.open(chat_file(staging, chat_id), "wt", encoding="utf-8")
+                manifest[chat_id] = [message_id, message_id]
+            output.write(json.dumps({
+                "message_id": message_id, "chat_id": chat_id, "user_id": user_id,
+                "content": content, "created_at": created_at.isoformat(),
+            }, ensure_ascii=False) + "\n")
+            manifest[chat_id][1] = message_id
+            count += 1
+    finally:
+        if output:
+            output.close()
+    await conn.commit()
+
+    with open(os.path.join(staging, MANIFEST), "w") as f:
+        json.dump(manifest, f)
+    # Повторный запуск после сбоя до DROP TABLE перезаписывает прежнюю выгрузку
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+
+    async with conn.begin():
+        await conn.execute(text(f"ALTER TABLE messages DETACH PARTITION {name}"))
+        await conn.execute(text(f"DROP TABLE {name}"))
+    return count
+
+async def archive_old_partitions(older_than: int, dry_run: bool = False) -> None:
+    cutoff = add_months(date.today().replace(day=1), -older_than)
+    os.makedirs(settings.CHAT_ARCHIVE_DIR, exist_ok=True)
+    try:
+        async with engine.connect() as conn:
+            names = sorted(
+                name for name in await list_partitions(conn)
+                if partition_month(name) is not None and partition_month(name) < cutoff
+            )
+            await conn.commit()
+            if not names:
+                logger.info("Нет секций для архивации")
+            for name in names:
+                if dry_run:
+                    logger.info(f"Будет архивирована секция {name}")
+                    continue
+                count = await archive_partition(conn, name)
+                logger.info(f"Секция {name} архивирована: {count} сообщений")
+    finally:
+        await engine.dispose()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Архивация старых секций сообщений чата")
+    parser.add_argument(
+        "--older-than", type=int, default=settings.CHAT_ARCHIVE_AFTER_MONTHS,
+        help="Архивировать секции старше указанного числа месяцев",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Только показать секции для архивации")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    asyncio.run(archive_old_partitions(args.older_than, args.dry_run))
+
+if __name__ == "__main__":
+    main()
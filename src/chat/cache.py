@@ -0,0 +1,312 @@
+import asyncio
+import calendar
+import logging
+import re
+from datetime import datetime
+from typing import List, Optional, Set, Tuple
+from redis.exceptions import WatchError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import joinedload
+from src.chat.protocol import gap_event
+from src.chat.schemas import MessageResponse
+from src.chat.summary import queue_summary_update
+from src.chat.ingest import message_writer
+from src.core.config import settings
+from src.core import metrics
+from src.db.database import async_session, get_redis
+from src.db.models import Message
+
+logger = logging.getLogger(__name__)
+
+# Последние сообщения чата хранятся в Redis Stream chat:{id}:stream.
+# Каждая запись содержит поля "mid" (message_id) и "data" (готовый JSON).
+# Ключ chat:{id}:stream:warm появляется после прогрева из БД и означает, что
+# стрим содержит непрерывное окно последних сообщений ("partial") или всю
+# историю чата ("full"). Оба ключа живут CHAT_STREAM_TTL с последней записи.
+
+STREAM_ENTRY_PATTERN = re.compile(r"^\d+-\d+$")
+
+def stream_key(chat_id: int) -> str:
+    return f"chat:{chat_id}:stream"
+
+def warm_key(chat_id: int) -> str:
+    return f"chat:{chat_id}:stream:warm"
+
+_warming: Set[int] = set()
+_background: Set[asyncio.Task] = set()
+
+# Сколько записей стрима читать за раз при поиске разрыва по message_id
+_REPLAY_CHUNK = 100
+
+def message_to_json(message: Message) -> str:
+    return MessageResponse(
+        message_id=message.message_id,
+        chat_id=message.chat_id,
+        user_id=message.user_id,
+        username=message.user.username,
+        content=message.content,
+        created_at=message.created_at,
+    ).model_dump_json()
+
+async def append_message(message: MessageResponse, msg_json: str) -> None:
+    chat_id, user_id, message_id = message.chat_id, message.user_id, message.message_id
+    redis_client = await get_redis()
+    if not redis_client:
+        logger.warning("Redis недоступен, сообщение не сохранено в кэше")
+        return
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.xadd(
+                stream_key(chat_id),
+                {"mid": message_id, "data": msg_json},
+                maxlen=settings.CHAT_STREAM_MAXLEN,
+                approximate=True,
+            )
+            # Стрим и отметка прогрева живут одинаково: отметка без стрима
+            # выдавала бы пустое окно за всю историю чата
+            pipe.expire(stream_key(chat_id), settings.CHAT_STREAM_TTL)
+            pipe.expire(warm_key(chat_id), settings.CHAT_STREAM_TTL)
+            queue_summary_update(pipe, chat_id, user_id, message_id, message.content, message.created_at.isoformat())
+            await pipe.execute()
+    except Exception as e:
+        logger.error(f"Ошибка при записи в Redis: {e}")
+
+async def _load_from_db(db: AsyncSession, chat_id: int, after_id: int) -> List[tuple]:
+    """Последние CHAT_REPLAY_LIMIT + 1 сообщений после точки, от старых к новым.
+
+    Порядок тот же, что и у _merge: при большом разрыве нужны самые свежие
+    сообщения, а лишнее (+1) означает, что часть разрыва не поместилась.
+    Выборка обрывается на ещё не записанных id: более поздние сообщения
+    придут клиенту из стрима или живой рассылкой.
+    """
+    query = select(Message).options(joinedload(Message.user)).where(Message.chat_id == chat_id)
+    bound = await message_writer.visible_bound(chat_id)
+    if bound is not None:
+        query = query.where(Message.message_id < bound)
+    query = query.where(Message.message_id > after_id).order_by(Message.message_id.desc()).limit(settings.CHAT_REPLAY_LIMIT + 1)
+    result = await db.execute(query)
+    return [(msg.message_id, message_to_json(msg)) for msg in reversed(result.scalars().all())]
+
+def _merge(db_rows: List[tuple], stream_rows: List[tuple]) -> List[tuple]:
+    merged = {mid: data for mid, data in db_rows}
+    merged.update({mid: data for mid, data in stream_rows})
+    return [(mid, merged[mid]) for mid in sorted(merged)]
+
+def _with_gap(chat_id: int, rows: List[tuple]) -> List[str]:
+    """Обрезает до CHAT_REPLAY_LIMIT последних и явно сообщает клиенту о пропуске."""
+    if len(rows) <= settings.CHAT_REPLAY_LIMIT:
+        return [data for _, data in rows]
+    rows = rows[-settings.CHAT_REPLAY_LIMIT:]
+    metrics.inc("chat.replay_truncated")
+    return [gap_event(chat_id, rows[0][0])] + [data for _, data in rows]
+
+def _stream_id(entry_id: str) -> tuple:
+    milliseconds, _, sequence = entry_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+async def _stream_after_message(redis_client, chat_id: int, since_id: int) -> Tuple[List[tuple], bool]:
+    """Записи стрима с message_id > since_id, читаемые с конца порциями.
+
+    Чтение останавливается на первой записи не новее since_id, поэтому
+    переподключение после короткого обрыва читает только сам разрыв.
+    """
+    key = stream_key(chat_id)
+    rows: List[tuple] = []
+    upper = "+"
+    while len(rows) <= settings.CHAT_REPLAY_LIMIT:
+        chunk = await redis_client.xrevrange(key, max=upper, min="-", count=_REPLAY_CHUNK)
+        for entry_id, fields in chunk:
+            mid = int(fields["mid"])
+            if mid <= since_id:
+                return rows[::-1], True
+            rows.append((mid, fields["data"]))
+        if len(chunk) < _REPLAY_CHUNK:
+            return rows[::-1], False
+        upper = f"({chunk[-1][0]}"
+    return rows[::-1], True
+
+async def replay(chat_id: int, since: Optional[int], db: AsyncSession) -> List[str]:
+    """Сообщения для нового подключения к чату.
+
+    Без since — последние CHAT_REPLAY_DEFAULT сообщений. С since (последний
+    полученный клиентом message_id — он есть в каждом кадре сообщения) — всё
+    после него; в Postgres идём, только если нужная точка уже вытеснена из
+    стрима. Если пропущено больше
+    CHAT_REPLAY_LIMIT сообщений, отдаются последние из них, а первым кадром
+    идёт событие gap с id самого раннего отданного сообщения.
+    """
+    redis_client = await get_redis()
+    if not redis_client:
+        logger.warning("Redis недоступен, кэш сообщений не загружен")
+    if since is None:
+        if not redis_client:
+            return []
+        try:
+            recent = await redis_client.xrevrange(stream_key(chat_id), count=settings.CHAT_REPLAY_DEFAULT)
+            return [fields["data"] for _, fields in reversed(recent)]
+        except Exception as e:
+            logger.error(f"Ошибка при чтении из Redis: {e}")
+            return []
+
+    rows, covered = [], False
+    if redis_client:
+        try:
+            rows, covered = await _stream_after_message(redis_client, chat_id, since)
+        except Exception as e:
+            logger.error(f"Ошибка при чтении из Redis: {e}")
+            rows, covered = [], False
+
+    if not covered:
+        rows = _merge(await _load_from_db(db, chat_id, since), rows)
+    return _with_gap(chat_id, rows)
+
+def _backfill_ids(created: List[datetime], before: Optional[tuple]) -> List[tuple]:
+    """Явные id записей для сообщений, которых нет в стриме, от старых к новым.
+
+    Id — миллисекунды created_at и номер внутри одной миллисекунды. Если
+    сообщение создано не раньше старейшей записи стрима (before), его id и
+    id предшественников сдвигаются ниже неё: XADD принимает только
+    возрастающие id, а записи стрима менять нельзя.
+    """
+    ids: List[tuple] = []
+    previous = (0, 0)
+    for created_at in created:
+        milliseconds = calendar.timegm(created_at.utctimetuple()) * 1000 + created_at.microsecond // 1000
+        previous = (milliseconds, 0) if milliseconds > previous[0] else (previous[0], previous[1] + 1)
+        ids.append(previous)
+    upper = before
+    for index in range(len(ids) - 1, -1, -1):
+        if upper is None or ids[index] < upper:
+            break
+        upper = (upper[0], upper[1] - 1) if upper[1] > 0 else (upper[0] - 1, 0)
+        ids[index] = upper
+    return ids
+
+async def warm_stream(chat_id: int) -> None:
+    """Дополняет стрим более старыми сообщениями из БД, не трогая уже добавленные.
+
+    Id существующих записей сохраняются: на них ссылаются курсоры истории.
+    Сообщения старше самой старой записи получают явные id ниже неё;
+    стрим собирается во временном ключе и заменяет исходный одним RENAME.
+    """
+    redis_client = await get_redis()
+    if not redis_client:
+        return
+    key = stream_key(chat_id)
+    async with async_session() as db:
+        result = await db.execute(
+            select(Message)
+            .options(joinedload(Message.user))
+            .where(Message.chat_id == chat_id)
+            .order_by(Message.message_id.desc())
+            .limit(settings.CHAT_STREAM_MAXLEN)
+        )
+        db_rows = [(msg.message_id, msg.created_at, message_to_json(msg)) for msg in reversed(result.scalars().all())]
+    complete = len(db_rows) < settings.CHAT_STREAM_MAXLEN
+
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            # WATCH: если за время прогрева в стрим добавят сообщение, прогрев отменится
+            await pipe.watch(key)
+            existing = await pipe.xrange(key)
+            known = {int(fields["mid"]) for _, fields in existing}
+            older = [row for row in db_rows if not known or row[0] < min(known)]
+            older = older[len(older) - max(0, settings.CHAT_STREAM_MAXLEN - len(existing)):]
+            # Полной история считается, только если в стриме окажется каждая строка из БД
+            backfilled = {mid for mid, _, _ in older}
+            complete = complete and all(mid in known or mid in backfilled for mid, _, _ in db_rows)
+            ids = _backfill_ids([created_at for _, created_at, _ in older], _stream_id(existing[0][0]) if existing else None)
+            pipe.multi()
+            if older:
+                building = f"{key}:warming"
+                pipe.delete(building)
+                for (mid, _, data), (milliseconds, sequence) in zip(older, ids):
+                    pipe.xadd(building, {"mid": mid, "data": data}, id=f"{milliseconds}-{sequence}")
+                for entry_id, fields in existing:
+                    pipe.xadd(building, fields, id=entry_id)
+                pipe.rename(building, key)
+            if older or existing:
+                pipe.expire(key, settings.CHAT_STREAM_TTL)
+            pipe.set(warm_key(chat_id), "full" if complete else "partial", ex=settings.CHAT_STREAM_TTL)
+            await pipe.execute()
+        metrics.inc("chat.history_cache.warmups")
+    except WatchError:
+        logger.info(f"Прогрев кэша чата {chat_id} прерван новой записью")
+
+async def _warm_in_background(chat_id: int) -> None:
+    if chat_id in _warming:
+        return
+    _warming.add(chat_id)
+    try:
+        await warm_stream(chat_id)
+    except Exception as e:
+        logger.error(f"Ошибка при прогреве кэша чата {chat_id}: {e}")
+    finally:
+        _warming.discard(chat_id)
+
+async def read_history_page(
+    chat_id: int,
+    before_entry: Optional[str],
+    after_entry: Optional[str],
+    limit: int,
+) -> Optional[tuple]:
+    """Страница истории из стрима: (JSON сообщений от старых к новым, их id, id записей стрима, есть ли ещё).
+
+    Границы страницы — id записей стрима из курсора предыдущей страницы,
+    поэтому читается ровно limit + 1 записей через XRANGE/XREVRANGE с
+    исключающей границей. Возвращает None, если страница не помещается в
+    закэшированное окно — тогда её нужно читать из БД. Если кэш не прогрет,
+    запускает прогрев.
+    """
+    redis_client = await get_redis()
+    if not redis_client:
+        metrics.inc("chat.history_cache.misses")
+        return None
+    key = stream_key(chat_id)
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.get(warm_key(chat_id))
+            pipe.xlen(key)
+            pipe.xrange(key, count=1)
+            if after_entry is not None:
+                pipe.xrange(key, min=f"({after_entry}", max="+", count=limit + 1)
+            else:
+                upper = f"({before_entry}" if before_entry is not None else "+"
+                pipe.xrevrange(key, max=upper, min="-", count=limit + 1)
+            state, length, oldest, entries = await pipe.execute()
+    except Exception as e:
+        logger.error(f"Ошибка при чтении из Redis: {e}")
+        metrics.inc("chat.history_cache.misses")
+        return None
+
+    if state is None:
+        metrics.inc("chat.history_cache.misses")
+        task = asyncio.create_task(_warm_in_background(chat_id))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+        return None
+
+    complete = state == "full" and length < settings.CHAT_STREAM_MAXLEN
+
+    if after_entry is not None:
+        # Граница уже вытеснена из стрима — между ней и окном есть пропуск
+        if not oldest or _stream_id(oldest[0][0]) > _stream_id(after_entry):
+            metrics.inc("chat.history_cache.misses")
+            return None
+        has_more = len(entries) > limit
+        page = entries[:limit]
+    else:
+        if len(entries) <= limit and not complete:
+            metrics.inc("chat.history_cache.misses")
+            return None
+        has_more = len(entries) > limit
+        page = entries[:limit][::-1]
+
+    metrics.inc("chat.history_cache.hits")
+    return (
+        [fields["data"] for _, fields in page],
+        [int(fields["mid"]) for _, fields in page],
+        [entry_id for entry_id, _ in page],
+        has_more,
+    )
@@ -0,0 +1,333 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.sql import text
+from src.chat.unread import record_written
+from src.core import metrics
+from src.core.config import settings
+from src.db.database import engine, get_redis
+from src.db.models import Chat, Message
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_ID_SEQUENCE = "messages_message_id_seq"
+
+# Сколько записей chat:{id}:pending_ids читать за раз при поиске нижней границы
+_PENDING_SCAN = 100
+
+def pending_key(chat_id: int) -> str:
+    return f"chat:{chat_id}:pending_ids"
+
+class PendingIds:
+    """Выданные, но ещё не записанные в БД message_id — по чатам, во всех воркерах.
+
+    Каждая запись — член sorted set chat:{id}:pending_ids вида
+    "<метка>:<срок в мс>" со score не больше самого message_id; та же запись
+    хранится локально, чтобы воркер видел свои id и без Redis. До nextval
+    регистрируется предварительная запись с last_value последовательности,
+    после — сами id, поэтому у любого выданного, но не записанного id всегда
+    есть запись не выше него. Срок (CHAT_WRITE_PENDING_TTL) снимает записи
+    воркера, упавшего с неполной пачкой.
+    """
+
+    def __init__(self):
+        self._local: Dict[int, Dict[str, Tuple[str, int]]] = defaultdict(dict)
+
+    async def change(self, added: Dict[int, Dict[str, int]], released: Dict[int, Iterable[str]]) -> None:
+        """Регистрирует метки added (chat_id -> метка -> score) и снимает released."""
+        expires = int((time.time() + settings.CHAT_WRITE_PENDING_TTL) * 1000)
+        new_members: Dict[int, Dict[str, int]] = defaultdict(dict)
+        for chat_id, scores in added.items():
+            for name, score in scores.items():
+                member = f"{name}:{expires}"
+                self._local[chat_id][name] = (member, score)
+                new_members[chat_id][member] = score
+        old_members: Dict[int, List[str]] = defaultdict(list)
+        for chat_id, names in released.items():
+            local = self._local.get(chat_id, {})
+            for name in names:
+                entry = local.pop(name, None)
+                if entry is not None:
+                    old_members[chat_id].append(entry[0])
+            if not local:
+                self._local.pop(chat_id, None)
+
+        redis_client = await get_redis()
+        if not redis_client or not (new_members or old_members):
+            return
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for chat_id, members in new_members.items():
+                    pipe.zadd(pending_key(chat_id), members)
+                    pipe.expire(pending_key(chat_id), settings.CHAT_WRITE_PENDING_TTL)
+                for chat_id, members in old_members.items():
+                    pipe.zrem(pending_key(chat_id), *members)
+                await pipe.execute()
+        except Exception as e:
+            metrics.inc("chat.write_pending_unshared")
+            logger.error(f"Ошибка при записи незаписанных message_id в Redis: {e}")
+
+    async def lowest(self, chat_id: int) -> Optional[int]:
+        """Нижняя граница незаписанных message_id чата или None, если таких нет."""
+        scores = [score for _, score in self._local.get(chat_id, {}).values()]
+        redis_client = await get_redis()
+        if redis_client:
+            try:
+                remote = await self._lowest_remote(redis_client, chat_id)
+                if remote is not None:
+                    scores.append(remote)
+            except Exception as e:
+                logger.error(f"Ошибка при чтении незаписанных message_id из Redis: {e}")
+        return min(scores, default=None)
+
+    @staticmethod
+    async def _lowest_remote(redis_client, chat_id: int) -> Optional[int]:
+        key = pending_key(chat_id)
+        while True:
+            entries = await redis_client.zrange(key, 0, _PENDING_SCAN - 1, withscores=True)
+            now = int(time.time() * 1000)
+            stale = [member for member, _ in entries if int(member.rpartition(":")[2]) <= now]
+            if stale:
+                await redis_client.zrem(key, *stale)
+            live = [int(score) for member, score in entries if int(member.rpartition(":")[2]) > now]
+            if live or len(entries) < _PENDING_SCAN:
+                return min(live, default=None)
+
+class MessageWriter:
+    """Отложенная групповая запись сообщений чата.
+
+    Идентификатор и время создания сообщение получает сразу, поэтому его
+    можно разослать до записи в БД. Идентификаторы берутся из
+    последовательности по одному на сообщение в момент отправки (параллельные
+    запросы объединяются в один nextval), так что message_id растёт вместе
+    со временем во всех воркерах. Фоновая задача копит сообщения и сбрасывает
+    их одним многострочным INSERT, когда набирается CHAT_WRITE_BATCH_SIZE
+    или истекает CHAT_WRITE_MAX_LINGER.
+
+    Пачки разных воркеров фиксируются в любом порядке, поэтому сообщение с
+    меньшим id может появиться в БД позже сообщения с большим. Читатели по
+    ключу (after_id истории, догрузка разрыва из БД) ограничивают выборку
+    visible_bound(): всё ниже неё уже записано или потеряно, и следующее
+    чтение после последнего отданного id ничего не пропустит. Гарантия
+    держится, пока запись пачки укладывается в CHAT_WRITE_PENDING_TTL; без
+    Redis воркер видит только свои незаписанные id.
+    """
+
+    def __init__(self, max_batch: int, max_linger: float):
+        self.max_batch = max_batch
+        self.max_linger = max_linger
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._id_waiters: List[Tuple[int, asyncio.Future]] = []
+        self.pending = PendingIds()
+        self._id_task: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def visible_bound(self, chat_id: int) -> Optional[int]:
+        """Наименьший id чата, который ещё может появиться в БД; читать по ключу можно только ниже него."""
+        return await self.pending.lowest(chat_id)
+
+    async def _allocate_id(self, chat_id: int) -> int:
+        future = asyncio.get_running_loop().create_future()
+        self._id_waiters.append((chat_id, future))
+        if self._id_task is None:
+            self._id_task = asyncio.create_task(self._fetch_ids())
+        return await future
+
+    async def _fetch_ids(self) -> None:
+        """Выдаёт идентификаторы всем, кто ждёт, одним запросом на группу."""
+        try:
+            while self._id_waiters:
+                waiters, self._id_waiters = self._id_waiters, []
+                chat_ids = {chat_id for chat_id, _ in waiters}
+                token = f"next-{uuid.uuid4().hex}"
+
+                async def hold(floor: int) -> None:
+                    await self.pending.change({chat_id: {token: floor} for chat_id in chat_ids}, {})
+
+                try:
+                    ids = await self._next_ids(len(waiters), hold)
+                except Exception as e:
+                    await self.pending.change({}, {chat_id: [token] for chat_id in chat_ids})
+                    for _, future in waiters:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                allocated: Dict[int, Dict[str, int]] = defaultdict(dict)
+                for (chat_id, _), message_id in zip(waiters, ids):
+                    allocated[chat_id][str(message_id)] = message_id
+                await self.pending.change(allocated, {chat_id: [token] for chat_id in chat_ids})
+                for (_, future), message_id in zip(waiters, ids):
+                    if not future.done():
+                        future.set_result(message_id)
+        finally:
+            self._id_task = None
+
+    async def _next_ids(self, count: int, hold: Callable[[int], Awaitable[None]]) -> List[int]:
+        """count новых id; до nextval вызывает hold с границей, не превышающей ни один из них."""
+        async with engine.connect() as conn:
+            floor = (await conn.execute(text(f"SELECT last_value FROM {MESSAGE_ID_SEQUENCE}"))).scalar_one()
+            await hold(floor)
+            result = await conn.execute(
+                text(f"SELECT nextval('{MESSAGE_ID_SEQUENCE}') FROM generate_series(1, :n)"),
+                {"n": count},
+            )
+            return sorted(row[0] for row in result)
+
+    async def _release(self, rows: list) -> None:
+        released: Dict[int, List[str]] = defaultdict(list)
+        for row in rows:
+            released[row["chat_id"]].append(str(row["message_id"]))
+        await self.pending.change({}, released)
+
+    async def submit(self, chat_id: int, user_id: int, content: str) -> dict:
+        message_id = await self._allocate_id(chat_id)
+        if self._stopping:
+            await self._release([{"chat_id": chat_id, "message_id": message_id}])
+            raise HTTPException(status_code=503, detail="Сервер останавливается, сообщение не принято")
+        row = {
+            "message_id": message_id,
+            "chat_id": chat_id,
+            "user_id": user_id,
+            "content": content,
+            "created_at": datetime.utcnow(),
+        }
+        self._queue.put_nowait(row)
+        metrics.set_gauge("chat.write_queue_depth", self._queue.qsize())
+        return row
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Дописывает все накопленные сообщения и останавливает запись."""
+        self._stopping = True
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        logger.info("Очередь записи сообщений сброшена")
+
+    async def _run(self) -> None:
+        while True:
+            row = await self._queue.get()
+            if row is None:
+                return
+            batch = [row]
+            stopping = False
+            deadline = time.monotonic() + self.max_linger
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            await self._write(batch)
+            metrics.set_gauge("chat.write_queue_depth", self._queue.qsize())
+            if stopping:
+                # Всё, что успели положить после сигнала остановки, тоже пишем
+                rest = []
+                while not self._queue.empty():
+                    row = self._queue.get_nowait()
+                    if row is not None:
+                        rest.append(row)
+                if rest:
+                    await self._write(rest)
+                return
+
+    async def _write(self, batch: list) -> None:
+        try:
+            await self._flush(batch)
+        finally:
+            # Записанные и окончательно потерянные id больше не держат читателей
+            await self._release(batch)
+
+    async def _insert(self, rows: list) -> None:
+        """Вставляет сообщения и в той же транзакции обновляет счётчик и активность чатов.
+
+        После фиксации переносит новые message_count в счётчики непрочитанных.
+        """
+        activity, counts = {}, Counter(row["chat_id"] for row in rows)
+        for row in rows:
+            activity[row["chat_id"]] = max(activity.get(row["chat_id"], row["created_at"]), row["created_at"])
+        chats = Chat.__table__
+        async with engine.begin() as conn:
+            await conn.execute(Message.__table__.insert(), rows)
+            # Чаты обновляются в порядке chat_id, чтобы параллельные пачки
+            # брали блокировки строк в одном порядке
+            await conn.execute(
+                update(chats)
+                .where(chats.c.chat_id == bindparam("b_chat_id"))
+                .values(
+                    last_activity_at=func.greatest(chats.c.last_activity_at, bindparam("b_last_at")),
+                    message_count=chats.c.message_count + bindparam("b_count"),
+                ),
+                [
+                    {"b_chat_id": chat_id, "b_last_at": activity[chat_id], "b_count": counts[chat_id]}
+                    for chat_id in sorted(activity)
+                ],
+            )
+            # Строки чатов заблокированы этой транзакцией, так что счётчик и
+            # последний id описывают один и тот же набор записанных сообщений
+            last_id = (
+                select(func.max(Message.message_id))
+                .where(Message.chat_id == chats.c.chat_id)
+                .scalar_subquery()
+            )
+            result = await conn.execute(
+                select(chats.c.chat_id, chats.c.message_count, last_id).where(chats.c.chat_id.in_(list(activity)))
+            )
+            totals = {chat_id: (count, last) for chat_id, count, last in result}
+        await record_written(rows, totals)
+
+    async def _flush(self, batch: list) -> None:
+        started = time.monotonic()
+        for attempt in range(1, settings.CHAT_WRITE_RETRIES + 1):
+            try:
+                await self._insert(batch)
+                metrics.inc("chat.messages_written", len(batch))
+                metrics.observe("chat.write_batch_latency", time.monotonic() - started)
+                return
+            except (IntegrityError, DataError) as e:
+                # Повтор не поможет: пачку валит конкретная строка
+                logger.error(f"Пачка сообщений ({len(batch)} шт.) отклонена БД: {e}")
+                break
+            except Exception as e:
+                logger.error(f"Ошибка записи пачки сообщений ({len(batch)} шт.), попытка {attempt}: {e}")
+                await asyncio.sleep(min(attempt, 5))
+        await self._flush_rows(batch)
+
+    async def _flush_rows(self, batch: list) -> None:
+        """Запись по одной строке, чтобы одно плохое сообщение не теряло всю пачку."""
+        metrics.inc("chat.write_batch_fallbacks")
+        lost = 0
+        for row in batch:
+            try:
+                await self._insert([row])
+            except Exception as e:
+                lost += 1
+                logger.error(f"Не удалось записать сообщение {row['message_id']} в чат {row['chat_id']}: {e}")
+        metrics.inc("chat.messages_written", len(batch) - lost)
+        if lost:
+            metrics.inc("chat.messages_lost", lost)
+            logger.error(f"Не удалось записать {lost} из {len(batch)} сообщений")
+
+message_writer = MessageWriter(
+    max_batch=settings.CHAT_WRITE_BATCH_SIZE,
+    max_linger=settings.CHAT_WRITE_MAX_LINGER,
+)
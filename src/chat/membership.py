@@ -0,0 +1,128 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Iterable, Set
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from src.core import metrics
+from src.core.config import settings
+from src.db.database import get_redis
+from src.db.models import ChatMember
+
+logger = logging.getLogger(__name__)
+
+# Участники чата хранятся в Redis-множестве chat:{id}:members. Служебный
+# элемент "*" означает, что множество загружено из БД целиком.
+LOADED_MARKER = "*"
+
+def members_key(chat_id: int) -> str:
+    return f"chat:{chat_id}:members"
+
+class MembershipCache:
+    """Кэш членства в чатах: Redis-множества плюс небольшой локальный кэш.
+
+    Локально храним только положительные ответы: участников из чатов не
+    удаляют, а отрицательный ответ мог бы устареть после приглашения.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, redis_ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.redis_ttl = redis_ttl
+        self._local: "OrderedDict[tuple, float]" = OrderedDict()
+
+    def _local_hit(self, chat_id: int, user_id: int) -> bool:
+        expires_at = self._local.get((chat_id, user_id))
+        if expires_at is None:
+            return False
+        if expires_at < time.monotonic():
+            del self._local[(chat_id, user_id)]
+            return False
+        self._local.move_to_end((chat_id, user_id))
+        return True
+
+    def _remember(self, chat_id: int, user_ids: Iterable[int]) -> None:
+        expires_at = time.monotonic() + self.ttl
+        for user_id in user_ids:
+            self._local[(chat_id, user_id)] = expires_at
+            self._local.move_to_end((chat_id, user_id))
+        while len(self._local) > self.maxsize:
+            self._local.popitem(last=False)
+
+    async def _load_members(self, chat_id: int, db: AsyncSession) -> Set[int]:
+        result = await db.execute(select(ChatMember.user_id).where(ChatMember.chat_id == chat_id))
+        return set(result.scalars().all())
+
+    async def is_member(self, chat_id: int, user_id: int, db: AsyncSession) -> bool:
+        if self._local_hit(chat_id, user_id):
+            metrics.inc("chat.membership_cache.local_hits")
+            return True
+
+        redis_client = await get_redis()
+        if redis_client:
+            try:
+                loaded, found = await redis_client.smismember(members_key(chat_id), [LOADED_MARKER, user_id])
+                if loaded:
+                    metrics.inc("chat.membership_cache.redis_hits")
+                else:
+                    members = await self._load_members(chat_id, db)
+                    async with redis_client.pipeline(transaction=True) as pipe:
+                        pipe.sadd(members_key(chat_id), LOADED_MARKER, *members)
+                        pipe.expire(members_key(chat_id), self.redis_ttl)
+                        await pipe.execute()
+                    found = user_id in members
+                    metrics.inc("chat.membership_cache.misses")
+                if found:
+                    self._remember(chat_id, [user_id])
+                return bool(found)
+            except Exception as e:
+                logger.error(f"Ошибка при проверке участника чата в Redis: {e}")
+
+        metrics.inc("chat.membership_cache.misses")
+        result = await db.execute(
+            select(ChatMember.id).where(ChatMember.chat_id == chat_id, ChatMember.user_id == user_id)
+        )
+        found = result.scalar_one_or_none() is not None
+        if found:
+            self._remember(chat_id, [user_id])
+        return found
+
+    async def add_members(self, chat_id: int, user_ids: Iterable[int]) -> None:
+        """Обновляет кэш после создания чата или приглашения участников."""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        self._remember(chat_id, user_ids)
+        redis_client = await get_redis()
+        if redis_client:
+            try:
+                # Добавляем всегда, даже если множество ещё не загружено: без
+                # маркера оно не считается полным, а параллельная ленивая
+                # загрузка, прочитавшая БД до приглашения, не потеряет нового
+                # участника — её SADD только дополняет множество
+                async with redis_client.pipeline(transaction=True) as pipe:
+                    pipe.sadd(members_key(chat_id), *user_ids)
+                    pipe.expire(members_key(chat_id), self.redis_ttl)
+                    await pipe.execute()
+            except Exception as e:
+                logger.error(f"Ошибка при обновлении участников чата в Redis: {e}")
+
+    async def set_members(self, chat_id: int, user_ids: Iterable[int]) -> None:
+        """Записывает полный состав нового чата."""
+        user_ids = list(user_ids)
+        self._remember(chat_id, user_ids)
+        redis_client = await get_redis()
+        if redis_client:
+            try:
+                async with redis_client.pipeline(transaction=True) as pipe:
+                    pipe.sadd(members_key(chat_id), LOADED_MARKER, *user_ids)
+                    pipe.expire(members_key(chat_id), self.redis_ttl)
+                    await pipe.execute()
+            except Exception as e:
+                logger.error(f"Ошибка при записи участников чата в Redis: {e}")
+
+membership_cache = MembershipCache(
+    maxsize=settings.CHAT_MEMBERSHIP_CACHE_SIZE,
+    ttl=settings.CHAT_MEMBERSHIP_CACHE_TTL,
+    redis_ttl=settings.CHAT_MEMBERSHIP_REDIS_TTL,
+)
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import re
+from datetime import date
+from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql import text
+from src.core.config import settings
+from src.db.database import engine
+
+logger = logging.getLogger(__name__)
+
+# messages секционирована по месяцам created_at: messages_y2025m01 и т.д.
+# Секции создаются заранее на CHAT_PARTITIONS_AHEAD месяцев вперёд; строки,
+# не попавшие ни в одну секцию, уходят в messages_default.
+
+PARTITION_PATTERN = re.compile(r"^messages_y(\d{4})m(\d{2})$")
+
+def add_months(month: date, count: int) -> date:
+    years, index = divmod(month.month - 1 + count, 12)
+    return date(month.year + years, index + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f"messages_y{month.year}m{month.month:02d}"
+
+def partition_month(name: str) -> Optional[date]:
+    match = PARTITION_PATTERN.match(name)
+    if not match:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+async def list_partitions(conn: AsyncConnection) -> List[str]:
+    result = await conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "WHERE parent.relname = 'messages'"
+    ))
+    return [row[0] for row in result]
+
+async def create_partition(conn: AsyncConnection, month: date) -> int:
+    """Создаёт секцию месяца в одной транзакции, перенося в неё строки из messages_default.
+
+    Пока секции нет, сообщения этого месяца попадают в messages_default, и
+    CREATE TABLE ... PARTITION OF падает на проверке default-секции. Поэтому
+    строки месяца сначала вынимаются во временную таблицу, а после создания
+    секции вставляются обратно через messages. Возвращает число перенесённых строк.
+    """
+    name = partition_name(month)
+    low, high = month.isoformat(), add_months(month, 1).isoformat()
+    async with conn.begin():
+        # Блокируем default-секцию, чтобы новые строки месяца не попали в неё во время переноса
+        await conn.execute(text("LOCK TABLE messages_default IN SHARE ROW EXCLUSIVE MODE"))
+        await conn.execute(text(
+            "CREATE TEMP TABLE messages_moving "
+            "(message_id INTEGER, chat_id INTEGER, user_id INTEGER, content VARCHAR(2000), created_at TIMESTAMP) "
+            "ON COMMIT DROP"
+        ))
+        result = await conn.execute(text(
+            "WITH moved AS ("
+            "DELETE FROM messages_default WHERE created_at >= :low AND created_at < :high "
+            "RETURNING message_id, chat_id, user_id, content, created_at"
+            ") INSERT INTO messages_moving SELECT * FROM moved"
+        ), {"low": low, "high": high})
+        moved = result.rowcount
+        await conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF messages "
+            f"FOR VALUES FROM ('{low}') TO ('{high}')"
+        ))
+        if moved:
+            await conn.execute(text(
+                "INSERT INTO messages (message_id, chat_id, user_id, content, created_at) "
+                "SELECT message_id, chat_id, user_id, content, created_at FROM messages_moving"
+            ))
+    return moved
+
+async def ensure_partitions(ahead: int) -> List[str]:
+    """Создаёт недостающие секции с текущего месяца на ahead месяцев вперёд."""
+    current = date.today().replace(day=1)
+    created = []
+    async with engine.connect() as conn:
+        existing = set(await list_partitions(conn))
+        for offset in range(ahead + 1):
+            month = add_months(current, offset)
+            name = partition_name(month)
+            if name in existing:
+                continue
+            try:
+                moved = await create_partition(conn, month)
+            except Exception as e:
+                logger.error(f"Не удалось создать секцию {name}: {e}")
+                continue
+            if moved:
+                logger.warning(f"В секцию {name} перенесено {moved} сообщений из messages_default")
+            created.append(name)
+    if created:
+        logger.info(f"Созданы секции сообщений: {', '.join(created)}")
+    return created
+
+class PartitionMaintainer:
+    """Фоновая задача, заранее создающая секции messages на будущие месяцы."""
+
+    def __init__(self, ahead: int, interval: float):
+        self.ahead = ahead
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await ensure_partitions(self.ahead)
+            except Exception as e:
+                logger.error(f"Ошибка при обслуживании секций сообщений: {e}")
+            await asyncio.sleep(self.interval)
+
+partition_maintainer = PartitionMaintainer(
+    ahead=settings.CHAT_PARTITIONS_AHEAD,
+    interval=settings.CHAT_PARTITION_CHECK_INTERVAL,
+)
@@ -0,0 +1,145 @@
+import json
+import logging
+import time
+from typing import Dict, List, Tuple
+from src.core import metrics
+from src.core.config import settings
+from src.db.database import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Присутствие и набор текста живут только в Redis и никогда не пишутся в БД.
+# chat:{id}:presence и chat:{id}:typing — sorted set, где score — момент
+# истечения записи; сами ключи тоже получают короткий TTL. Запись продлевается
+# heartbeat-ами клиента и любыми его сообщениями. В хэше chat:{id}:sockets
+# считаются открытые сокеты пользователя во всех воркерах: "offline"
+# отправляется, только когда закрывается последний из них.
+
+def presence_key(chat_id: int) -> str:
+    return f"chat:{chat_id}:presence"
+
+def typing_key(chat_id: int) -> str:
+    return f"chat:{chat_id}:typing"
+
+def typing_limit_key(chat_id: int, user_id: int) -> str:
+    return f"chat:{chat_id}:typing:{user_id}"
+
+def sockets_key(chat_id: int) -> str:
+    return f"chat:{chat_id}:sockets"
+
+# Счётчики сокетов упавшего воркера никто не уменьшит, поэтому хэш живёт
+# ограниченное время с последнего подключения или heartbeat
+def _sockets_ttl() -> int:
+    return int(settings.CHAT_IDLE_TIMEOUT + settings.CHAT_PRESENCE_TTL)
+
+# Уменьшает счётчик сокетов; на нуле удаляет пользователя из присутствия
+_LEAVE = """
+local left = redis.call('HINCRBY', KEYS[1], ARGV[1], -1)
+if left > 0 then
+    return 0
+end
+redis.call('HDEL', KEYS[1], ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+return 1
+"""
+
+# Ограничение частоты событий набора, если Redis недоступен. Записи удаляются
+# при отключении пользователя, а устаревшие вычищаются, когда их много.
+_local_typing: Dict[Tuple[int, int], float] = {}
+_LOCAL_TYPING_PRUNE_AT = 1024
+
+def presence_event(chat_id: int, user_id: int, username: str, status: str) -> str:
+    return json.dumps({
+        "event": "presence", "chat_id": chat_id, "user_id": user_id,
+        "username": username, "status": status,
+    })
+
+def typing_event(chat_id: int, user_id: int, username: str) -> str:
+    return json.dumps({"event": "typing", "chat_id": chat_id, "user_id": user_id, "username": username})
+
+async def touch_presence(chat_id: int, user_id: int, joined: bool = False) -> bool:
+    """Продлевает присутствие; True, если пользователь только что появился в чате.
+
+    joined=True — вызов при открытии сокета: он ещё и учитывается в счётчике.
+    """
+    redis_client = await get_redis()
+    if not redis_client:
+        return False
+    now = time.time()
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.zscore(presence_key(chat_id), user_id)
+            pipe.zadd(presence_key(chat_id), {user_id: now + settings.CHAT_PRESENCE_TTL})
+            pipe.expire(presence_key(chat_id), settings.CHAT_PRESENCE_TTL)
+            if joined:
+                pipe.hincrby(sockets_key(chat_id), user_id, 1)
+            pipe.expire(sockets_key(chat_id), _sockets_ttl())
+            previous = (await pipe.execute())[0]
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении присутствия в Redis: {e}")
+        return False
+    return previous is None or float(previous) < now
+
+async def leave_presence(chat_id: int, user_id: int) -> bool:
+    """Учитывает закрытие сокета; True, если это был последний сокет пользователя в чате.
+
+    Без Redis решает вызывающий код по локальным соединениям.
+    """
+    _local_typing.pop((chat_id, user_id), None)
+    redis_client = await get_redis()
+    if not redis_client:
+        return True
+    try:
+        return bool(await redis_client.eval(_LEAVE, 2, sockets_key(chat_id), presence_key(chat_id), user_id))
+    except Exception as e:
+        logger.error(f"Ошибка при удалении присутствия в Redis: {e}")
+        return False
+
+async def allow_typing(chat_id: int, user_id: int) -> bool:
+    """Разрешает не более одного события набора за CHAT_TYPING_INTERVAL."""
+    interval = settings.CHAT_TYPING_INTERVAL
+    redis_client = await get_redis()
+    if not redis_client:
+        now = time.monotonic()
+        if now - _local_typing.get((chat_id, user_id), 0.0) < interval:
+            metrics.inc("chat.typing_suppressed")
+            return False
+        _local_typing[(chat_id, user_id)] = now
+        if len(_local_typing) > _LOCAL_TYPING_PRUNE_AT:
+            for key, sent_at in list(_local_typing.items()):
+                if now - sent_at >= interval:
+                    del _local_typing[key]
+        return True
+    try:
+        allowed = await redis_client.set(
+            typing_limit_key(chat_id, user_id), 1, nx=True, px=int(interval * 1000)
+        )
+        if not allowed:
+            metrics.inc("chat.typing_suppressed")
+            return False
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.zadd(typing_key(chat_id), {user_id: time.time() + interval * 2})
+            pipe.expire(typing_key(chat_id), int(interval * 2) + 1)
+            await pipe.execute()
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при обработке набора текста в Redis: {e}")
+        return False
+
+async def get_presence(chat_id: int) -> Tuple[List[int], List[int]]:
+    """Пользователи онлайн и набирающие текст — только по ключам Redis."""
+    redis_client = await get_redis()
+    if not redis_client:
+        return [], []
+    now = time.time()
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.zrangebyscore(presence_key(chat_id), now, "+inf")
+            pipe.zrangebyscore(typing_key(chat_id), now, "+inf")
+            pipe.zremrangebyscore(presence_key(chat_id), "-inf", now)
+            pipe.zremrangebyscore(typing_key(chat_id), "-inf", now)
+            online, typing, _, _ = await pipe.execute()
+    except Exception as e:
+        logger.error(f"Ошибка при чтении присутствия из Redis: {e}")
+        return [], []
+    return [int(user_id) for user_id in online], [int(user_id) for user_id in typing]
@@ -0,0 +1,107 @@
+import json
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+from fastapi import WebSocket, WebSocketDisconnect
+import msgpack
+
+# Компактный бинарный протокол чата (подпротокол WebSocket).
+# Кадр — msgpack-массив сообщений, каждое сообщение — словарь с целочисленными
+# тегами полей вместо имён. created_at передаётся как миллисекунды Unix-времени,
+# имя пользователя — только когда соединение его ещё не видело или оно изменилось.
+
+BINARY_SUBPROTOCOL = "uapi.msgpack.v1"
+
+FIELD_TAGS = {
+    "message_id": 1,
+    "chat_id": 2,
+    "user_id": 3,
+    "username": 4,
+    "content": 5,
+    "created_at": 6,
+    "event": 7,
+    "status": 8,
+}
+
+# Служебные события от клиента: {"event": "typing"}, {"event": "heartbeat"}
+# или {"event": "pong"} в ответ на ping сервера. Прикладной ping шлётся только
+# в бинарном подпротоколе; JSON-клиентов пингует сам WebSocket-сервер
+CONTROL_EVENTS = ("typing", "heartbeat", "pong")
+
+PING_EVENT = json.dumps({"event": "ping"})
+
+class FrameError(ValueError):
+    """Кадр клиента не разобрать; отвечаем событием error, соединение не закрываем."""
+
+def gap_event(chat_id: int, before_id: int) -> str:
+    """Replay отдал не всё: сообщения до before_id клиент дочитывает через историю."""
+    return json.dumps({"event": "gap", "chat_id": chat_id, "before_id": before_id})
+
+def error_event(detail: str) -> str:
+    """Ошибка обработки кадра клиента; соединение при этом не закрывается."""
+    return json.dumps({"event": "error", "detail": detail}, ensure_ascii=False)
+
+def _to_millis(value: str) -> int:
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+@lru_cache(maxsize=4096)
+def _tagged(payload: str) -> tuple:
+    """Разбор JSON одного сообщения кэшируется: его получают все сокеты чата."""
+    fields = []
+    for key, value in json.loads(payload).items():
+        if key == "created_at" and isinstance(value, str):
+            value = _to_millis(value)
+        fields.append((FIELD_TAGS.get(key, key), value))
+    return tuple(fields)
+
+def encode_frame(payloads: Iterable[str], known_users: Dict[int, str]) -> bytes:
+    messages = []
+    for payload in payloads:
+        message = dict(_tagged(payload))
+        user_id = message.get(FIELD_TAGS["user_id"])
+        username = message.get(FIELD_TAGS["username"])
+        if user_id is not None and username is not None:
+            if known_users.get(user_id) == username:
+                del message[FIELD_TAGS["username"]]
+            else:
+                known_users[user_id] = username
+        messages.append(message)
+    return msgpack.packb(messages)
+
+def decode_binary(data: bytes) -> Tuple[Optional[str], str]:
+    """Входящий бинарный кадр: msgpack-словарь с тегом event или content."""
+    try:
+        message = msgpack.unpackb(data, strict_map_key=False)
+    except Exception as e:
+        raise FrameError(f"Некорректный msgpack: {e}") from e
+    if not isinstance(message, dict):
+        raise FrameError("Ожидался msgpack-словарь")
+    event = message.get(FIELD_TAGS["event"])
+    if event in CONTROL_EVENTS:
+        return event, ""
+    content = message.get(FIELD_TAGS["content"])
+    if not isinstance(content, str):
+        raise FrameError("В кадре нет содержимого сообщения")
+    return None, content
+
+def decode_text(text: str) -> Tuple[Optional[str], str]:
+    if text.startswith("{"):
+        try:
+            message = json.loads(text)
+        except ValueError:
+            return None, text
+        if isinstance(message, dict) and message.get("event") in CONTROL_EVENTS:
+            return message["event"], ""
+    return None, text
+
+async def receive_frame(websocket: WebSocket) -> Tuple[Optional[str], str]:
+    """Следующий входящий кадр в любом из режимов: (служебное событие, текст сообщения)."""
+    frame = await websocket.receive()
+    if frame["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(frame.get("code", 1000))
+    if frame.get("text") is not None:
+        return decode_text(frame["text"])
+    return decode_binary(frame["bytes"])
@@ -1,22 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
+from sqlalchemy import func, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from src.auth.auth import get_current_user
+from src.auth.auth import authenticate_token, get_current_principal, get_current_user
+from src.auth.schemas import Principal
+from src.core.config import settings
 from src.db.models import User, Chat, ChatMember, Message
-from src.db.database import get_db, get_redis
-from src.chat.schemas import ChatCreate, ChatInfo, ChatInvite, ChatListResponse, MessageCreate, MessageResponse, MessageHistoryResponse
-from typing import List, Dict
+from src.db.database import async_session, get_db
+from src.chat.schemas import ChatBulkInvite, ChatBulkInviteResponse, ChatCreate, ChatInfo, ChatInvite, ChatListResponse, ChatPresenceResponse, ChatRead, ChatReadResponse, MessageCreate, MessageResponse, MessageHistoryResponse, MessageSearchHit, MessageSearchResponse
+from src.chat.archive import archive_bounds, read_archive
+from src.chat.search import search_messages
+from src.chat.summary import add_summary_members, list_summaries
+from src.chat.unread import mark_read, unread_counts
+from src.chat.websocket import broker
+from src.chat.ingest import message_writer
+from src.chat.cache import STREAM_ENTRY_PATTERN, append_message, replay, read_history_page
+from src.chat.membership import membership_cache
+from src.chat.protocol import BINARY_SUBPROTOCOL, FrameError, error_event, receive_frame
+from src.chat.presence import allow_typing, get_presence, leave_presence, presence_event, touch_presence, typing_event
 from sqlalchemy.orm import joinedload
+from pydantic import ValidationError
+from typing import Optional
+from src.core.pagination import encode_cursor, decode_cursor
+import asyncio
+import json
 import logging
+import time
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/chat", tags=["чат"])
 
-# Хранилище активных WebSocket-соединений
-connected_clients: Dict[int, List[WebSocket]] = {}
-
 @router.post("/create", response_model=dict)
 async def create_chat(
     chat_data: ChatCreate,
@@ -27,15 +43,26 @@ async def create_chat(
     db.add(chat)
     await db.flush()
 
-    db.add(ChatMember(chat_id=chat.chat_id, user_id=current_user.user_id))
-    for member_id in chat_data.member_ids:
-        if member_id != current_user.user_id:
-            result = await db.execute(select(User).where(User.user_id == member_id))
-            if result.scalar_one_or_none():
-                db.add(ChatMember(chat_id=chat.chat_id, user_id=member_id))
+    # Проверяем всех приглашённых одним запросом и добавляем одной вставкой
+    requested = [member_id for member_id in dict.fromkeys(chat_data.member_ids) if member_id != current_user.user_id]
+    valid_ids = set()
+    if requested:
+        result = await db.execute(
+            select(User.user_id).where(User.user_id.in_(requested), User.is_deleted == False)
+        )
+        valid_ids = set(result.scalars().all())
+    added = [current_user.user_id] + [member_id for member_id in requested if member_id in valid_ids]
+    await db.execute(
+        insert(ChatMember).values([{"chat_id": chat.chat_id, "user_id": user_id} for user_id in added])
+    )
 
     await db.commit()
-    return {"chat_id": chat.chat_id, "сообщение": "Чат успешно создан"}
+    await membership_cache.set_members(chat.chat_id, added)
+    return {
+        "chat_id": chat.chat_id,
+        "сообщение": "Чат успешно создан",
+        "rejected_ids": [member_id for member_id in requested if member_id not in valid_ids],
+    }
 
 @router.post("/{chat_id}/invite", response_model=dict)
 async def invite_to_chat(
@@ -56,17 +83,67 @@ async def invite_to_chat(
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
+    # Проверка дубликата идёт в БД, а не через кэш: кэш может отставать,
+    # а гонку двух приглашений закрывает уникальный индекс
     result = await db.execute(
-        select(ChatMember).where(ChatMember.chat_id == chat_id, ChatMember.user_id == invite.user_id)
+        pg_insert(ChatMember)
+        .values(chat_id=chat_id, user_id=invite.user_id)
+        .on_conflict_do_nothing(index_elements=[ChatMember.chat_id, ChatMember.user_id])
+        .returning(ChatMember.id)
     )
-    existing_member = result.scalar_one_or_none()
-    if existing_member:
+    if result.scalar_one_or_none() is None:
         raise HTTPException(status_code=400, detail="Пользователь уже является участником")
-
-    db.add(ChatMember(chat_id=chat_id, user_id=invite.user_id))
     await db.commit()
+    await membership_cache.add_members(chat_id, [invite.user_id])
+    await add_summary_members(chat_id, 1)
     return {"сообщение": f"Пользователь {user.username} приглашен в чат {chat_id}"}
 
+@router.post("/{chat_id}/invite/bulk", response_model=ChatBulkInviteResponse)
+async def bulk_invite_to_chat(
+    chat_id: int,
+    invite: ChatBulkInvite,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    result = await db.execute(
+        select(Chat).where(Chat.chat_id == chat_id, Chat.creator_id == current_user.user_id)
+    )
+    chat = result.scalar_one_or_none()
+    if not chat:
+        raise HTTPException(status_code=403, detail="Чат не найден или вы не являетесь создателем")
+
+    # Один запрос: какие пользователи существуют и кто из них уже в чате
+    requested = list(dict.fromkeys(invite.user_ids))
+    already_member = (
+        select(ChatMember.id)
+        .where(ChatMember.chat_id == chat_id, ChatMember.user_id == User.user_id)
+        .exists()
+    )
+    result = await db.execute(
+        select(User.user_id).where(User.user_id.in_(requested), User.is_deleted == False, ~already_member)
+    )
+    addable = set(result.scalars().all())
+    added = [user_id for user_id in requested if user_id in addable]
+
+    if added:
+        result = await db.execute(
+            pg_insert(ChatMember)
+            .values([{"chat_id": chat_id, "user_id": user_id} for user_id in added])
+            .on_conflict_do_nothing(index_elements=[ChatMember.chat_id, ChatMember.user_id])
+            .returning(ChatMember.user_id)
+        )
+        inserted = set(result.scalars().all())
+        added = [user_id for user_id in added if user_id in inserted]
+        addable &= inserted
+        await db.commit()
+        await membership_cache.add_members(chat_id, added)
+        await add_summary_members(chat_id, len(added))
+
+    return ChatBulkInviteResponse(
+        added_ids=added,
+        rejected_ids=[user_id for user_id in requested if user_id not in addable],
+    )
+
 @router.post("/{chat_id}/send", response_model=MessageResponse)
 async def send_message(
     chat_id: int,
@@ -74,41 +151,23 @@ async def send_message(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    result = await db.execute(
-        select(ChatMember).where(ChatMember.chat_id == chat_id, ChatMember.user_id == current_user.user_id)
-    )
-    member = result.scalar_one_or_none()
-    if not member:
+    if not await membership_cache.is_member(chat_id, current_user.user_id, db):
         raise HTTPException(status_code=403, detail="Вы не являетесь участником этого чата")
 
-    message = Message(chat_id=chat_id, user_id=current_user.user_id, content=message_data.content)
-    db.add(message)
-    await db.commit()
-    await db.refresh(message)
+    message = await message_writer.submit(chat_id, current_user.user_id, message_data.content)
 
     msg_response = MessageResponse(
-        message_id=message.message_id,
+        message_id=message["message_id"],
         chat_id=chat_id,
         user_id=current_user.user_id,
         username=current_user.username,
         content=message_data.content,
-        created_at=message.created_at
+        created_at=message["created_at"]
     )
     msg_json = msg_response.model_dump_json()
 
-    redis_client = await get_redis()
-    if redis_client:
-        try:
-            await redis_client.lpush(f"chat:{chat_id}", msg_json)
-            await redis_client.ltrim(f"chat:{chat_id}", 0, 99)
-        except Exception as e:
-            logger.error(f"Ошибка при работе с Redis: {e}")
-    else:
-        logger.warning("Redis недоступен, сообщение не сохранено в кэше")
-
-    if chat_id in connected_clients:
-        for client in connected_clients[chat_id]:
-            await client.send_text(msg_json)
+    await append_message(msg_response, msg_json)
+    await broker.publish(chat_id, msg_json)
 
     return msg_response
 
@@ -117,126 +176,339 @@ async def send_message(
 async def websocket_chat(
     websocket: WebSocket,
     chat_id: int,
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    since: Optional[int] = Query(None, ge=0),
 ):
-    result = await db.execute(
-        select(ChatMember).where(ChatMember.chat_id == chat_id, ChatMember.user_id == current_user.user_id)
-    )
-    member = result.scalar_one_or_none()
-    if not member:
+    # Сессию БД берём только на время проверок, чтобы открытый сокет
+    # не удерживал соединение из пула
+    async with async_session() as db:
+        try:
+            current_user = await authenticate_token(websocket.cookies.get("access_token"), db)
+        except HTTPException as e:
+            await websocket.close(code=1008, reason=e.detail)
+            return
+        user_id, username = current_user.user_id, current_user.username
+        is_member = await membership_cache.is_member(chat_id, user_id, db)
+    if not is_member:
         await websocket.close(code=1008, reason="Вы не участник чата")
         return
 
-    await websocket.accept()
-
-    if chat_id not in connected_clients:
-        connected_clients[chat_id] = []
-    connected_clients[chat_id].append(websocket)
+    # Бинарный протокол включается, только если клиент запросил подпротокол
+    binary = BINARY_SUBPROTOCOL in websocket.scope.get("subprotocols", [])
+    await websocket.accept(subprotocol=BINARY_SUBPROTOCOL if binary else None)
+    # Сверх лимита принимаем и сразу закрываем с 1013, чтобы клиент увидел причину
+    rejection = broker.check_limits(user_id)
+    if rejection:
+        await websocket.close(code=1013, reason=rejection)
+        return
+    connection = broker.connect(chat_id, user_id, websocket, binary=binary)
+    joined = False
 
     try:
-        redis_client = await get_redis()
-        if redis_client:
-            try:
-                cached_messages = await redis_client.lrange(f"chat:{chat_id}", 0, 9)
-                for msg in reversed(cached_messages):
-                    await websocket.send_text(msg)
-            except Exception as e:
-                logger.error(f"Ошибка при чтении из Redis: {e}")
-        else:
-            logger.warning("Redis недоступен, кэш сообщений не загружен")
+        async with async_session() as db:
+            replayed = await replay(chat_id, since, db)
+        for msg in replayed:
+            await connection.put(msg)
+
+        joined = True
+        if await touch_presence(chat_id, user_id, joined=True):
+            await broker.publish(chat_id, presence_event(chat_id, user_id, username, "online"))
+        last_touch = time.monotonic()
 
         while True:
-            data = await websocket.receive_text()
-            message = Message(chat_id=chat_id, user_id=current_user.user_id, content=data)
-            db.add(message)
-            await db.commit()
-            await db.refresh(message)
+            try:
+                event, data = await receive_frame(websocket)
+            except FrameError as e:
+                connection.touch()
+                if not connection.enqueue(error_event(str(e))):
+                    broker.evict(connection, "Переполнена очередь отправки")
+                    break
+                continue
+            connection.touch()
+
+            # Присутствие продлеваем heartbeat-ами и сообщениями, но не чаще раза в треть TTL
+            if event == "heartbeat" or time.monotonic() - last_touch > settings.CHAT_PRESENCE_TTL / 3:
+                if await touch_presence(chat_id, user_id):
+                    await broker.publish(chat_id, presence_event(chat_id, user_id, username, "online"))
+                last_touch = time.monotonic()
+            if event == "typing":
+                if await allow_typing(chat_id, user_id):
+                    await broker.publish(chat_id, typing_event(chat_id, user_id, username))
+            if event is not None:
+                continue
+
+            # Те же ограничения, что и у POST /send: невалидное сообщение не
+            # должно попасть в рассылку и в групповой INSERT
+            try:
+                data = MessageCreate(content=data).content
+            except ValidationError as e:
+                if not connection.enqueue(error_event(e.errors()[0]["msg"])):
+                    broker.evict(connection, "Переполнена очередь отправки")
+                    break
+                continue
+
+            message = await message_writer.submit(chat_id, user_id, data)
 
             msg_response = MessageResponse(
-                message_id=message.message_id,
+                message_id=message["message_id"],
                 chat_id=chat_id,
-                user_id=current_user.user_id,
-                username=current_user.username,
+                user_id=user_id,
+                username=username,
                 content=data,
-                created_at=message.created_at
+                created_at=message["created_at"]
             )
             msg_json = msg_response.model_dump_json()
 
-            if redis_client:
-                try:
-                    await redis_client.lpush(f"chat:{chat_id}", msg_json)
-                    await redis_client.ltrim(f"chat:{chat_id}", 0, 99)
-                except Exception as e:
-                    logger.error(f"Ошибка при записи в Redis: {e}")
-            for client in connected_clients[chat_id]:
-                await client.send_text(msg_json)
+            await append_message(msg_response, msg_json)
+            await broker.publish(chat_id, msg_json)
 
     except WebSocketDisconnect:
-        connected_clients[chat_id].remove(websocket)
-        if not connected_clients[chat_id]:
-            del connected_clients[chat_id]
+        pass
     except Exception as e:
-        await websocket.close(code=1011, reason=f"Ошибка: {str(e)}")
-        connected_clients[chat_id].remove(websocket)
-        if not connected_clients[chat_id]:
-            del connected_clients[chat_id]
+        await connection.close(code=1011, reason=f"Ошибка: {str(e)}")
+    finally:
+        broker.disconnect(connection)
+        await connection.close()
+        # Пользователь может оставаться в чате через сокеты других воркеров
+        if joined and await leave_presence(chat_id, user_id) and not broker.has_user(chat_id, user_id):
+            await broker.publish(chat_id, presence_event(chat_id, user_id, username, "offline"))
+
+@router.get("/{chat_id}/presence", response_model=ChatPresenceResponse)
+async def get_chat_presence(
+    chat_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    if not await membership_cache.is_member(chat_id, current_user.user_id, db):
+        raise HTTPException(status_code=403, detail="Вы не являетесь участником этого чата")
+    online, typing = await get_presence(chat_id)
+    return ChatPresenceResponse(chat_id=chat_id, online_user_ids=online, typing_user_ids=typing)
 
 @router.get("/list", response_model=ChatListResponse)
 async def list_user_chats(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    result = await db.execute(
-        select(Chat)
-        .join(ChatMember, Chat.chat_id == ChatMember.chat_id)
-        .where(ChatMember.user_id == current_user.user_id)
-        .order_by(Chat.chat_name)
-    )
-    chats = result.scalars().unique().all()
+    after = None
+    if cursor:
+        try:
+            last_activity, chat_id = decode_cursor(cursor)
+            after = (datetime.fromisoformat(last_activity), int(chat_id))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+    rows = await list_summaries(db, current_user.user_id, after, limit)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    unread = await unread_counts(current_user.user_id, [row["chat_id"] for row in rows], db)
 
     chat_infos = [
         ChatInfo(
-            chat_id=chat.chat_id,
-            chat_name=chat.chat_name,
-            creator_id=chat.creator_id,
-        ) for chat in chats
+            **row,
+            unread_count=unread[row["chat_id"]][0],
+            last_read_message_id=unread[row["chat_id"]][1],
+        ) for row in rows
     ]
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(rows[-1]["last_activity_at"].isoformat(), rows[-1]["chat_id"])
+
+    return ChatListResponse(chats=chat_infos, next_cursor=next_cursor)
+
+def _decode_search_cursor(cursor: Optional[str]) -> Optional[tuple]:
+    if not cursor:
+        return None
+    values = decode_cursor(cursor)
+    if (
+        len(values) != 3
+        or not isinstance(values[0], (int, float))
+        or not isinstance(values[1], int)
+        or not isinstance(values[2], int)
+    ):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    return float(values[0]), values[1], values[2]
+
+def _search_response(hits: list, window_top: Optional[int], limit: int) -> MessageSearchResponse:
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+    next_cursor = encode_cursor(hits[-1][1], hits[-1][0].message_id, window_top) if has_more else None
+    return MessageSearchResponse(
+        messages=[
+            MessageSearchHit(
+                message_id=msg.message_id,
+                chat_id=msg.chat_id,
+                user_id=msg.user_id,
+                username=msg.user.username,
+                content=msg.content,
+                created_at=msg.created_at,
+                rank=rank,
+            )
+            for msg, rank in hits
+        ],
+        next_cursor=next_cursor,
+        limit=limit,
+    )
+
+@router.get("/search", response_model=MessageSearchResponse)
+async def search_all_chats(
+    q: str = Query(..., min_length=2, max_length=200),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    after = _decode_search_cursor(cursor)
+    hits, window_top = await search_messages(db, q, limit, user_id=current_user.user_id, after=after)
+    return _search_response(hits, window_top, limit)
+
+@router.get("/{chat_id}/search", response_model=MessageSearchResponse)
+async def search_chat(
+    chat_id: int,
+    q: str = Query(..., min_length=2, max_length=200),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    if not await membership_cache.is_member(chat_id, current_user.user_id, db):
+        raise HTTPException(status_code=403, detail="Вы не являетесь участником этого чата")
+    after = _decode_search_cursor(cursor)
+    hits, window_top = await search_messages(db, q, limit, chat_id=chat_id, after=after)
+    return _search_response(hits, window_top, limit)
 
-    return ChatListResponse(chats=chat_infos)
-@router.get("/{chat_id}/history", response_model=list[dict])
+@router.post("/{chat_id}/read", response_model=ChatReadResponse)
+async def mark_chat_read(
+    chat_id: int,
+    read: ChatRead,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    if not await membership_cache.is_member(chat_id, current_user.user_id, db):
+        raise HTTPException(status_code=403, detail="Вы не являетесь участником этого чата")
+    unread_count, last_read = await mark_read(current_user.user_id, chat_id, read.message_id, db)
+    return ChatReadResponse(chat_id=chat_id, last_read_message_id=last_read, unread_count=unread_count)
+
+def _history_cursor(
+    message_ids: list, after_id: Optional[int], has_more: bool, entry_ids: Optional[list] = None
+) -> Optional[str]:
+    if not has_more or not message_ids:
+        return None
+    # Страница из кэша добавляет id записи стрима, чтобы следующая читалась из него же
+    if after_id is not None:
+        return encode_cursor("after", message_ids[-1], *entry_ids[-1:] if entry_ids else ())
+    return encode_cursor("before", message_ids[0], *entry_ids[:1] if entry_ids else ())
+
+@router.get("/{chat_id}/history", response_model=MessageHistoryResponse)
 async def get_chat_history(
     chat_id: int,
-    skip: int = 0,
-    limit: int = 50,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    result = await db.execute(
-        select(ChatMember).where(ChatMember.chat_id == chat_id, ChatMember.user_id == current_user.user_id)
-    )
-    member = result.scalar_one_or_none()
-    if not member:
+    if not await membership_cache.is_member(chat_id, current_user.user_id, db):
         raise HTTPException(status_code=403, detail="Not authorized to view this chat")
 
-    result = await db.execute(
-        select(Message)
-        .options(joinedload(Message.user))
-        .where(Message.chat_id == chat_id)
-        .order_by(Message.created_at.desc())
-        .offset(skip)
-        .limit(limit)
+    # Курсор хранит направление, границу и, для страниц из кэша, id записи
+    # стрима: ["before", id], ["after", id] или ["before", id, "1700000000000-0"]
+    entry_id = None
+    if cursor:
+        values = decode_cursor(cursor)
+        if (
+            len(values) not in (2, 3)
+            or values[0] not in ("before", "after")
+            or not isinstance(values[1], int)
+            or (len(values) == 3 and not (isinstance(values[2], str) and STREAM_ENTRY_PATTERN.match(values[2])))
+        ):
+            raise HTTPException(status_code=400, detail="Некорректный курсор")
+        before_id, after_id = (values[1], None) if values[0] == "before" else (None, values[1])
+        entry_id = values[2] if len(values) == 3 else None
+    if before_id is not None and after_id is not None:
+        raise HTTPException(status_code=400, detail="Укажите только before_id или after_id")
+
+    # Последняя страница и продолжения страниц из кэша отдаются готовым JSON
+    # из Redis без валидации; остальное читается из БД по индексу
+    if entry_id is not None or (before_id is None and after_id is None):
+        cached = await read_history_page(
+            chat_id,
+            entry_id if after_id is None else None,
+            entry_id if after_id is not None else None,
+            limit,
+        )
+        if cached is not None:
+            payloads, message_ids, entry_ids, has_more = cached
+            next_cursor = _history_cursor(message_ids, after_id, has_more, entry_ids)
+            body = (
+                '{"messages":[' + ",".join(payloads) + '],'
+                f'"next_cursor":{json.dumps(next_cursor)},"limit":{limit}}}'
+            )
+            return Response(content=body, media_type="application/json")
+
+    # Выбираем на одно сообщение больше, чтобы понять, есть ли следующая страница.
+    # Сообщения от первого ещё не записанного id не отдаём: иначе клиент
+    # продолжил бы после них и навсегда пропустил бы записанные позже меньшие id
+    query = select(Message).options(joinedload(Message.user)).where(Message.chat_id == chat_id)
+    bound = await message_writer.visible_bound(chat_id)
+    if bound is not None:
+        query = query.where(Message.message_id < bound)
+    if after_id is not None:
+        query = query.where(Message.message_id > after_id).order_by(Message.message_id.asc())
+    else:
+        if before_id is not None:
+            query = query.where(Message.message_id < before_id)
+        query = query.order_by(Message.message_id.desc())
+    result = await db.execute(query.limit(limit + 1))
+    messages = [
+        MessageResponse(
+            message_id=msg.message_id,
+            chat_id=msg.chat_id,
+            user_id=msg.user_id,
+            username=msg.user.username,
+            content=msg.content,
+            created_at=msg.created_at
+        )
+        for msg in result.scalars().all()
+    ]
+
+    # Старые месяцы отсоединены и лежат в архиве: дочитываем его, только если
+    # страница уходит за границу живой таблицы
+    bounds = await asyncio.to_thread(archive_bounds, chat_id)
+    if bounds is not None:
+        if after_id is not None and after_id < bounds[1]:
+            archived = await _read_archived(db, chat_id, None, after_id, limit + 1)
+            messages = (archived + messages)[:limit + 1]
+        elif after_id is None and len(messages) <= limit:
+            boundary = messages[-1].message_id if messages else before_id
+            if boundary is None or boundary > bounds[0]:
+                messages += await _read_archived(db, chat_id, boundary, None, limit + 1 - len(messages))
+
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if after_id is None:
+        messages.reverse()
+
+    next_cursor = _history_cursor([msg.message_id for msg in messages], after_id, has_more)
+
+    return MessageHistoryResponse(
+        messages=messages,
+        next_cursor=next_cursor,
+        limit=limit,
     )
-    messages = result.scalars().all()
 
+async def _read_archived(
+    db: AsyncSession, chat_id: int, before_id: Optional[int], after_id: Optional[int], limit: int
+) -> list:
+    rows = await asyncio.to_thread(read_archive, chat_id, before_id, after_id, limit)
+    if not rows:
+        return []
+    result = await db.execute(
+        select(User.user_id, User.username).where(User.user_id.in_({row["user_id"] for row in rows}))
+    )
+    usernames = dict(result.all())
     return [
-        {
-            "message_id": msg.message_id,
-            "chat_id": msg.chat_id,
-            "user_id": msg.user_id,
-            "username": msg.user.username,
-            "content": msg.content,
-            "created_at": msg.created_at
-        }
-        for msg in messages
-    ]
\ No newline at end of file
+        MessageResponse(**row, username=usernames.get(row["user_id"], ""))
+        for row in rows
+    ]
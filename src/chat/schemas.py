@@ -11,22 +11,49 @@ class ChatCreate(BaseModel):
 class ChatInvite(BaseModel):
     user_id: int = Field(...)
 
+class ChatBulkInvite(BaseModel):
+    user_ids: List[int] = Field(..., min_length=1, max_length=1000)
+
 class MessageCreate(BaseModel):
     content: str = Field("", min_length=1, max_length=2000)
 
+class ChatRead(BaseModel):
+    message_id: Optional[int] = Field(None, description="Последнее прочитанное сообщение; по умолчанию — последнее в чате")
+
 # Схемы ответов
 
 class ChatInfo(BaseModel):
     chat_id: int = Field(..., description="Уникальный идентификатор чата")
     chat_name: str = Field(..., description="Название чата")
-    creator_id: int = Field(..., description="Идентификатор пользователя, создавшего чат")
+    creator_id: Optional[int] = Field(None, description="Идентификатор пользователя, создавшего чат")
     member_count: Optional[int] = None
+    unread_count: Optional[int] = None
+    last_read_message_id: Optional[int] = None
+    last_message_id: Optional[int] = None
+    last_message_user_id: Optional[int] = None
+    last_message_preview: Optional[str] = None
+    last_activity_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True  
 
+class ChatBulkInviteResponse(BaseModel):
+    added_ids: List[int] = Field(..., description="Пользователи, добавленные в чат")
+    rejected_ids: List[int] = Field(..., description="Несуществующие пользователи и уже состоящие в чате")
+
+class ChatPresenceResponse(BaseModel):
+    chat_id: int = Field(..., description="Идентификатор чата")
+    online_user_ids: List[int] = Field(..., description="Пользователи, подключенные к чату")
+    typing_user_ids: List[int] = Field(..., description="Пользователи, набирающие сообщение")
+
+class ChatReadResponse(BaseModel):
+    chat_id: int = Field(..., description="Идентификатор чата")
+    last_read_message_id: Optional[int] = Field(None, description="Последнее прочитанное сообщение")
+    unread_count: int = Field(..., description="Количество непрочитанных сообщений")
+
 class ChatListResponse(BaseModel):
     chats: List[ChatInfo] = Field(..., description="Список чатов, в которых состоит пользователь")
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы")
 
 class MessageResponse(BaseModel):
     message_id: int = Field(..., description="Уникальный идентификатор сообщения")
@@ -41,9 +68,16 @@ class MessageResponse(BaseModel):
 
 class MessageHistoryResponse(BaseModel):
     messages: List[MessageResponse] = Field(..., description="Список полученных сообщений, обычно от старых к новым в списке")
-    total_messages: int = Field(..., description="Общее количество сообщений в чате")
-    skip: int = Field(..., description="Количество пропущенных сообщений (смещение)")
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы в том же направлении, если она есть")
     limit: int = Field(..., description="Максимальное количество сообщений, возвращенных в этом ответе")
 
     class Config:
-        from_attributes = True  
\ No newline at end of file
+        from_attributes = True  
+
+class MessageSearchHit(MessageResponse):
+    rank: float = Field(..., description="Релевантность сообщения запросу")
+
+class MessageSearchResponse(BaseModel):
+    messages: List[MessageSearchHit] = Field(..., description="Найденные сообщения по убыванию релевантности")
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы")
+    limit: int = Field(..., description="Максимальное количество сообщений на странице")
\ No newline at end of file
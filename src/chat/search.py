@@ -0,0 +1,62 @@
+from typing import List, Optional, Tuple
+from sqlalchemy import func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import joinedload
+from src.core.config import settings
+from src.core.search import search_query
+from src.db.models import ChatMember, Message
+
+async def search_messages(
+    db: AsyncSession,
+    q: str,
+    limit: int,
+    chat_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    after: Optional[Tuple[float, int, int]] = None,
+) -> Tuple[List[Tuple[Message, float]], Optional[int]]:
+    """Сообщения по убыванию (rank, message_id), на одно больше limit, и верхняя граница окна.
+
+    ts_rank считается только для CHAT_SEARCH_CANDIDATES самых свежих
+    совпадений. Сам GIN-индекс при этом всё равно отдаёт все совпадения
+    bitmap-сканом, так что частые слова остаются дороже редких; ограничение
+    экономит только ранжирование и сортировку. Окно кандидатов фиксируется
+    на первой странице: курсор (rank, message_id, верх окна) несёт границу
+    message_id <= верх окна, и она входит в индексный запрос, поэтому новые
+    сообщения не сдвигают окно между страницами.
+    """
+    tsquery = search_query(q)
+    candidates = (
+        select(
+            Message.message_id,
+            func.ts_rank(Message.search_vector, tsquery).label("rank"),
+        )
+        .where(Message.search_vector.op("@@")(tsquery))
+    )
+    if after is not None:
+        candidates = candidates.where(Message.message_id <= after[2])
+    if chat_id is not None:
+        candidates = candidates.where(Message.chat_id == chat_id)
+    if user_id is not None:
+        candidates = candidates.where(
+            Message.chat_id.in_(select(ChatMember.chat_id).where(ChatMember.user_id == user_id))
+        )
+    candidates = (
+        candidates
+        .order_by(Message.message_id.desc())
+        .limit(settings.CHAT_SEARCH_CANDIDATES)
+        .subquery()
+    )
+
+    query = (
+        select(Message, candidates.c.rank, func.max(candidates.c.message_id).over().label("window_top"))
+        .join(candidates, Message.message_id == candidates.c.message_id)
+        .options(joinedload(Message.user))
+    )
+    if after is not None:
+        query = query.where(tuple_(candidates.c.rank, Message.message_id) < tuple_(after[0], after[1]))
+    query = query.order_by(candidates.c.rank.desc(), Message.message_id.desc()).limit(limit + 1)
+    result = await db.execute(query)
+    rows = result.all()
+    window_top = after[2] if after is not None else (rows[0].window_top if rows else None)
+    return [(message, rank) for message, rank, _ in rows], window_top
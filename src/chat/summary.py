@@ -0,0 +1,172 @@
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import and_, func, true, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import aliased
+from src.core.config import settings
+from src.db.database import get_redis
+from src.db.models import Chat, ChatMember, Message
+
+logger = logging.getLogger(__name__)
+
+# Сводка чата для списка чатов хранится в хэше chat:{id}:summary. Сводка
+# считается полной, только если в ней есть member_count: обновления по
+# сообщениям могут создать хэш частично, и такой хэш перечитывается из БД.
+
+SUMMARY_FIELDS = (
+    "member_count", "last_message_id", "last_message_user_id",
+    "last_message_preview", "last_activity_at",
+)
+
+# Увеличивает число участников только в уже заполненной сводке
+_ADD_MEMBERS = """
+if redis.call('HEXISTS', KEYS[1], 'member_count') == 1 then
+    return redis.call('HINCRBY', KEYS[1], 'member_count', ARGV[1])
+end
+return nil
+"""
+
+def summary_key(chat_id: int) -> str:
+    return f"chat:{chat_id}:summary"
+
+def preview(content: str) -> str:
+    return content[:settings.CHAT_PREVIEW_LENGTH]
+
+def queue_summary_update(pipe, chat_id: int, user_id: int, message_id: int, content: str, created_at: str) -> None:
+    """Добавляет в конвейер Redis обновление сводки для нового сообщения."""
+    pipe.hset(summary_key(chat_id), mapping={
+        "last_message_id": message_id,
+        "last_message_user_id": user_id,
+        "last_message_preview": preview(content),
+        "last_activity_at": created_at,
+    })
+    pipe.expire(summary_key(chat_id), settings.CHAT_SUMMARY_TTL)
+
+async def add_summary_members(chat_id: int, count: int) -> None:
+    redis_client = await get_redis()
+    if not redis_client:
+        return
+    try:
+        await redis_client.eval(_ADD_MEMBERS, 1, summary_key(chat_id), count)
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении сводки чата в Redis: {e}")
+
+def _summary_query(user_id: int):
+    """Список чатов пользователя со сводками одним запросом (LATERAL-подзапросы)."""
+    members = aliased(ChatMember)
+    member_count = (
+        select(func.count().label("member_count"))
+        .where(members.chat_id == Chat.chat_id)
+        .lateral("member_count")
+    )
+    last_message = (
+        select(
+            Message.message_id.label("last_message_id"),
+            Message.user_id.label("last_message_user_id"),
+            func.substr(Message.content, 1, settings.CHAT_PREVIEW_LENGTH).label("last_message_preview"),
+            Message.created_at.label("last_message_at"),
+        )
+        .where(Message.chat_id == Chat.chat_id)
+        .order_by(Message.message_id.desc())
+        .limit(1)
+        .lateral("last_message")
+    )
+    last_activity = Chat.last_activity_at.label("last_activity_at")
+    query = (
+        select(
+            Chat.chat_id,
+            Chat.chat_name,
+            Chat.creator_id,
+            member_count.c.member_count,
+            last_message.c.last_message_id,
+            last_message.c.last_message_user_id,
+            last_message.c.last_message_preview,
+            last_activity,
+        )
+        .join(ChatMember, and_(ChatMember.chat_id == Chat.chat_id, ChatMember.user_id == user_id))
+        .join(member_count, true())
+        .outerjoin(last_message, true())
+    )
+    return query
+
+async def query_summaries(db: AsyncSession, user_id: int, chat_ids: Iterable[int]) -> List[dict]:
+    query = _summary_query(user_id).where(Chat.chat_id.in_(list(chat_ids)))
+    result = await db.execute(query)
+    return [dict(row._mapping) for row in result.all()]
+
+async def cache_summaries(rows: List[dict]) -> None:
+    redis_client = await get_redis()
+    if not redis_client or not rows:
+        return
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for row in rows:
+                mapping = {
+                    field: (row[field].isoformat() if isinstance(row[field], datetime) else row[field])
+                    for field in SUMMARY_FIELDS
+                    if row[field] is not None
+                }
+                pipe.hset(summary_key(row["chat_id"]), mapping=mapping)
+                pipe.expire(summary_key(row["chat_id"]), settings.CHAT_SUMMARY_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logger.error(f"Ошибка при записи сводок чатов в Redis: {e}")
+
+async def cached_summaries(chat_ids: List[int]) -> Optional[Dict[int, dict]]:
+    """Полные сводки из Redis; None, если Redis недоступен."""
+    redis_client = await get_redis()
+    if not redis_client:
+        return None
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for chat_id in chat_ids:
+                pipe.hgetall(summary_key(chat_id))
+            results = await pipe.execute()
+    except Exception as e:
+        logger.error(f"Ошибка при чтении сводок чатов из Redis: {e}")
+        return None
+
+    summaries = {}
+    for chat_id, summary in zip(chat_ids, results):
+        if "member_count" not in summary or "last_activity_at" not in summary:
+            continue
+        summaries[chat_id] = {
+            "member_count": int(summary["member_count"]),
+            "last_message_id": int(summary["last_message_id"]) if "last_message_id" in summary else None,
+            "last_message_user_id": int(summary["last_message_user_id"]) if "last_message_user_id" in summary else None,
+            "last_message_preview": summary.get("last_message_preview"),
+            "last_activity_at": datetime.fromisoformat(summary["last_activity_at"]),
+        }
+    return summaries
+
+async def list_summaries(db: AsyncSession, user_id: int, after: Optional[tuple], limit: int) -> List[dict]:
+    """Страница списка чатов по убыванию последней активности (limit + 1 строка).
+
+    Порядок, keyset-граница (last_activity_at, chat_id) и LIMIT применяются в
+    SQL по chats.last_activity_at, поэтому читается только сама страница.
+    Сводки страницы берутся из Redis, а агрегирующий запрос выполняется
+    только для чатов страницы, которых нет в кэше.
+    """
+    query = (
+        select(Chat.chat_id, Chat.chat_name, Chat.creator_id, Chat.last_activity_at)
+        .join(ChatMember, and_(ChatMember.chat_id == Chat.chat_id, ChatMember.user_id == user_id))
+    )
+    if after is not None:
+        query = query.where(tuple_(Chat.last_activity_at, Chat.chat_id) < tuple_(*after))
+    query = query.order_by(Chat.last_activity_at.desc(), Chat.chat_id.desc()).limit(limit + 1)
+    result = await db.execute(query)
+    page = [dict(row._mapping) for row in result.all()]
+    if not page:
+        return []
+
+    chat_ids = [row["chat_id"] for row in page]
+    summaries = await cached_summaries(chat_ids) or {}
+    missing = [chat_id for chat_id in chat_ids if chat_id not in summaries]
+    if missing:
+        rows = await query_summaries(db, user_id, missing)
+        await cache_summaries(rows)
+        summaries.update({row["chat_id"]: row for row in rows})
+    # last_activity_at страницы — из БД: по нему строится курсор
+    return [{**summaries.get(row["chat_id"], {}), **row} for row in page]
@@ -0,0 +1,306 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from src.core import metrics
+from src.core.config import settings
+from src.db.database import async_session, get_redis
+from src.db.models import Chat, ChatMember, Message
+
+logger = logging.getLogger(__name__)
+
+# Непрочитанные считаются без сканирования messages:
+#   chats.message_count          — сколько сообщений записано в чат (растёт
+#                                  вместе с записью пачки сообщений);
+#   chat_members.read_count      — значение message_count на момент прочтения;
+#   chat:{id}:counters           — count (копия message_count) и last_id;
+#   user:{uid}:read_count        — chat_id -> значение count на момент прочтения;
+#   user:{uid}:last_read         — chat_id -> последний прочитанный message_id.
+# Непрочитанных = count - read. count в Redis — копия message_count из БД:
+# после каждой записанной пачки в него переносится значение, которое вернула
+# та же транзакция, поэтому count учитывает только зафиксированные сообщения,
+# никогда не убегает вперёд БД, а заполненный из БД хэш догоняет все пачки,
+# включая ещё стоявшие в очереди записи. Отметки прочтения (и продвижение
+# read отправителя) попадают в множество chat:last_read:dirty и периодически
+# сохраняются в chat_members. Все ключи живут CHAT_UNREAD_TTL с последней
+# записи и после истечения заново заполняются из БД.
+
+DIRTY_KEY = "chat:last_read:dirty"
+
+# Продвигает отметку прочтения отправителя на число его сообщений, только если она уже есть
+_ADVANCE_READ = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    return redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+end
+return nil
+"""
+
+# count и last_id только растут: пачки разных воркеров приходят в любом порядке
+_RAISE_COUNT = """
+local count = redis.call('HGET', KEYS[1], 'count')
+if not count or tonumber(ARGV[1]) > tonumber(count) then
+    redis.call('HSET', KEYS[1], 'count', ARGV[1])
+end
+local last_id = redis.call('HGET', KEYS[1], 'last_id')
+if not last_id or tonumber(ARGV[2]) > tonumber(last_id) then
+    redis.call('HSET', KEYS[1], 'last_id', ARGV[2])
+end
+"""
+
+def meta_key(chat_id: int) -> str:
+    return f"chat:{chat_id}:counters"
+
+def read_key(user_id: int) -> str:
+    return f"user:{user_id}:read_count"
+
+def last_read_key(user_id: int) -> str:
+    return f"user:{user_id}:last_read"
+
+def _queue_user_ttl(pipe, user_id: int) -> None:
+    # Оба хэша пользователя продлеваются вместе, чтобы не истекать по одному
+    pipe.expire(read_key(user_id), settings.CHAT_UNREAD_TTL)
+    pipe.expire(last_read_key(user_id), settings.CHAT_UNREAD_TTL)
+
+async def record_written(rows: list, totals: Dict[int, Tuple[int, int]]) -> None:
+    """Переносит в Redis счётчики после записи пачки сообщений.
+
+    totals — chat_id -> (message_count, наибольший message_id) сразу после
+    транзакции, записавшей rows. Ошибки только логируются: пачка уже в БД, и
+    повтор её записи недопустим.
+    """
+    redis_client = await get_redis()
+    if not redis_client:
+        return
+    sent = Counter((row["user_id"], row["chat_id"]) for row in rows)
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for chat_id, (count, last_id) in totals.items():
+                pipe.eval(_RAISE_COUNT, 1, meta_key(chat_id), count, last_id)
+                pipe.expire(meta_key(chat_id), settings.CHAT_UNREAD_TTL)
+            for (user_id, chat_id), count in sent.items():
+                pipe.eval(_ADVANCE_READ, 1, read_key(user_id), chat_id, count)
+                pipe.sadd(DIRTY_KEY, f"{chat_id}:{user_id}")
+            for user_id in {user_id for user_id, _ in sent}:
+                _queue_user_ttl(pipe, user_id)
+            await pipe.execute()
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении счетчиков непрочитанных в Redis: {e}")
+
+async def _read_position(db: AsyncSession, chat_id: int, message_id: int) -> Tuple[int, int]:
+    """(сообщений после message_id, message_count) из одного снимка БД.
+
+    Оба числа учитывают одни и те же зафиксированные пачки, поэтому сообщение,
+    записанное позже снимка, при любом id попадёт в непрочитанные через рост
+    count, а не потеряется между ними.
+    """
+    after = select(func.count()).select_from(Message).where(
+        Message.chat_id == chat_id, Message.message_id > message_id
+    ).scalar_subquery()
+    row = (await db.execute(select(Chat.message_count, after).where(Chat.chat_id == chat_id))).one_or_none()
+    return (row[1], row[0]) if row else (0, 0)
+
+async def _last_message_id(db: AsyncSession, chat_id: int) -> Optional[int]:
+    return (await db.execute(
+        select(func.max(Message.message_id)).where(Message.chat_id == chat_id)
+    )).scalar_one()
+
+async def unread_counts(user_id: int, chat_ids: Iterable[int], db: AsyncSession) -> Dict[int, Tuple[int, Optional[int]]]:
+    """Непрочитанные и последний прочитанный message_id по каждому чату.
+
+    Обычно это один конвейер Redis на все чаты; для чатов, по которым у
+    пользователя ещё нет отметки в Redis, — один сгруппированный запрос к
+    chats и chat_members, без обращения к messages.
+    """
+    chat_ids = list(chat_ids)
+    if not chat_ids:
+        return {}
+    counts = reads = last_reads = [None] * len(chat_ids)
+    redis_client = await get_redis()
+    if redis_client:
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for chat_id in chat_ids:
+                    pipe.hget(meta_key(chat_id), "count")
+                pipe.hmget(read_key(user_id), chat_ids)
+                pipe.hmget(last_read_key(user_id), chat_ids)
+                results = await pipe.execute()
+            counts = results[:len(chat_ids)]
+            reads, last_reads = results[len(chat_ids)], results[len(chat_ids) + 1]
+        except Exception as e:
+            logger.error(f"Ошибка при чтении счетчиков непрочитанных из Redis: {e}")
+            redis_client = None
+
+    unread: Dict[int, Tuple[int, Optional[int]]] = {}
+    cold = []
+    for index, chat_id in enumerate(chat_ids):
+        if redis_client and counts[index] is not None and reads[index] is not None:
+            last_read = last_reads[index]
+            unread[chat_id] = (
+                max(0, int(counts[index]) - int(reads[index])),
+                int(last_read) if last_read is not None else None,
+            )
+        else:
+            cold.append(chat_id)
+    if not cold:
+        return unread
+
+    metrics.inc("chat.unread.cold", len(cold))
+    result = await db.execute(
+        select(Chat.chat_id, Chat.message_count, ChatMember.read_count, ChatMember.last_read_message_id)
+        .join(ChatMember, ChatMember.chat_id == Chat.chat_id)
+        .where(ChatMember.user_id == user_id, Chat.chat_id.in_(cold))
+    )
+    stored = {row.chat_id: row for row in result.all()}
+    for chat_id in cold:
+        row = stored.get(chat_id)
+        unread[chat_id] = (max(0, row.message_count - row.read_count), row.last_read_message_id) if row else (0, None)
+
+    if redis_client and stored:
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for row in stored.values():
+                    pipe.hsetnx(meta_key(row.chat_id), "count", row.message_count)
+                    pipe.expire(meta_key(row.chat_id), settings.CHAT_UNREAD_TTL)
+                    pipe.hsetnx(read_key(user_id), row.chat_id, row.read_count)
+                    if row.last_read_message_id is not None:
+                        pipe.hsetnx(last_read_key(user_id), row.chat_id, row.last_read_message_id)
+                _queue_user_ttl(pipe, user_id)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Ошибка при записи счетчиков непрочитанных в Redis: {e}")
+    return unread
+
+async def _mark_read_db(user_id: int, chat_id: int, message_id: Optional[int], db: AsyncSession) -> Tuple[int, Optional[int]]:
+    if message_id is None:
+        message_id = await _last_message_id(db, chat_id)
+    remaining, message_count = await _read_position(db, chat_id, message_id or 0)
+    await db.execute(
+        update(ChatMember)
+        .where(ChatMember.chat_id == chat_id, ChatMember.user_id == user_id)
+        .values(last_read_message_id=message_id, read_count=max(0, message_count - remaining))
+    )
+    await db.commit()
+    return remaining, message_id
+
+async def mark_read(user_id: int, chat_id: int, message_id: Optional[int], db: AsyncSession) -> Tuple[int, Optional[int]]:
+    """Отмечает чат прочитанным до message_id (по умолчанию — до последнего сообщения)."""
+    redis_client = await get_redis()
+    if not redis_client:
+        return await _mark_read_db(user_id, chat_id, message_id, db)
+    try:
+        count, last_id = await redis_client.hmget(meta_key(chat_id), ["count", "last_id"])
+    except Exception as e:
+        logger.error(f"Ошибка при чтении счетчиков непрочитанных из Redis: {e}")
+        return await _mark_read_db(user_id, chat_id, message_id, db)
+
+    if message_id is None:
+        message_id = int(last_id) if last_id is not None else await _last_message_id(db, chat_id)
+    if count is not None and last_id is not None and message_id is not None and message_id >= int(last_id):
+        # count и last_id взяты из одного снимка БД: все учтённые сообщения не новее last_id
+        remaining, count = 0, int(count)
+    else:
+        remaining, count = await _read_position(db, chat_id, message_id or 0)
+
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hsetnx(meta_key(chat_id), "count", count)
+            pipe.expire(meta_key(chat_id), settings.CHAT_UNREAD_TTL)
+            pipe.hset(read_key(user_id), chat_id, max(0, count - remaining))
+            if message_id is not None:
+                pipe.hset(last_read_key(user_id), chat_id, message_id)
+            pipe.sadd(DIRTY_KEY, f"{chat_id}:{user_id}")
+            _queue_user_ttl(pipe, user_id)
+            await pipe.execute()
+    except Exception as e:
+        logger.error(f"Ошибка при записи отметки прочтения в Redis: {e}")
+        return await _mark_read_db(user_id, chat_id, message_id, db)
+    return remaining, message_id
+
+class LastReadPersister:
+    """Периодически переносит отметки прочтения и read_count из Redis в chat_members."""
+
+    def __init__(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении отметок прочтения: {e}")
+
+    async def flush(self) -> None:
+        redis_client = await get_redis()
+        if not redis_client:
+            return
+        while True:
+            members = await redis_client.spop(DIRTY_KEY, self.batch_size)
+            if not members:
+                return
+            pairs = [tuple(int(part) for part in member.split(":")) for member in members]
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for chat_id, user_id in pairs:
+                    pipe.hget(last_read_key(user_id), chat_id)
+                    pipe.hget(read_key(user_id), chat_id)
+                values = await pipe.execute()
+            # Отметки может не быть, если read продвинули только свои сообщения
+            rows = [
+                {
+                    "b_chat_id": chat_id,
+                    "b_user_id": user_id,
+                    "b_last_read": int(last_read) if last_read is not None else None,
+                    "b_read_count": int(read),
+                }
+                for (chat_id, user_id), last_read, read in zip(pairs, values[::2], values[1::2])
+                if read is not None
+            ]
+            if not rows:
+                continue
+            try:
+                async with async_session() as db:
+                    await db.execute(
+                        update(ChatMember.__table__)
+                        .where(
+                            ChatMember.__table__.c.chat_id == bindparam("b_chat_id"),
+                            ChatMember.__table__.c.user_id == bindparam("b_user_id"),
+                        )
+                        .values(
+                            last_read_message_id=func.coalesce(
+                                bindparam("b_last_read"), ChatMember.__table__.c.last_read_message_id
+                            ),
+                            read_count=bindparam("b_read_count"),
+                        ),
+                        rows,
+                    )
+                    await db.commit()
+                metrics.inc("chat.unread.persisted", len(rows))
+            except Exception:
+                # Вернём отметки в очередь, чтобы сохранить их в следующий раз
+                await redis_client.sadd(DIRTY_KEY, *members)
+                raise
+
+last_read_persister = LastReadPersister(
+    interval=settings.CHAT_LAST_READ_FLUSH_INTERVAL,
+    batch_size=settings.CHAT_LAST_READ_FLUSH_BATCH,
+)
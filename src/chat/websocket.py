@@ -1,24 +1,317 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Dict, List, Optional, Set
 from fastapi import WebSocket
-from redis.asyncio import Redis
+from src.chat.protocol import PING_EVENT, encode_frame
+from src.core import metrics
 from src.core.config import settings
+from src.db.database import get_redis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "chat:events:"
+
+# Метрики с суффиксом .{chat_id} ведутся только для чатов с локальными
+# сокетами и удаляются, когда уходит последний сокет чата, поэтому их число
+# следует за живыми чатами. Агрегаты без суффикса копятся за всё время.
+CHAT_METRICS = ("chat.delivery_latency", "chat.dropped_stalled", "chat.dropped_failed", "chat.dropped_overflow")
+
+def chat_channel(chat_id: int) -> str:
+    return f"{CHANNEL_PREFIX}{chat_id}"
+
+class ChatConnection:
+    """Сокет участника чата с собственной ограниченной очередью отправки.
+
+    Рассылка только кладёт сообщение в очередь, а отправкой занимается
+    отдельная задача-писатель, поэтому медленный клиент не задерживает
+    остальных. При переполнении очереди или зависании отправки дольше
+    CHAT_SEND_TIMEOUT соединение закрывается. В бинарном режиме сообщения,
+    накопившиеся за CHAT_COALESCE_WINDOW, уходят одним кадром. last_seen —
+    время последнего кадра от клиента; по нему брокер пингует и закрывает
+    молчащие сокеты бинарного протокола.
+    """
+
+    def __init__(
+        self,
+        chat_id: int,
+        user_id: int,
+        websocket: WebSocket,
+        broker: "ChatBroker",
+        binary: bool = False,
+    ):
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.websocket = websocket
+        self.broker = broker
+        self.binary = binary
+        self.known_users: Dict[int, str] = {}
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.CHAT_SEND_QUEUE_SIZE)
+        self.closed = False
+        self.last_seen = time.monotonic()
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def touch(self) -> None:
+        self.last_seen = time.monotonic()
+
+    def enqueue(self, message: str) -> bool:
+        try:
+            self.queue.put_nowait((time.monotonic(), message))
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def put(self, message: str) -> None:
+        """Постановка в очередь с ожиданием — для начальной выдачи истории."""
+        await asyncio.wait_for(
+            self.queue.put((time.monotonic(), message)), timeout=settings.CHAT_SEND_TIMEOUT
+        )
+
+    async def _write_loop(self) -> None:
+        try:
+            while True:
+                batch = [await self.queue.get()]
+                if self.binary:
+                    await asyncio.sleep(settings.CHAT_COALESCE_WINDOW)
+                    while not self.queue.empty() and len(batch) < settings.CHAT_COALESCE_MAX:
+                        batch.append(self.queue.get_nowait())
+                    frame = encode_frame((message for _, message in batch), self.known_users)
+                    send = self.websocket.send_bytes(frame)
+                else:
+                    send = self.websocket.send_text(batch[0][1])
+                await asyncio.wait_for(send, timeout=settings.CHAT_SEND_TIMEOUT)
+                sent_at = time.monotonic()
+                for enqueued_at, _ in batch:
+                    self.broker.observe_chat(self.chat_id, "chat.delivery_latency", sent_at - enqueued_at)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self.broker.count_chat(self.chat_id, "chat.dropped_stalled")
+            self.broker.evict(self, "Превышено время отправки")
+        except Exception as e:
+            logger.warning(f"Не удалось отправить сообщение в чат {self.chat_id}: {e}")
+            self.broker.count_chat(self.chat_id, "chat.dropped_failed")
+            self.broker.evict(self, "Ошибка отправки")
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        if self.closed:
+            return
+        self.closed = True
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code, reason=reason), timeout=settings.CHAT_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+class ChatBroker:
+    """Рассылка сообщений чата между воркерами через Redis pub/sub.
+
+    Каждое сообщение публикуется в канал своего чата, а в каждом воркере
+    работает одна задача-подписчик. Она подписана только на каналы чатов,
+    у которых в этом воркере есть сокеты: SUBSCRIBE при первом локальном
+    сокете чата и UNSUBSCRIBE после последнего, так что трафик чужих чатов
+    в воркер не приходит. Своим сокетам воркер доставляет сообщение сразу,
+    а копию со своей меткой из Redis пропускает. Без Redis брокер работает
+    как локальная замена и доставляет сообщения только сокетам текущего
+    процесса.
+
+    Живость JSON-клиентов проверяет сервер на уровне протокола WebSocket
+    (ping/pong uvicorn, WS_PING_INTERVAL и WS_PING_TIMEOUT): обрыв приходит
+    в цикл приёма как отключение, а в поток сообщений не попадают чужие
+    кадры. Прикладной {"event": "ping"} понимают только клиенты бинарного
+    подпротокола: фоновая задача раз в CHAT_PING_INTERVAL пингует такие
+    сокеты и закрывает те, от которых ничего не приходило дольше
+    CHAT_IDLE_TIMEOUT.
+    """
 
-class ConnectionManager:
     def __init__(self):
-        self.active_connections: list[WebSocket] = []
-        self.redis = Redis.from_url(settings.REDIS_URL)
+        self.local_connections: Dict[int, List[ChatConnection]] = {}
+        self.user_connections: Dict[int, int] = {}
+        self.connection_count = 0
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._reaper: Optional[asyncio.Task] = None
+        self._subscribed = False
+        # Чаты, на каналы которых подписчик уже подписан, и сигнал об изменении набора чатов
+        self._channels: Set[int] = set()
+        self._channels_changed = asyncio.Event()
+        self._origin = uuid.uuid4().hex
+        # Задачи закрытия вытесненных сокетов: ссылка нужна, чтобы их не собрал GC
+        self._closing: Set[asyncio.Task] = set()
+
+    def check_limits(self, user_id: int) -> Optional[str]:
+        """Причина отказа, если новый сокет превысит лимиты процесса или пользователя."""
+        if self.connection_count >= settings.CHAT_MAX_CONNECTIONS:
+            metrics.inc("chat.connections_rejected.process")
+            return "Превышено число соединений сервера"
+        if self.user_connections.get(user_id, 0) >= settings.CHAT_MAX_CONNECTIONS_PER_USER:
+            metrics.inc("chat.connections_rejected.user")
+            return "Превышено число соединений пользователя"
+        return None
+
+    def _update_gauges(self, chat_id: int) -> None:
+        metrics.set_gauge("chat.connections", self.connection_count)
+        metrics.set_gauge("chat.active_chats", len(self.local_connections))
+        # Датчик чата снимается вместе с последним сокетом, как и CHAT_METRICS
+        connections = self.local_connections.get(chat_id)
+        if connections:
+            metrics.set_gauge(f"chat.connections.{chat_id}", len(connections))
+        else:
+            metrics.clear_gauge(f"chat.connections.{chat_id}")
+
+    def count_chat(self, chat_id: int, name: str) -> None:
+        metrics.inc(name)
+        if chat_id in self.local_connections:
+            metrics.inc(f"{name}.{chat_id}")
+
+    def observe_chat(self, chat_id: int, name: str, seconds: float) -> None:
+        metrics.observe(name, seconds)
+        if chat_id in self.local_connections:
+            metrics.observe(f"{name}.{chat_id}", seconds)
+
+    def connect(self, chat_id: int, user_id: int, websocket: WebSocket, binary: bool = False) -> ChatConnection:
+        connection = ChatConnection(chat_id, user_id, websocket, self, binary=binary)
+        connection.start()
+        if chat_id not in self.local_connections:
+            self.local_connections[chat_id] = []
+            self._channels_changed.set()
+        self.local_connections[chat_id].append(connection)
+        self.user_connections[user_id] = self.user_connections.get(user_id, 0) + 1
+        self.connection_count += 1
+        self._update_gauges(chat_id)
+        return connection
+
+    def disconnect(self, connection: ChatConnection) -> None:
+        connections = self.local_connections.get(connection.chat_id)
+        if connections and connection in connections:
+            connections.remove(connection)
+            if not connections:
+                del self.local_connections[connection.chat_id]
+                self._channels_changed.set()
+                metrics.remove(f"{name}.{connection.chat_id}" for name in CHAT_METRICS)
+            self.connection_count -= 1
+            self.user_connections[connection.user_id] -= 1
+            if not self.user_connections[connection.user_id]:
+                del self.user_connections[connection.user_id]
+            self._update_gauges(connection.chat_id)
+
+    def has_user(self, chat_id: int, user_id: int) -> bool:
+        return any(connection.user_id == user_id for connection in self.local_connections.get(chat_id, []))
+
+    def evict(self, connection: ChatConnection, reason: str, code: int = 1013) -> None:
+        logger.warning(f"Клиент отключен от чата {connection.chat_id}: {reason}")
+        self.disconnect(connection)
+        task = asyncio.create_task(connection.close(code=code, reason=reason))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def publish(self, chat_id: int, message: str) -> None:
+        self.deliver_local(chat_id, message)
+        if self._subscribed:
+            redis_client = await get_redis()
+            if redis_client:
+                try:
+                    # Метка воркера: подписчик этого же воркера копию пропустит
+                    await redis_client.publish(chat_channel(chat_id), f"{self._origin}|{message}")
+                except Exception as e:
+                    logger.error(f"Ошибка при публикации сообщения в Redis: {e}")
+
+    def deliver_local(self, chat_id: int, message: str) -> None:
+        for connection in list(self.local_connections.get(chat_id, [])):
+            if not connection.enqueue(message):
+                self.count_chat(chat_id, "chat.dropped_overflow")
+                self.evict(connection, "Переполнена очередь отправки")
+
+    async def start(self) -> None:
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap())
+
+    async def stop(self) -> None:
+        for task in (self._listener, self._reaper):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._listener = self._reaper = None
+        await self._close_pubsub()
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+    async def _reap(self) -> None:
+        while True:
+            await asyncio.sleep(settings.CHAT_PING_INTERVAL)
+            now = time.monotonic()
+            for connections in list(self.local_connections.values()):
+                for connection in list(connections):
+                    if not connection.binary:
+                        continue
+                    idle = now - connection.last_seen
+                    if idle > settings.CHAT_IDLE_TIMEOUT:
+                        metrics.inc("chat.connections_reaped")
+                        self.evict(connection, "Нет ответа на ping", code=1001)
+                    elif idle >= settings.CHAT_PING_INTERVAL and not connection.enqueue(PING_EVENT):
+                        self.count_chat(connection.chat_id, "chat.dropped_overflow")
+                        self.evict(connection, "Переполнена очередь отправки")
 
-    async def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+    async def _close_pubsub(self) -> None:
+        self._subscribed = False
+        self._channels = set()
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.aclose()
+            except Exception as e:
+                logger.warning(f"Ошибка при закрытии подписки Redis: {e}")
+            self._pubsub = None
 
-    async def send_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+    async def _listen(self) -> None:
+        while True:
+            try:
+                redis_client = await get_redis()
+                if not redis_client:
+                    logger.warning("Redis недоступен, сообщения чата доставляются только локально")
+                    await asyncio.sleep(5)
+                    continue
+                await self._close_pubsub()
+                self._pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                self._subscribed = True
+                logger.info("Подписка на события чатов в Redis установлена")
+                while True:
+                    self._channels_changed.clear()
+                    await self._sync_channels()
+                    if not self._channels:
+                        await self._channels_changed.wait()
+                        continue
+                    # Таймаут ограничивает задержку подписки на канал нового чата
+                    event = await self._pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=settings.CHAT_SUBSCRIBE_POLL
+                    )
+                    if event is None or event["type"] != "message":
+                        continue
+                    origin, _, message = event["data"].partition("|")
+                    if origin != self._origin:
+                        self.deliver_local(int(event["channel"][len(CHANNEL_PREFIX):]), message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка подписки на события чатов: {e}")
+                await self._close_pubsub()
+                await asyncio.sleep(1)
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+    async def _sync_channels(self) -> None:
+        """Приводит подписки к набору чатов, у которых есть локальные сокеты."""
+        wanted = set(self.local_connections)
+        added, removed = wanted - self._channels, self._channels - wanted
+        if added:
+            await self._pubsub.subscribe(*(chat_channel(chat_id) for chat_id in added))
+        if removed:
+            await self._pubsub.unsubscribe(*(chat_channel(chat_id) for chat_id in removed))
+        self._channels = wanted
 
-manager = ConnectionManager()
\ No newline at end of file
+broker = ChatBroker()
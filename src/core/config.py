@@ -17,7 +17,63 @@ class Settings:
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379")
-    UPLOAD_DIR:  str = os.getenv("UPLOAD_DIR", "redis://localhost:6379")
+    UPLOAD_DIR:  str = os.getenv("UPLOAD_DIR", "uploads")
+    UPLOAD_CHUNK_SIZE: int = int(os.getenv("UPLOAD_CHUNK_SIZE", 64 * 1024))
+    UPLOAD_MAX_FILE_SIZE: int = int(os.getenv("UPLOAD_MAX_FILE_SIZE", 10 * 1024 * 1024))
+    UPLOAD_MAX_REQUEST_SIZE: int = int(os.getenv("UPLOAD_MAX_REQUEST_SIZE", 50 * 1024 * 1024))
+    UPLOAD_MAX_FIELD_SIZE: int = int(os.getenv("UPLOAD_MAX_FIELD_SIZE", 1024 * 1024))
+    BLOB_GC_INTERVAL: float = float(os.getenv("BLOB_GC_INTERVAL", 3600))
+    BLOB_GC_GRACE: float = float(os.getenv("BLOB_GC_GRACE", 3600))
+    BLOB_GC_BATCH: int = int(os.getenv("BLOB_GC_BATCH", 500))
+    MEDIA_CACHE_DIR: str = os.getenv("MEDIA_CACHE_DIR", "media_cache")
+    MEDIA_CACHE_MAX_BYTES: int = int(os.getenv("MEDIA_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+    MEDIA_WORKERS: int = int(os.getenv("MEDIA_WORKERS", 2))
+    MEDIA_QUALITY: int = int(os.getenv("MEDIA_QUALITY", 82))
+    STATIC_CACHE_SIZE: int = int(os.getenv("STATIC_CACHE_SIZE", 256))
+    STATIC_CACHE_TTL: float = float(os.getenv("STATIC_CACHE_TTL", 2))
+    SEARCH_MIN_LENGTH: int = int(os.getenv("SEARCH_MIN_LENGTH", 3))
+    PRINCIPAL_CACHE_SIZE: int = int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000))
+    PRINCIPAL_CACHE_TTL: int = int(os.getenv("PRINCIPAL_CACHE_TTL", 5))
+    PRINCIPAL_CACHE_REDIS_TTL: int = int(os.getenv("PRINCIPAL_CACHE_REDIS_TTL", 300))
+    AUTH_STATELESS_TOKENS: bool = os.getenv("AUTH_STATELESS_TOKENS", "false").lower() == "true"
+    CHAT_SEND_QUEUE_SIZE: int = int(os.getenv("CHAT_SEND_QUEUE_SIZE", 256))
+    CHAT_SEND_TIMEOUT: float = float(os.getenv("CHAT_SEND_TIMEOUT", 5))
+    CHAT_COALESCE_WINDOW: float = float(os.getenv("CHAT_COALESCE_WINDOW", 0.02))
+    CHAT_COALESCE_MAX: int = int(os.getenv("CHAT_COALESCE_MAX", 100))
+    CHAT_PING_INTERVAL: float = float(os.getenv("CHAT_PING_INTERVAL", 20))
+    CHAT_IDLE_TIMEOUT: float = float(os.getenv("CHAT_IDLE_TIMEOUT", 60))
+    CHAT_MAX_CONNECTIONS: int = int(os.getenv("CHAT_MAX_CONNECTIONS", 10000))
+    CHAT_MAX_CONNECTIONS_PER_USER: int = int(os.getenv("CHAT_MAX_CONNECTIONS_PER_USER", 8))
+    CHAT_SUBSCRIBE_POLL: float = float(os.getenv("CHAT_SUBSCRIBE_POLL", 0.1))
+    WS_PING_INTERVAL: float = float(os.getenv("WS_PING_INTERVAL", 20))
+    WS_PING_TIMEOUT: float = float(os.getenv("WS_PING_TIMEOUT", 20))
+    CHAT_PRESENCE_TTL: int = int(os.getenv("CHAT_PRESENCE_TTL", 30))
+    CHAT_TYPING_INTERVAL: float = float(os.getenv("CHAT_TYPING_INTERVAL", 3))
+    CHAT_LAST_READ_FLUSH_INTERVAL: float = float(os.getenv("CHAT_LAST_READ_FLUSH_INTERVAL", 30))
+    CHAT_LAST_READ_FLUSH_BATCH: int = int(os.getenv("CHAT_LAST_READ_FLUSH_BATCH", 500))
+    CHAT_UNREAD_TTL: int = int(os.getenv("CHAT_UNREAD_TTL", 604800))
+    CHAT_PREVIEW_LENGTH: int = int(os.getenv("CHAT_PREVIEW_LENGTH", 100))
+    CHAT_SUMMARY_TTL: int = int(os.getenv("CHAT_SUMMARY_TTL", 86400))
+    CHAT_SEARCH_CANDIDATES: int = int(os.getenv("CHAT_SEARCH_CANDIDATES", 1000))
+    CHAT_PARTITIONS_AHEAD: int = int(os.getenv("CHAT_PARTITIONS_AHEAD", 3))
+    CHAT_PARTITION_CHECK_INTERVAL: float = float(os.getenv("CHAT_PARTITION_CHECK_INTERVAL", 21600))
+    CHAT_ARCHIVE_DIR: str = os.getenv("CHAT_ARCHIVE_DIR", "archive/messages")
+    CHAT_ARCHIVE_AFTER_MONTHS: int = int(os.getenv("CHAT_ARCHIVE_AFTER_MONTHS", 12))
+    CHAT_WRITE_BATCH_SIZE: int = int(os.getenv("CHAT_WRITE_BATCH_SIZE", 500))
+    CHAT_WRITE_MAX_LINGER: float = float(os.getenv("CHAT_WRITE_MAX_LINGER", 0.05))
+    CHAT_WRITE_RETRIES: int = int(os.getenv("CHAT_WRITE_RETRIES", 3))
+    CHAT_WRITE_PENDING_TTL: int = int(os.getenv("CHAT_WRITE_PENDING_TTL", 60))
+    CHAT_STREAM_MAXLEN: int = int(os.getenv("CHAT_STREAM_MAXLEN", 1000))
+    CHAT_STREAM_TTL: int = int(os.getenv("CHAT_STREAM_TTL", 604800))
+    CHAT_REPLAY_DEFAULT: int = int(os.getenv("CHAT_REPLAY_DEFAULT", 10))
+    CHAT_REPLAY_LIMIT: int = int(os.getenv("CHAT_REPLAY_LIMIT", 500))
+    CHAT_MEMBERSHIP_CACHE_SIZE: int = int(os.getenv("CHAT_MEMBERSHIP_CACHE_SIZE", 50000))
+    CHAT_MEMBERSHIP_CACHE_TTL: int = int(os.getenv("CHAT_MEMBERSHIP_CACHE_TTL", 60))
+    CHAT_MEMBERSHIP_REDIS_TTL: int = int(os.getenv("CHAT_MEMBERSHIP_REDIS_TTL", 86400))
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", 12))
+    PASSWORD_HASH_EXECUTOR: str = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 32))
     @property
     def ASYNC_DATABASE_URL(self) -> str:
         password = quote(self.POSTGRES_PASSWORD) if self.POSTGRES_PASSWORD else ""
@@ -0,0 +1,49 @@
+from collections import defaultdict
+from typing import Dict, Iterable
+
+# Простые in-process метрики: счётчики, датчики и тайминги.
+# Значения локальны для воркера и отдаются через /admin/metrics.
+
+_counters: Dict[str, int] = defaultdict(int)
+_gauges: Dict[str, float] = {}
+_timings: Dict[str, Dict[str, float]] = {}
+
+def inc(name: str, value: int = 1) -> None:
+    _counters[name] += value
+
+def set_gauge(name: str, value: float) -> None:
+    _gauges[name] = value
+
+def clear_gauge(name: str) -> None:
+    _gauges.pop(name, None)
+
+def observe(name: str, seconds: float) -> None:
+    timing = _timings.get(name)
+    if timing is None:
+        timing = _timings[name] = {"count": 0, "total": 0.0, "max": 0.0}
+    timing["count"] += 1
+    timing["total"] += seconds
+    if seconds > timing["max"]:
+        timing["max"] = seconds
+
+def remove(names: Iterable[str]) -> None:
+    """Удаляет метрики по именам — для метрик, привязанных к объектам, которых больше нет."""
+    for name in names:
+        _counters.pop(name, None)
+        _gauges.pop(name, None)
+        _timings.pop(name, None)
+
+def ratio(hits: Iterable[str], misses: str) -> float:
+    hit_count = sum(_counters.get(name, 0) for name in hits)
+    total = hit_count + _counters.get(misses, 0)
+    return hit_count / total if total else 0.0
+
+def snapshot() -> dict:
+    return {
+        "counters": dict(_counters),
+        "gauges": dict(_gauges),
+        "timings": {
+            name: {**timing, "avg": timing["total"] / timing["count"] if timing["count"] else 0.0}
+            for name, timing in _timings.items()
+        },
+    }
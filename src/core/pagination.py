@@ -0,0 +1,20 @@
+import base64
+import json
+from fastapi import HTTPException
+
+# Непрозрачные курсоры для keyset-пагинации: список значений ключа
+# сортировки, упакованный в JSON и base64.
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps(list(values), default=str, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    if not isinstance(values, list):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    return values
@@ -0,0 +1,38 @@
+from typing import Sequence
+from sqlalchemy import cast, func, or_
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.sql.elements import ColumnElement
+
+# Поиск подстроки по колонкам с GIN-индексами pg_trgm. Индекс помогает ILIKE
+# только при шаблоне хотя бы из трёх символов, поэтому короче
+# SEARCH_MIN_LENGTH запросы не принимаются (проверяется в Query(min_length=...)).
+
+def escape_like(value: str) -> str:
+    """Экранирует спецсимволы LIKE, чтобы % и _ в запросе искались буквально."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def contains(column, value: str) -> ColumnElement:
+    return column.ilike(f"%{escape_like(value)}%", escape="\\")
+
+def matches(column, value: str, fuzzy: bool = False) -> ColumnElement:
+    """Подстрока; в ранжированном режиме ещё и похожие строки (оператор % pg_trgm)."""
+    if not fuzzy:
+        return contains(column, value)
+    return or_(contains(column, value), column.op("%")(value))
+
+def similarity(pairs: Sequence[tuple]) -> ColumnElement:
+    """Наибольшая триграммная близость по парам (колонка, запрос) — для сортировки."""
+    scores = [func.similarity(column, value) for column, value in pairs]
+    return scores[0] if len(scores) == 1 else func.greatest(*scores)
+
+# Полнотекстовый поиск. Интерфейс на русском, но пишут часто и по-английски,
+# поэтому колонки search_vector строятся сразу по двум конфигурациям.
+SEARCH_CONFIGS = ("russian", "english")
+
+def search_query(q: str):
+    """tsquery по обеим конфигурациям; websearch-синтаксис не падает на пользовательском вводе."""
+    query = None
+    for config in SEARCH_CONFIGS:
+        part = func.websearch_to_tsquery(cast(config, REGCONFIG), q)
+        query = part if query is None else query.op("||")(part)
+    return query
@@ -1,24 +1,41 @@
 from typing import Optional
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, TIMESTAMP
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, TIMESTAMP, Index, Computed, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 from src.db.database import Base
 from datetime import datetime
 from sqlalchemy import Enum as SAEnum
 from src.task.enums import TaskPriority, TaskStatus
+ARTICLE_SEARCH_VECTOR = (
+    "setweight(to_tsvector('russian'::regconfig, title), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, title), 'A') || "
+    "setweight(to_tsvector('russian'::regconfig, content), 'B') || "
+    "setweight(to_tsvector('english'::regconfig, content), 'B')"
+)
+
 # Пользователи
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_username_trgm", "username", postgresql_using="gin", postgresql_ops={"username": "gin_trgm_ops"}),
+        Index("ix_users_full_name_trgm", "full_name", postgresql_using="gin", postgresql_ops={"full_name": "gin_trgm_ops"}),
+        Index("ix_users_email_trgm", "email", postgresql_using="gin", postgresql_ops={"email": "gin_trgm_ops"}),
+    )
     user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
     username: Mapped[str] = mapped_column(String(50), unique=True, nullable=False)
     full_name: Mapped[str] = mapped_column(String(100), nullable=False)
     email: Mapped[str] = mapped_column(String(320), unique=True, index=True, nullable=False)
-    hashed_password: Mapped[str] = mapped_column(String(1024), nullable=False)
+    # Хэш нужен только при входе: обычные запросы его не загружают, а обращение
+    # к незагруженному полю сразу падает, а не уходит в ленивую загрузку
+    hashed_password: Mapped[str] = mapped_column(String(1024), nullable=False, deferred=True, deferred_raiseload=True)
     avatar: Mapped[str] = mapped_column(String(255), nullable=True)
     role_id: Mapped[int] = mapped_column(ForeignKey("roles.role_id"), default=1)
     registered_at: Mapped[datetime] = mapped_column(TIMESTAMP, default=func.now())
     is_deleted: Mapped[bool] = mapped_column(Boolean, default=False)
     deleted_at: Mapped[datetime] = mapped_column(TIMESTAMP, nullable=True)
+    # Версия JWT: токены с меньшей версией отозваны (кэшируется в Redis)
+    token_version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
     role = relationship("Role")
 
 # Роли
@@ -30,6 +47,14 @@ class Role(Base):
 # Статьи
 class Article(Base):
     __tablename__ = "articles"
+    __table_args__ = (
+        Index("ix_articles_title_trgm", "title", postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}),
+        # Удалённые статьи в поиск не попадают, поэтому и в индекс их не кладём
+        Index(
+            "ix_articles_search_vector", "search_vector",
+            postgresql_using="gin", postgresql_where=text("is_deleted = false"),
+        ),
+    )
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     title: Mapped[str] = mapped_column(String(255), nullable=False)
     content: Mapped[str] = mapped_column(String(5000), nullable=False)
@@ -43,6 +68,12 @@ class Article(Base):
     )
     is_deleted: Mapped[bool] = mapped_column(Boolean, default=False)
     deleted_at: Mapped[datetime] = mapped_column(TIMESTAMP, nullable=True)
+    # Заголовок весит больше текста (A против B) при ранжировании ts_rank
+    search_vector: Mapped[Optional[str]] = mapped_column(
+        TSVECTOR,
+        Computed(ARTICLE_SEARCH_VECTOR, persisted=True),
+        deferred=True,
+    )
     images = relationship("ArticleImage", back_populates="article", lazy="selectin")
 
 # Изображения статей
@@ -51,7 +82,18 @@ class ArticleImage(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     article_id: Mapped[int] = mapped_column(ForeignKey("articles.id"), nullable=False)
     image_path: Mapped[str] = mapped_column(String(255), nullable=False)
+    blob_sha256: Mapped[Optional[str]] = mapped_column(ForeignKey("image_blobs.sha256"), nullable=True, index=True)
     article = relationship("Article", back_populates="images")
+
+# Файлы изображений, адресуемые SHA-256 содержимого, со счётчиком ссылок
+class ImageBlob(Base):
+    __tablename__ = "image_blobs"
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    content_type: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    ref_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_at: Mapped[datetime] = mapped_column(TIMESTAMP, default=func.now())
+    unreferenced_at: Mapped[Optional[datetime]] = mapped_column(TIMESTAMP, nullable=True)
 # История статей
 class ArticleHistory(Base):
     __tablename__ = "article_history"
@@ -67,6 +109,9 @@ class ArticleHistory(Base):
 # Задачи
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        Index("ix_tasks_title_trgm", "title", postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}),
+    )
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     title: Mapped[str] = mapped_column(String(255), nullable=False)
     description: Mapped[str] = mapped_column(String(5000), nullable=True)
@@ -99,24 +144,55 @@ class TaskHistory(Base):
 # Чаты
 class Chat(Base):
     __tablename__ = "chats"
+    __table_args__ = (
+        Index("ix_chats_last_activity_at_chat_id", "last_activity_at", "chat_id"),
+    )
     chat_id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    name: Mapped[str] = mapped_column(String(255), nullable=False)
+    chat_name: Mapped[str] = mapped_column("name", String(255), nullable=False)
+    creator_id: Mapped[Optional[int]] = mapped_column(ForeignKey("users.user_id"), nullable=True)
     created_at: Mapped[datetime] = mapped_column(TIMESTAMP, default=func.now())
+    # Время последнего сообщения; обновляется вместе с записью пачки сообщений
+    # и задаёт порядок списка чатов
+    last_activity_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP, nullable=False, default=func.now(), server_default=func.now()
+    )
+    # Сколько сообщений записано в чат; база для подсчёта непрочитанных
+    message_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
 
 # Участники чата
 class ChatMember(Base):
     __tablename__ = "chat_members"
+    __table_args__ = (
+        UniqueConstraint("chat_id", "user_id", name="uq_chat_members_chat_id_user_id"),
+    )
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     chat_id: Mapped[int] = mapped_column(ForeignKey("chats.chat_id"))
     user_id: Mapped[int] = mapped_column(ForeignKey("users.user_id"))
     joined_at: Mapped[datetime] = mapped_column(TIMESTAMP, default=func.now())
+    last_read_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # chats.message_count на момент прочтения: непрочитанных = message_count - read_count
+    read_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
 
 # Сообщения
 class Message(Base):
     __tablename__ = "messages"
-    message_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    __table_args__ = (
+        Index("ix_messages_chat_id_message_id", "chat_id", "message_id"),
+        Index("ix_messages_search_vector", "search_vector", postgresql_using="gin"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    # Таблица секционирована по месяцам created_at, поэтому он входит в первичный ключ
+    message_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     chat_id: Mapped[int] = mapped_column(ForeignKey("chats.chat_id"))
     user_id: Mapped[int] = mapped_column(ForeignKey("users.user_id"))
     content: Mapped[str] = mapped_column(String(2000), nullable=False)
-    created_at: Mapped[datetime] = mapped_column(TIMESTAMP, default=func.now())
+    created_at: Mapped[datetime] = mapped_column(TIMESTAMP, primary_key=True, default=func.now())
+    search_vector: Mapped[Optional[str]] = mapped_column(
+        TSVECTOR,
+        Computed(
+            "to_tsvector('russian'::regconfig, content) || to_tsvector('english'::regconfig, content)",
+            persisted=True,
+        ),
+        deferred=True,
+    )
     user = relationship("User")
\ No newline at end of file
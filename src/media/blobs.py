@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+import aiofiles.os
+from sqlalchemy import case, delete, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from src.core import metrics
+from src.core.config import settings
+from src.db.database import async_session
+from src.db.models import ImageBlob
+from src.media.uploads import StagedUpload
+
+logger = logging.getLogger(__name__)
+
+# Хранилище изображений, адресуемое содержимым: файл лежит в
+# UPLOAD_DIR/blobs/ab/cd/<sha256>, а строка image_blobs считает ссылки на него.
+# Порядок важен для гонок со сборщиком мусора: загрузка сначала увеличивает
+# ref_count (и блокирует строку), и только потом проверяет наличие файла;
+# сборщик удаляет файлы внутри транзакции, удаляющей строки.
+
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+def blob_name(sha256: str) -> str:
+    return os.path.join("blobs", sha256[:2], sha256[2:4], sha256)
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(settings.UPLOAD_DIR, blob_name(sha256))
+
+def blob_sha256(path: Optional[str]) -> Optional[str]:
+    """sha256 блоба по пути к файлу или None для файлов вне хранилища."""
+    if not path:
+        return None
+    sha256 = os.path.basename(path)
+    if path != blob_path(sha256) or not SHA256_PATTERN.match(sha256):
+        return None
+    return sha256
+
+async def acquire_blob(db: AsyncSession, staged: StagedUpload) -> str:
+    """Добавляет ссылку на содержимое загрузки и возвращает путь к файлу.
+
+    Если такой файл уже есть, временная копия просто удаляется.
+    """
+    await db.execute(
+        insert(ImageBlob)
+        .values(sha256=staged.sha256, size=staged.size, content_type=staged.content_type, ref_count=1)
+        .on_conflict_do_update(
+            index_elements=[ImageBlob.sha256],
+            set_={"ref_count": ImageBlob.ref_count + 1, "unreferenced_at": None},
+        )
+    )
+    path = blob_path(staged.sha256)
+    if await aiofiles.os.path.exists(path):
+        await staged.discard()
+        metrics.inc("media.blobs.deduplicated")
+        return path
+    return await staged.place(blob_name(staged.sha256))
+
+async def release_blobs(db: AsyncSession, sha256s: Iterable[str]) -> None:
+    """Снимает ссылки; блоб без ссылок удалит сборщик после BLOB_GC_GRACE."""
+    for sha256, count in Counter(sha256s).items():
+        remaining = ImageBlob.ref_count - count
+        await db.execute(
+            update(ImageBlob)
+            .where(ImageBlob.sha256 == sha256)
+            .values(
+                ref_count=remaining,
+                unreferenced_at=case((remaining <= 0, datetime.utcnow()), else_=None),
+            )
+        )
+
+class BlobCollector:
+    """Фоновое удаление блобов, на которые давно никто не ссылается."""
+
+    def __init__(self, interval: float, grace: float, batch_size: int):
+        self.interval = interval
+        self.grace = grace
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                while await self.collect() == self.batch_size:
+                    pass
+            except Exception as e:
+                logger.error(f"Ошибка при сборке неиспользуемых изображений: {e}")
+
+    async def collect(self) -> int:
+        cutoff = datetime.utcnow() - timedelta(seconds=self.grace)
+        async with async_session() as db:
+            candidates = (
+                select(ImageBlob.sha256)
+                .where(ImageBlob.ref_count <= 0, ImageBlob.unreferenced_at < cutoff)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            result = await db.execute(
+                delete(ImageBlob)
+                .where(ImageBlob.sha256.in_(candidates))
+                .returning(ImageBlob.sha256)
+            )
+            collected = list(result.scalars().all())
+            # Файлы удаляются до фиксации: параллельная загрузка того же
+            # содержимого ждёт блокировку строки и затем запишет файл заново
+            for sha256 in collected:
+                try:
+                    await aiofiles.os.remove(blob_path(sha256))
+                except FileNotFoundError:
+                    pass
+            await db.commit()
+        if collected:
+            metrics.inc("media.blobs.collected", len(collected))
+            logger.info(f"Удалено неиспользуемых изображений: {len(collected)}")
+        return len(collected)
+
+blob_collector = BlobCollector(
+    interval=settings.BLOB_GC_INTERVAL,
+    grace=settings.BLOB_GC_GRACE,
+    batch_size=settings.BLOB_GC_BATCH,
+)
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Optional, Set, Tuple
+from src.core import metrics
+from src.core.config import settings
+from src.media.blobs import blob_path
+
+logger = logging.getLogger(__name__)
+
+# Производные изображения (превью, средний размер, WebP) строятся из блобов
+# в пуле процессов и кэшируются на диске в MEDIA_CACHE_DIR/ab/<sha256>.<вариант>.<расширение>.
+# Содержимое блоба неизменно, поэтому ключ кэша — sha256 и имя варианта.
+# Кэш ограничен MEDIA_CACHE_MAX_BYTES: при переполнении удаляются файлы
+# с самым старым mtime, а mtime обновляется при каждой выдаче.
+
+# вариант -> (наибольшая сторона, формат Pillow, расширение, media type)
+VARIANTS: Dict[str, Tuple[int, str, str, str]] = {
+    "thumb": (256, "JPEG", "jpg", "image/jpeg"),
+    "medium": (1024, "JPEG", "jpg", "image/jpeg"),
+    "webp": (1024, "WEBP", "webp", "image/webp"),
+}
+
+_executor: Optional[ProcessPoolExecutor] = None
+_in_flight: Dict[Tuple[str, str], asyncio.Future] = {}
+_background: Set[asyncio.Task] = set()
+_cache_bytes: Optional[int] = None
+_evicting = False
+
+def variant_url(sha256: str, variant: str) -> str:
+    return f"/media/{sha256}/{variant}"
+
+def variant_urls(sha256: Optional[str]) -> Optional[Dict[str, str]]:
+    if not sha256:
+        return None
+    return {variant: variant_url(sha256, variant) for variant in VARIANTS}
+
+def variant_path(sha256: str, variant: str) -> str:
+    return os.path.join(settings.MEDIA_CACHE_DIR, sha256[:2], f"{sha256}.{variant}.{VARIANTS[variant][2]}")
+
+def _render(source: str, target: str, max_side: int, image_format: str, quality: int) -> int:
+    """Выполняется в дочернем процессе: уменьшает и перекодирует изображение."""
+    from PIL import Image, ImageOps
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temp_path = f"{target}.{os.getpid()}.tmp"
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side))
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(temp_path, image_format, quality=quality, optimize=True)
+    os.replace(temp_path, target)
+    return os.path.getsize(target)
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.MEDIA_WORKERS)
+        logger.info(f"Пул обработки изображений запущен, воркеров: {settings.MEDIA_WORKERS}")
+    return _executor
+
+def shutdown_executor() -> None:
+    global _executor
+    for task in list(_background):
+        task.cancel()
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+def _scan_cache() -> list:
+    files = []
+    for root, _, names in os.walk(settings.MEDIA_CACHE_DIR):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    return files
+
+def _evict() -> int:
+    """Удаляет самые давно выданные файлы, пока кэш не станет меньше 90% лимита."""
+    files = _scan_cache()
+    total = sum(size for _, size, _ in files)
+    target = settings.MEDIA_CACHE_MAX_BYTES * 0.9
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    if removed:
+        metrics.inc("media.cache.evicted", removed)
+    return total
+
+async def _account(size: int) -> None:
+    """Учитывает новый файл и при переполнении запускает вытеснение в отдельном потоке."""
+    global _cache_bytes, _evicting
+    if _cache_bytes is None:
+        _cache_bytes = sum(size for _, size, _ in await asyncio.to_thread(_scan_cache))
+    else:
+        _cache_bytes += size
+    metrics.set_gauge("media.cache.bytes", _cache_bytes)
+    if _cache_bytes > settings.MEDIA_CACHE_MAX_BYTES and not _evicting:
+        _evicting = True
+        try:
+            _cache_bytes = await asyncio.to_thread(_evict)
+            metrics.set_gauge("media.cache.bytes", _cache_bytes)
+        finally:
+            _evicting = False
+
+async def _generate(sha256: str, variant: str) -> str:
+    max_side, image_format, _, _ = VARIANTS[variant]
+    target = variant_path(sha256, variant)
+    loop = asyncio.get_running_loop()
+    size = await loop.run_in_executor(
+        get_executor(), _render, blob_path(sha256), target, max_side, image_format, settings.MEDIA_QUALITY
+    )
+    metrics.inc(f"media.derivatives.generated.{variant}")
+    await _account(size)
+    return target
+
+async def _build(sha256: str, variant: str) -> str:
+    """Строит вариант; одновременные запросы одного варианта ждут одну и ту же задачу."""
+    if not await asyncio.to_thread(os.path.exists, blob_path(sha256)):
+        raise FileNotFoundError(sha256)
+
+    metrics.inc("media.cache.misses")
+    key = (sha256, variant)
+    future = _in_flight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(_generate(sha256, variant))
+        _in_flight[key] = future
+        future.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return await asyncio.shield(future)
+
+async def get_variant(sha256: str, variant: str) -> str:
+    """Путь к готовому варианту; строит его при первом обращении."""
+    target = variant_path(sha256, variant)
+    try:
+        await asyncio.to_thread(os.utime, target)
+        metrics.inc("media.cache.hits")
+        return target
+    except FileNotFoundError:
+        return await _build(sha256, variant)
+
+def _open_variant(path: str) -> Tuple[int, os.stat_result]:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.utime(fd)
+        return fd, os.fstat(fd)
+    except BaseException:
+        os.close(fd)
+        raise
+
+async def open_variant(sha256: str, variant: str) -> Tuple[int, os.stat_result]:
+    """Открытый дескриптор готового варианта и его stat; строит вариант при промахе.
+
+    Ответ отдаётся по дескриптору, поэтому вытеснение после открытия ему не
+    мешает. Файл, вытесненный между построением и открытием, — обычный
+    промах: вариант строится заново.
+    """
+    target = variant_path(sha256, variant)
+    for attempt in range(3):
+        try:
+            fd, stat = await asyncio.to_thread(_open_variant, target)
+        except FileNotFoundError:
+            if attempt == 2:
+                raise
+            await _build(sha256, variant)
+            continue
+        if attempt == 0:
+            metrics.inc("media.cache.hits")
+        return fd, stat
+
+async def _generate_all(sha256: str) -> None:
+    for variant in VARIANTS:
+        try:
+            await get_variant(sha256, variant)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Не удалось построить вариант {variant} для {sha256}: {e}")
+
+def schedule_derivatives(sha256s: Iterable[Optional[str]]) -> None:
+    """Строит все варианты новых загрузок в фоне, не задерживая ответ."""
+    for sha256 in dict.fromkeys(sha256s):
+        if not sha256:
+            continue
+        task = asyncio.create_task(_generate_all(sha256))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from src.auth.auth import get_current_principal
+from src.auth.schemas import Principal
+from src.media.blobs import SHA256_PATTERN
+from src.media.derivatives import VARIANTS, open_variant, variant_path
+from src.media.static import UploadResponse, detached_file, etag_matches, serve_upload
+
+router = APIRouter(prefix="/media", tags=["media"])
+uploads_router = APIRouter(prefix="/uploads", tags=["media"])
+
+@router.get("/{sha256}/{variant}")
+async def get_image_variant(
+    sha256: str,
+    variant: str,
+    request: Request,
+    current_user: Principal = Depends(get_current_principal)
+):
+    if variant not in VARIANTS or not SHA256_PATTERN.match(sha256):
+        raise HTTPException(status_code=404, detail="Изображение не найдено")
+    try:
+        fd, stat = await open_variant(sha256, variant)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Изображение не найдено")
+    except Exception:
+        raise HTTPException(status_code=415, detail="Не удалось обработать изображение")
+    entry = detached_file(variant_path(sha256, variant), fd, stat, f'"{sha256}.{variant}"', VARIANTS[variant][3])
+    # Вариант однозначно определяется содержимым, поэтому его можно кэшировать навсегда
+    headers = {
+        "etag": entry.etag,
+        "cache-control": "private, max-age=31536000, immutable",
+        "content-type": entry.content_type,
+    }
+    if_none_match = request.headers.get("if-none-match")
+    status_code = 304 if if_none_match is not None and etag_matches(if_none_match, entry.etag) else 200
+    return UploadResponse(entry, status_code, headers, None, send_body=True)
+
+@uploads_router.api_route("/{path:path}", methods=["GET", "HEAD"])
+async def get_upload(
+    path: str,
+    request: Request,
+    current_user: Principal = Depends(get_current_principal)
+):
+    return await serve_upload(path, request.headers, send_body=request.method != "HEAD")
@@ -0,0 +1,259 @@
+import asyncio
+import hashlib
+import mimetypes
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from fastapi import HTTPException
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+from src.core import metrics
+from src.core.config import settings
+from src.media.blobs import blob_sha256
+
+# Раздача файлов из UPLOAD_DIR. Открытые дескрипторы и результаты stat
+# хранятся в небольшом LRU-кэше STATIC_CACHE_TTL секунд, так что горячие
+# изображения не трогают файловую систему на каждый запрос. Дескриптор
+# читается только через sendfile/pread с явным смещением, поэтому один
+# дескриптор безопасно делят параллельные ответы.
+
+class OpenFile:
+    """Открытый файл с закэшированными stat и ETag; закрывается, когда его никто не использует."""
+
+    def __init__(self, path: str, fd: int, stat: os.stat_result, etag: str, immutable: bool, content_type: str):
+        self.path = path
+        self.fd = fd
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.etag = etag
+        self.immutable = immutable
+        self.content_type = content_type
+        self.expires_at = time.monotonic() + settings.STATIC_CACHE_TTL
+        self.users = 0
+        self.evicted = False
+        # Путь мог быть удалён после открытия: отдавать только по дескриптору
+        self.fd_only = False
+
+    def release(self) -> None:
+        self.users -= 1
+        if self.evicted and self.users == 0:
+            os.close(self.fd)
+
+    def evict(self) -> None:
+        self.evicted = True
+        if self.users == 0:
+            os.close(self.fd)
+
+class FileCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._files: "OrderedDict[str, OpenFile]" = OrderedDict()
+        # ETag файлов вне хранилища блобов: (путь, mtime_ns, размер) -> sha256
+        self._hashes: Dict[Tuple[str, int, int], str] = {}
+
+    def _content_hash(self, path: str, fd: int, stat: os.stat_result) -> str:
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        digest = self._hashes.get(key)
+        if digest is None:
+            hasher = hashlib.sha256()
+            offset = 0
+            while chunk := os.pread(fd, settings.UPLOAD_CHUNK_SIZE, offset):
+                hasher.update(chunk)
+                offset += len(chunk)
+            digest = self._hashes[key] = hasher.hexdigest()
+            while len(self._hashes) > self.maxsize * 4:
+                self._hashes.pop(next(iter(self._hashes)))
+        return digest
+
+    def _open(self, path: str) -> OpenFile:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            stat = os.fstat(fd)
+            sha256 = blob_sha256(path)
+            immutable = sha256 is not None
+            if sha256 is None:
+                sha256 = self._content_hash(path, fd, stat)
+            return OpenFile(path, fd, stat, f'"{sha256}"', immutable, _content_type(path, os.pread(fd, 16, 0)))
+        except BaseException:
+            os.close(fd)
+            raise
+
+    async def acquire(self, path: str) -> OpenFile:
+        entry = self._files.get(path)
+        if entry is not None and entry.expires_at > time.monotonic():
+            self._files.move_to_end(path)
+            metrics.inc("media.static.cache_hits")
+        else:
+            if entry is not None:
+                del self._files[path]
+                entry.evict()
+            metrics.inc("media.static.cache_misses")
+            entry = await asyncio.to_thread(self._open, path)
+            # Пока файл открывался, параллельный промах мог уже положить свою запись
+            current = self._files.get(path)
+            if current is not None and current.expires_at > time.monotonic():
+                entry.evict()
+                entry = current
+                self._files.move_to_end(path)
+            else:
+                if current is not None:
+                    del self._files[path]
+                    current.evict()
+                self._files[path] = entry
+                while len(self._files) > self.maxsize:
+                    _, evicted = self._files.popitem(last=False)
+                    evicted.evict()
+        entry.users += 1
+        return entry
+
+file_cache = FileCache(maxsize=settings.STATIC_CACHE_SIZE)
+
+def detached_file(path: str, fd: int, stat: os.stat_result, etag: str, content_type: str) -> OpenFile:
+    """OpenFile вне кэша: UploadResponse закроет дескриптор после отправки."""
+    entry = OpenFile(path, fd, stat, etag, True, content_type)
+    entry.users = 1
+    entry.evicted = True
+    entry.fd_only = True
+    return entry
+
+def resolve_upload(relative_path: str) -> str:
+    """Абсолютный путь внутри UPLOAD_DIR; всё, что выходит за его пределы, — 404."""
+    root = os.path.realpath(settings.UPLOAD_DIR)
+    path = os.path.realpath(os.path.join(root, relative_path))
+    if not path.startswith(root + os.sep) or path.startswith(os.path.join(root, ".tmp") + os.sep):
+        raise HTTPException(status_code=404, detail="Файл не найден")
+    return path
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Один диапазон bytes=start-end -> (start, end включительно); None — отдать файл целиком.
+
+    Неудовлетворимый диапазон поднимает ValueError.
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        return None
+    start, _, end = ranges.strip().partition("-")
+    try:
+        if start:
+            first = int(start)
+            last = int(end) if end else size - 1
+        else:
+            first = max(size - int(end), 0)
+            last = size - 1
+    except ValueError:
+        return None
+    last = min(last, size - 1)
+    if first > last or first >= size:
+        raise ValueError(header)
+    return first, last
+
+def etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+class UploadResponse(Response):
+    """ASGI-ответ с файлом из кэша дескрипторов.
+
+    Тело отправляется через расширения http.response.zerocopysend или
+    http.response.pathsend, если сервер их поддерживает, иначе — кусками
+    через os.pread в отдельном потоке.
+    """
+
+    def __init__(self, entry: OpenFile, status_code: int, headers: Dict[str, str],
+                 byte_range: Optional[Tuple[int, int]], send_body: bool):
+        super().__init__(status_code=status_code)
+        self.entry = entry
+        self.file_headers = headers
+        self.byte_range = byte_range
+        self.send_body = send_body
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self._send(scope, send)
+        finally:
+            self.entry.release()
+
+    async def _send(self, scope: Scope, send: Send) -> None:
+        first, last = self.byte_range or (0, self.entry.size - 1)
+        count = max(last - first + 1, 0)
+        headers = [(key.lower().encode("latin-1"), value.encode("latin-1")) for key, value in self.file_headers.items()]
+        if self.status_code != 304:
+            headers.append((b"content-length", str(count).encode("latin-1")))
+        await send({"type": "http.response.start", "status": self.status_code, "headers": headers})
+        if not self.send_body or self.status_code == 304 or count == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        extensions = scope.get("extensions") or {}
+        if "http.response.zerocopysend" in extensions:
+            metrics.inc("media.static.zerocopy")
+            await send({"type": "http.response.zerocopysend", "file": self.entry.fd, "offset": first, "count": count})
+            return
+        if "http.response.pathsend" in extensions and self.byte_range is None and not self.entry.fd_only:
+            metrics.inc("media.static.pathsend")
+            await send({"type": "http.response.pathsend", "path": self.entry.path})
+            return
+
+        offset, end = first, last + 1
+        while offset < end:
+            chunk = await asyncio.to_thread(
+                os.pread, self.entry.fd, min(settings.UPLOAD_CHUNK_SIZE, end - offset), offset
+            )
+            if not chunk:
+                break
+            offset += len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": offset < end})
+        if offset < end:
+            await send({"type": "http.response.body", "body": b""})
+
+async def serve_upload(relative_path: str, request_headers, send_body: bool = True) -> UploadResponse:
+    path = resolve_upload(relative_path)
+    try:
+        entry = await file_cache.acquire(path)
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        raise HTTPException(status_code=404, detail="Файл не найден")
+
+    headers = {
+        "etag": entry.etag,
+        "accept-ranges": "bytes",
+        "cache-control": "private, max-age=31536000, immutable" if entry.immutable else "private, no-cache",
+        "content-type": entry.content_type,
+    }
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None and etag_matches(if_none_match, entry.etag):
+        return UploadResponse(entry, 304, headers, None, send_body)
+
+    range_header = request_headers.get("range")
+    if_range = request_headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == entry.etag):
+        try:
+            byte_range = parse_range(range_header, entry.size)
+        except ValueError:
+            entry.release()
+            raise HTTPException(
+                status_code=416,
+                detail="Запрошенный диапазон недоступен",
+                headers={"Content-Range": f"bytes */{entry.size}"},
+            )
+        if byte_range is not None:
+            headers["content-range"] = f"bytes {byte_range[0]}-{byte_range[1]}/{entry.size}"
+            return UploadResponse(entry, 206, headers, byte_range, send_body)
+    return UploadResponse(entry, 200, headers, None, send_body)
+
+# Блобы хранятся без расширения, поэтому тип изображения определяем по сигнатуре
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+def _content_type(path: str, head: bytes) -> str:
+    for signature, content_type in _SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
@@ -0,0 +1,311 @@
+import hashlib
+import logging
+import os
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, Request
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from src.core.config import settings
+
+try:
+    from python_multipart.exceptions import MultipartParseError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:
+    # python-multipart до 0.0.13 устанавливается как пакет multipart
+    from multipart.exceptions import MultipartParseError
+    from multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+# Загрузки разбираются прямо из тела запроса и пишутся во временный файл в
+# UPLOAD_DIR/.tmp (та же файловая система, что и у итоговых файлов), SHA-256
+# считается по ходу чтения. На место файл переносится атомарным os.replace,
+# поэтому недописанный файл никогда не виден под итоговым именем.
+
+def temp_dir() -> str:
+    return os.path.join(settings.UPLOAD_DIR, ".tmp")
+
+def upload_url(path: Optional[str]) -> Optional[str]:
+    """URL файла из UPLOAD_DIR на маршруте /uploads."""
+    if not path:
+        return None
+    relative = os.path.relpath(path, settings.UPLOAD_DIR)
+    if relative.startswith(".."):
+        return None
+    return "/uploads/" + relative.replace(os.sep, "/")
+
+def safe_filename(filename: Optional[str]) -> str:
+    """Имя файла без каталогов: клиент не должен выбирать путь на диске."""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    return name or "file"
+
+class StagedUpload:
+    """Загрузка, полностью записанная во временный файл."""
+
+    def __init__(self, temp_path: str, filename: str, content_type: Optional[str], size: int, sha256: str):
+        self.temp_path = temp_path
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+        self.sha256 = sha256
+        self.path: Optional[str] = None
+
+    async def place(self, name: str) -> str:
+        """Переносит файл в UPLOAD_DIR/name и возвращает итоговый путь."""
+        path = os.path.join(settings.UPLOAD_DIR, name)
+        await aiofiles.os.makedirs(os.path.dirname(path), exist_ok=True)
+        await aiofiles.os.replace(self.temp_path, path)
+        self.path = path
+        return path
+
+    async def discard(self) -> None:
+        if self.path is not None:
+            return
+        try:
+            await aiofiles.os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+class _PartReader:
+    """Синхронные колбэки python-multipart, складывающие события частей в список.
+
+    Парсер вызывает колбэки внутри write(), где нельзя ждать запись на диск,
+    поэтому события копятся и обрабатываются асинхронно после каждого куска тела.
+    """
+
+    def __init__(self, boundary: bytes):
+        self.events: List[Tuple[str, object]] = []
+        self._headers: Dict[bytes, bytes] = {}
+        self._field = b""
+        self._value = b""
+        self.parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        })
+
+    def feed(self, chunk: bytes) -> List[Tuple[str, object]]:
+        self.parser.write(chunk)
+        events, self.events = self.events, []
+        return events
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._field.lower()] = self._value
+        self._field = b""
+        self._value = b""
+
+    def _on_headers_finished(self) -> None:
+        self.events.append(("headers", self._headers))
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        self.events.append(("data", data[start:end]))
+
+    def _on_part_end(self) -> None:
+        self.events.append(("end", None))
+
+class _FilePart:
+    """Файловая часть формы, которая пишется прямо во временный файл."""
+
+    def __init__(self, name: str, filename: str, content_type: Optional[str]):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.temp_path = os.path.join(temp_dir(), uuid.uuid4().hex)
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.out_file = None
+
+    async def open(self) -> None:
+        self.out_file = await aiofiles.open(self.temp_path, "wb")
+
+    async def write(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.size > settings.UPLOAD_MAX_FILE_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Файл {safe_filename(self.filename)} больше {settings.UPLOAD_MAX_FILE_SIZE} байт",
+            )
+        self.digest.update(data)
+        await self.out_file.write(data)
+
+    async def close(self) -> StagedUpload:
+        await self.out_file.close()
+        return StagedUpload(self.temp_path, safe_filename(self.filename), self.content_type, self.size, self.digest.hexdigest())
+
+    async def abort(self) -> None:
+        if self.out_file is not None:
+            await self.out_file.close()
+        try:
+            await aiofiles.os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+class _FieldPart:
+    """Обычное поле формы, накапливается в памяти не больше UPLOAD_MAX_FIELD_SIZE."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.value = bytearray()
+
+    async def write(self, data: bytes) -> None:
+        self.value += data
+        if len(self.value) > settings.UPLOAD_MAX_FIELD_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Поле {self.name} больше {settings.UPLOAD_MAX_FIELD_SIZE} байт",
+            )
+
+class StagedForm:
+    """Поля и файлы multipart-запроса; файлы уже лежат во временном каталоге."""
+
+    def __init__(self):
+        self.fields: Dict[str, List[str]] = {}
+        self.files: Dict[str, List[StagedUpload]] = {}
+
+    def value(self, name: str) -> Optional[str]:
+        values = self.fields.get(name)
+        return values[-1] if values else None
+
+    def uploads(self, name: str) -> List[StagedUpload]:
+        return self.files.get(name, [])
+
+    async def discard(self) -> None:
+        for uploads in self.files.values():
+            for upload in uploads:
+                await upload.discard()
+
+async def _open_part(headers: Dict[bytes, bytes]):
+    _, options = parse_options_header(headers.get(b"content-disposition"))
+    if b"name" not in options:
+        raise HTTPException(status_code=400, detail="Часть multipart-запроса без имени поля")
+    name = options[b"name"].decode("utf-8")
+    if b"filename" not in options:
+        return _FieldPart(name)
+    content_type = headers.get(b"content-type", b"").decode("latin-1") or None
+    part = _FilePart(name, options[b"filename"].decode("utf-8"), content_type)
+    await part.open()
+    return part
+
+async def _read_multipart(request: Request, form: StagedForm) -> None:
+    content_type, params = parse_options_header(request.headers.get("content-type"))
+    if content_type == b"application/x-www-form-urlencoded":
+        for name, value in (await request.form()).multi_items():
+            form.fields.setdefault(name, []).append(value)
+        return
+    if content_type != b"multipart/form-data":
+        return
+    if b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="В multipart-запросе нет boundary")
+
+    await aiofiles.os.makedirs(temp_dir(), exist_ok=True)
+    reader = _PartReader(params[b"boundary"])
+    part = None
+    try:
+        async for chunk in request.stream():
+            for kind, payload in reader.feed(chunk):
+                if kind == "headers":
+                    part = await _open_part(payload)
+                elif kind == "data":
+                    await part.write(payload)
+                elif isinstance(part, _FilePart):
+                    upload = await part.close()
+                    # Пустое поле файла браузер присылает с пустым именем — это «файл не выбран»
+                    if part.size == 0 and not part.filename:
+                        await upload.discard()
+                    else:
+                        form.files.setdefault(part.name, []).append(upload)
+                    part = None
+                else:
+                    form.fields.setdefault(part.name, []).append(part.value.decode("utf-8"))
+                    part = None
+        reader.parser.finalize()
+    except MultipartParseError as e:
+        if isinstance(part, _FilePart):
+            await part.abort()
+        raise HTTPException(status_code=400, detail=f"Некорректный multipart-запрос: {e}")
+    except BaseException:
+        if isinstance(part, _FilePart):
+            await part.abort()
+        raise
+
+def multipart_body(properties: Dict[str, dict], required: Tuple[str, ...] = ()) -> dict:
+    """openapi_extra для маршрута, который сам разбирает multipart-тело через stage_uploads."""
+    schema = {"type": "object", "properties": properties, "required": list(required)}
+    return {"requestBody": {"content": {"multipart/form-data": {"schema": schema}}, "required": bool(required)}}
+
+FILE_SCHEMA = {"type": "string", "format": "binary"}
+
+@asynccontextmanager
+async def stage_uploads(request: Request) -> AsyncIterator[StagedForm]:
+    """Разбирает multipart-тело запроса потоково, без промежуточной буферизации Starlette.
+
+    Каждый файл пишется на диск один раз — сразу во временный файл, SHA-256 и
+    UPLOAD_MAX_FILE_SIZE проверяются по ходу чтения, так что слишком большой
+    файл обрывает разбор на первом лишнем куске. Непомещённые на место файлы
+    удаляются при выходе.
+    """
+    form = StagedForm()
+    try:
+        await _read_multipart(request, form)
+        yield form
+    finally:
+        await form.discard()
+
+class UploadLimitMiddleware:
+    """Ограничивает размер multipart-запроса целиком.
+
+    Запрос с Content-Length больше лимита отклоняется до чтения тела, а для
+    запросов без Content-Length считаются полученные байты, и разбор формы
+    прерывается с 413, как только лимит превышен.
+    """
+
+    def __init__(self, app: ASGIApp, max_body_size: int):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_size:
+            response = JSONResponse(
+                {"detail": f"Запрос больше {self.max_body_size} байт"}, status_code=413
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    raise HTTPException(status_code=413, detail=f"Запрос больше {self.max_body_size} байт")
+            return message
+
+        await self.app(scope, limited_receive, send)
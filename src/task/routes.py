@@ -1,11 +1,14 @@
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, Form
+from fastapi import APIRouter, Depends, HTTPException, Form, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import func
-from src.auth.auth import get_current_user
+from src.auth.auth import get_current_principal
+from src.auth.schemas import Principal
 from src.db.models import User, Task, TaskHistory
 from src.db.database import get_db
+from src.core.config import settings
+from src.core.search import matches, similarity
 from src.task.schemas import TaskCreate, TaskResponse, TaskStatus
 from typing import Optional, List
 from src.task.enums import TaskPriority
@@ -16,7 +19,7 @@ router = APIRouter(prefix="/tasks", tags=["tasks"])
 async def create_task(
     task_data: TaskCreate = Depends(),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     result = await db.execute(select(User).where(User.user_id == task_data.assignee_id, User.is_deleted == False))
     assignee = result.scalar_one_or_none()
@@ -40,16 +43,19 @@ async def create_task(
 
 @router.get("/", response_model=List[TaskResponse])
 async def get_tasks(
-    title: Optional[str] = None,
+    title: Optional[str] = Query(None, min_length=settings.SEARCH_MIN_LENGTH),
     assignee_id: Optional[int] = None,
     status: Optional[TaskStatus] = None,
+    ranked: bool = False,
     limit: int = 10,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     query = select(Task).where(Task.is_deleted == False)
     if title:
-        query = query.where(Task.title.ilike(f"%{title}%"))
+        query = query.where(matches(Task.title, title, fuzzy=ranked))
+        if ranked:
+            query = query.order_by(similarity([(Task.title, title)]).desc())
     if assignee_id:
         query = query.where(Task.assignee_id == assignee_id)
     if status:
@@ -67,7 +73,7 @@ async def update_task(
     due_date: Optional[datetime] = Form(None),
     assignee_id: Optional[int] = Form(None),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     result = await db.execute(select(Task).where(Task.id == id, Task.is_deleted == False))
     task = result.scalar_one_or_none()
@@ -101,7 +107,7 @@ async def update_task_status(
     id: int,
     status: TaskStatus,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     result = await db.execute(select(Task).where(Task.id == id, Task.is_deleted == False))
     task = result.scalar_one_or_none()
@@ -122,7 +128,7 @@ async def update_task_status(
     return task
 
 @router.get("/counts", response_model=dict)
-async def get_task_counts(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_task_counts(db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     result = await db.execute(select(Task.status, func.count()).where(Task.is_deleted == False).group_by(Task.status))
     counts = {row[0]: row[1] for row in result.all()}
     return {
@@ -1,14 +1,18 @@
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from src.db.database import get_db
-from src.auth.auth import get_current_user
+from src.core.config import settings
+from src.core.search import matches, similarity
+from src.auth.auth import get_current_user, get_current_principal
+from src.auth.schemas import Principal
+from src.auth.cache import principal_cache
 from src.db.models import User
 from src.user.schemas import UserProfile, UserUpdate
-import aiofiles
-import os
-from src.core.config import settings
+from src.media.blobs import acquire_blob, blob_sha256, release_blobs
+from src.media.derivatives import schedule_derivatives
+from src.media.uploads import FILE_SCHEMA, multipart_body, stage_uploads
 
 router = APIRouter(prefix="/user", tags=["user"])
 
@@ -16,10 +20,10 @@ router = APIRouter(prefix="/user", tags=["user"])
 async def get_profile(current_user: User = Depends(get_current_user)):
     return current_user
 
-@router.put("/profile", response_model=dict)
+@router.put("/profile", response_model=dict, openapi_extra=multipart_body({"photo": FILE_SCHEMA}))
 async def update_profile(
+    request: Request,
     user_update: UserUpdate = Depends(),
-    photo: UploadFile = File(None),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -31,23 +35,24 @@ async def update_profile(
             raise HTTPException(status_code=400, detail="Имя пользователя уже занято")
         current_user.username = user_update.username
 
-    if photo:
-        os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-        file_path = f"{settings.UPLOAD_DIR}/{current_user.user_id}_{photo.filename}"
-        async with aiofiles.open(file_path, 'wb') as out_file:
-            content = await photo.read()
-            await out_file.write(content)
-        current_user.avatar = file_path
-    
-    await db.commit()
+    async with stage_uploads(request) as form:
+        staged = form.uploads("photo")
+        for upload in staged:
+            previous = blob_sha256(current_user.avatar)
+            current_user.avatar = await acquire_blob(db, upload)
+            if previous:
+                await release_blobs(db, [previous])
+        await db.commit()
+    schedule_derivatives(upload.sha256 for upload in staged)
     await db.refresh(current_user)
+    await principal_cache.invalidate(current_user.email)
     return {"message": "Профиль обновлен"}
 
 @router.get("/profile/{user_id}", response_model=UserProfile)
 async def get_user_profile(
     user_id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     result = await db.execute(select(User).where(User.user_id == user_id, User.is_deleted == False))
     user = result.scalar_one_or_none()
@@ -57,23 +62,25 @@ async def get_user_profile(
 
 @router.get("/search", response_model=list[UserProfile])
 async def search_users(
-    username: Optional[str] = None,
-    full_name: Optional[str] = None,
-    email: Optional[str] = None,
+    username: Optional[str] = Query(None, min_length=settings.SEARCH_MIN_LENGTH),
+    full_name: Optional[str] = Query(None, min_length=settings.SEARCH_MIN_LENGTH),
+    email: Optional[str] = Query(None, min_length=settings.SEARCH_MIN_LENGTH),
     role_id: Optional[int] = None,
+    ranked: bool = False,
     limit: int = 10,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     query = select(User).where(User.is_deleted == False)
-    if username:
-        query = query.where(User.username.ilike(f"%{username}%"))
-    if full_name:
-        query = query.where(User.full_name.ilike(f"%{full_name}%"))
-    if email:
-        query = query.where(User.email.ilike(f"%{email}%"))
+    terms = [(column, value) for column, value in (
+        (User.username, username), (User.full_name, full_name), (User.email, email)
+    ) if value]
+    for column, value in terms:
+        query = query.where(matches(column, value, fuzzy=ranked))
     if role_id:
         query = query.where(User.role_id == role_id)
+    if ranked and terms:
+        query = query.order_by(similarity(terms).desc())
     
     query = query.limit(limit)
     result = await db.execute(query)
@@ -1,6 +1,9 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, computed_field
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Optional
+from src.media.blobs import blob_sha256
+from src.media.derivatives import variant_urls
+from src.media.uploads import upload_url
 
 class UserProfile(BaseModel):
     user_id: int
@@ -11,6 +14,16 @@ class UserProfile(BaseModel):
     role_id: int
     registered_at: datetime
 
+    @computed_field
+    @property
+    def avatar_url(self) -> Optional[str]:
+        return upload_url(self.avatar)
+
+    @computed_field
+    @property
+    def avatar_variants(self) -> Optional[Dict[str, str]]:
+        return variant_urls(blob_sha256(self.avatar))
+
     class Config:
         from_attributes = True
 
@@ -0,0 +1,202 @@
+import asyncio
+import time
+from typing import Callable, Dict, List, Set, Tuple
+from redis.exceptions import WatchError
+
+# Локальные замены внешних систем для тестов: сокет клиента и Redis (pub/sub, sorted set, stream).
+
+class FakeWebSocket:
+    """Сокет клиента: входящие кадры кладутся в incoming, отправленные копятся в sent."""
+
+    def __init__(self, token: str = "token", subprotocols: List[str] = ()):
+        self.cookies = {"access_token": token}
+        self.scope = {"subprotocols": list(subprotocols)}
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.sent: list = []
+        self.waiting = False
+        self.close_code = None
+
+    async def accept(self, subprotocol=None) -> None:
+        pass
+
+    async def receive(self) -> dict:
+        self.waiting = True
+        try:
+            return await self.incoming.get()
+        finally:
+            self.waiting = False
+
+    async def send_text(self, data: str) -> None:
+        self.sent.append(data)
+
+    async def send_bytes(self, data: bytes) -> None:
+        self.sent.append(data)
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        if self.close_code is None:
+            self.close_code = code
+
+    def disconnect(self) -> None:
+        self.incoming.put_nowait({"type": "websocket.disconnect", "code": 1000})
+
+class FakePubSub:
+    def __init__(self, redis: "FakeRedis"):
+        self.redis = redis
+        self.channels: Set[str] = set()
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.redis.subscribers.append(self)
+
+    async def subscribe(self, *channels: str) -> None:
+        self.channels.update(channels)
+
+    async def unsubscribe(self, *channels: str) -> None:
+        self.channels.difference_update(channels)
+
+    async def get_message(self, ignore_subscribe_messages: bool = False, timeout: float = 0.0):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def aclose(self) -> None:
+        if self in self.redis.subscribers:
+            self.redis.subscribers.remove(self)
+
+class FakePipeline:
+    """Конвейер: команды копятся и выполняются по порядку в execute().
+
+    После watch() команды выполняются сразу, пока не вызван multi(); если
+    наблюдаемый ключ изменился, execute() бросает WatchError.
+    """
+
+    def __init__(self, redis: "FakeRedis"):
+        self.redis = redis
+        self.commands: list = []
+        self.watched: Dict[str, int] = {}
+        self.immediate = False
+
+    async def watch(self, *keys: str) -> None:
+        self.watched = {key: self.redis.versions.get(key, 0) for key in keys}
+        self.immediate = True
+
+    def multi(self) -> None:
+        self.immediate = False
+
+    async def __aenter__(self) -> "FakePipeline":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        pass
+
+    def __getattr__(self, name: str):
+        command = getattr(self.redis, name)
+        if self.immediate:
+            return command
+        return lambda *args, **kwargs: self.commands.append((command, args, kwargs))
+
+    async def execute(self) -> list:
+        commands, self.commands = self.commands, []
+        if any(self.redis.versions.get(key, 0) != version for key, version in self.watched.items()):
+            raise WatchError("Наблюдаемый ключ изменился")
+        return [await command(*args, **kwargs) for command, args, kwargs in commands]
+
+class FakeRedis:
+    """Redis в памяти процесса; один объект на несколько брокеров или воркеров играет роль общего сервера."""
+
+    def __init__(self):
+        self.subscribers: List[FakePubSub] = []
+        self.sorted_sets: Dict[str, Dict[str, float]] = {}
+        self.streams: Dict[str, List[Tuple[str, dict]]] = {}
+        self.strings: Dict[str, str] = {}
+        self.versions: Dict[str, int] = {}
+
+    def _touch(self, key: str) -> None:
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def pipeline(self, transaction: bool = True) -> FakePipeline:
+        return FakePipeline(self)
+
+    async def expire(self, key: str, seconds: int) -> bool:
+        return key in self.sorted_sets or key in self.streams or key in self.strings
+
+    async def set(self, key: str, value: str, ex: int = None) -> bool:
+        self.strings[key] = value
+        self._touch(key)
+        return True
+
+    async def get(self, key: str):
+        return self.strings.get(key)
+
+    async def delete(self, *keys: str) -> int:
+        removed = 0
+        for key in keys:
+            for storage in (self.sorted_sets, self.streams, self.strings):
+                if storage.pop(key, None) is not None:
+                    removed += 1
+                    self._touch(key)
+        return removed
+
+    async def rename(self, source: str, target: str) -> bool:
+        await self.delete(target)
+        self.streams[target] = self.streams.pop(source)
+        self._touch(source)
+        self._touch(target)
+        return True
+
+    async def xadd(self, key: str, fields: dict, id: str = "*", maxlen: int = None, approximate: bool = True) -> str:
+        entries = self.streams.setdefault(key, [])
+        last = tuple(int(part) for part in entries[-1][0].split("-")) if entries else (0, 0)
+        if id == "*":
+            now = int(time.time() * 1000)
+            entry = (now, 0) if now > last[0] else (last[0], last[1] + 1)
+        else:
+            entry = tuple(int(part) for part in id.split("-"))
+            if entry <= last:
+                raise ValueError("ERR The ID specified in XADD is equal or smaller than the target stream top item")
+        entry_id = f"{entry[0]}-{entry[1]}"
+        entries.append((entry_id, {name: str(value) for name, value in fields.items()}))
+        self._touch(key)
+        return entry_id
+
+    async def xrange(self, key: str, min: str = "-", max: str = "+", count: int = None) -> list:
+        assert (min, max) == ("-", "+"), "Заглушка поддерживает только полный диапазон"
+        return list(self.streams.get(key, []))[:count]
+
+    async def zadd(self, key: str, mapping: Dict[str, float]) -> int:
+        members = self.sorted_sets.setdefault(key, {})
+        added = len(set(mapping) - set(members))
+        members.update(mapping)
+        return added
+
+    async def zrem(self, key: str, *members: str) -> int:
+        stored = self.sorted_sets.get(key, {})
+        removed = sum(stored.pop(member, None) is not None for member in members)
+        if not stored:
+            self.sorted_sets.pop(key, None)
+        return removed
+
+    async def zrange(self, key: str, start: int, end: int, withscores: bool = False) -> list:
+        entries = sorted(self.sorted_sets.get(key, {}).items(), key=lambda item: (item[1], item[0]))
+        entries = entries[start:end + 1 if end >= 0 else None]
+        return entries if withscores else [member for member, _ in entries]
+
+    def pubsub(self, ignore_subscribe_messages: bool = False) -> FakePubSub:
+        return FakePubSub(self)
+
+    def subscribed(self, channel: str) -> int:
+        return sum(channel in pubsub.channels for pubsub in self.subscribers)
+
+    async def publish(self, channel: str, message: str) -> int:
+        receivers = [pubsub for pubsub in self.subscribers if channel in pubsub.channels]
+        for pubsub in receivers:
+            pubsub.queue.put_nowait({"type": "message", "channel": channel, "data": message})
+        return len(receivers)
+
+async def eventually(predicate: Callable[[], bool], timeout: float = 2.0) -> None:
+    """Ждёт, пока predicate станет истинным, уступая управление другим задачам."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        if loop.time() > deadline:
+            raise AssertionError("Условие не выполнилось за отведённое время")
+        await asyncio.sleep(0.01)
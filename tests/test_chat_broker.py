@@ -0,0 +1,167 @@
+import asyncio
+import pytest
+
+for module in ("fastapi", "redis", "msgpack"):
+    pytest.importorskip(module)
+
+import msgpack
+from src.chat import websocket
+from src.chat.protocol import FIELD_TAGS
+from src.chat.websocket import ChatBroker, chat_channel
+from src.core import metrics
+from src.core.config import settings
+from tests.fakes import FakeRedis, FakeWebSocket, eventually
+
+def use_redis(monkeypatch, redis_client) -> None:
+    async def get_redis():
+        return redis_client
+    monkeypatch.setattr(websocket, "get_redis", get_redis)
+
+def test_publish_reaches_sockets_of_other_workers(monkeypatch):
+    redis_client = FakeRedis()
+    use_redis(monkeypatch, redis_client)
+
+    async def scenario():
+        # Два брокера — как два воркера uvicorn с общим Redis
+        first, second = ChatBroker(), ChatBroker()
+        await first.start()
+        await second.start()
+        try:
+            await eventually(lambda: first._subscribed and second._subscribed)
+            local, remote, other_chat = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+            first.connect(1, 10, local)
+            second.connect(1, 20, remote)
+            second.connect(2, 30, other_chat)
+            await eventually(lambda: redis_client.subscribed(chat_channel(1)) == 2)
+            await eventually(lambda: redis_client.subscribed(chat_channel(2)) == 1)
+
+            await first.publish(1, "hello")
+            await eventually(lambda: local.sent and remote.sent)
+            await asyncio.sleep(0.05)
+            assert local.sent == ["hello"]
+            assert remote.sent == ["hello"]
+            assert other_chat.sent == []
+        finally:
+            await first.stop()
+            await second.stop()
+        assert redis_client.subscribers == []
+
+    asyncio.run(scenario())
+
+def test_subscriptions_follow_local_sockets(monkeypatch):
+    redis_client = FakeRedis()
+    use_redis(monkeypatch, redis_client)
+
+    async def scenario():
+        broker = ChatBroker()
+        await broker.start()
+        try:
+            await eventually(lambda: broker._subscribed)
+            assert redis_client.subscribed(chat_channel(1)) == 0
+
+            first = broker.connect(1, 10, FakeWebSocket())
+            second = broker.connect(1, 20, FakeWebSocket())
+            await eventually(lambda: redis_client.subscribed(chat_channel(1)) == 1)
+
+            # Канал остаётся, пока в чате есть хотя бы один локальный сокет
+            broker.disconnect(first)
+            await asyncio.sleep(0.05)
+            assert redis_client.subscribed(chat_channel(1)) == 1
+            broker.disconnect(second)
+            await eventually(lambda: redis_client.subscribed(chat_channel(1)) == 0)
+        finally:
+            await broker.stop()
+
+    asyncio.run(scenario())
+
+def test_without_redis_delivers_locally(monkeypatch):
+    use_redis(monkeypatch, None)
+
+    async def scenario():
+        broker = ChatBroker()
+        ws = FakeWebSocket()
+        connection = broker.connect(1, 10, ws)
+        await broker.publish(1, "hello")
+        await eventually(lambda: ws.sent)
+        assert ws.sent == ["hello"]
+        broker.disconnect(connection)
+        await connection.close()
+
+    asyncio.run(scenario())
+
+def test_overflowing_socket_is_evicted_without_blocking_others(monkeypatch):
+    use_redis(monkeypatch, None)
+    monkeypatch.setattr(settings, "CHAT_SEND_QUEUE_SIZE", 2)
+
+    async def scenario():
+        broker = ChatBroker()
+        stalled, healthy = FakeWebSocket(), FakeWebSocket()
+        blocked = asyncio.Event()
+
+        async def never_sends(data):
+            await blocked.wait()
+        stalled.send_text = never_sends
+
+        broker.connect(1, 10, stalled)
+        broker.connect(1, 20, healthy)
+        for index in range(5):
+            await broker.publish(1, f"message {index}")
+            # Даём писателям отработать: здоровый сокет успевает разгрузить очередь
+            await asyncio.sleep(0.01)
+
+        await eventually(lambda: stalled.close_code is not None)
+        await eventually(lambda: len(healthy.sent) == 5)
+        assert stalled.close_code == 1013
+        assert broker.connection_count == 1
+        assert not broker.has_user(1, 10)
+
+    asyncio.run(scenario())
+
+def test_per_chat_metrics_live_only_while_chat_has_sockets(monkeypatch):
+    use_redis(monkeypatch, None)
+
+    async def scenario():
+        broker = ChatBroker()
+        ws = FakeWebSocket()
+        connection = broker.connect(7, 10, ws)
+        assert metrics.snapshot()["gauges"]["chat.connections.7"] == 1
+        await broker.publish(7, "hello")
+        await eventually(lambda: ws.sent)
+        await eventually(lambda: "chat.delivery_latency.7" in metrics.snapshot()["timings"])
+
+        broker.disconnect(connection)
+        await connection.close()
+        snapshot = metrics.snapshot()
+        assert not any(name.endswith(".7") for kind in snapshot.values() for name in kind)
+        assert snapshot["timings"]["chat.delivery_latency"]["count"] >= 1
+
+    asyncio.run(scenario())
+
+def test_only_binary_sockets_get_app_pings_and_idle_reaping(monkeypatch):
+    use_redis(monkeypatch, None)
+    monkeypatch.setattr(settings, "CHAT_PING_INTERVAL", 0.02)
+    monkeypatch.setattr(settings, "CHAT_IDLE_TIMEOUT", 0.1)
+    monkeypatch.setattr(settings, "CHAT_COALESCE_WINDOW", 0)
+
+    async def scenario():
+        broker = ChatBroker()
+        await broker.start()
+        try:
+            json_ws, binary_ws = FakeWebSocket(), FakeWebSocket()
+            broker.connect(1, 10, json_ws)
+            broker.connect(1, 20, binary_ws, binary=True)
+
+            await eventually(lambda: binary_ws.sent)
+            assert msgpack.unpackb(binary_ws.sent[0], strict_map_key=False) == [{FIELD_TAGS["event"]: "ping"}]
+            await eventually(lambda: binary_ws.close_code is not None)
+            assert binary_ws.close_code == 1001
+
+            # Живость JSON-клиента проверяет ping/pong самого WebSocket-сервера
+            await asyncio.sleep(0.15)
+            assert json_ws.sent == []
+            assert json_ws.close_code is None
+            assert broker.has_user(1, 10)
+        finally:
+            await broker.stop()
+
+    asyncio.run(scenario())
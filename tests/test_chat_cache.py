@@ -0,0 +1,69 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+
+for module in ("fastapi", "sqlalchemy", "asyncpg", "redis"):
+    pytest.importorskip(module)
+
+from src.chat import cache
+from src.chat.cache import _backfill_ids, stream_key, warm_key
+from tests.fakes import FakeRedis
+
+STARTED = datetime(2026, 1, 1, 12, 0, 0)
+
+def stored_message(message_id: int, offset_ms: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        message_id=message_id,
+        chat_id=1,
+        user_id=10,
+        user=SimpleNamespace(username="user10"),
+        content=f"сообщение {message_id}",
+        created_at=STARTED + timedelta(milliseconds=offset_ms),
+    )
+
+def use_database(monkeypatch, messages: list) -> None:
+    """Замена async_session: запрос прогрева возвращает messages от новых к старым."""
+    result = SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: sorted(messages, key=lambda m: -m.message_id)))
+
+    @asynccontextmanager
+    async def session():
+        async def execute(query):
+            return result
+        yield SimpleNamespace(execute=execute)
+
+    monkeypatch.setattr(cache, "async_session", session)
+
+def test_backfill_ids_follow_created_at_and_stay_below_the_stream():
+    created = [STARTED, STARTED, STARTED + timedelta(milliseconds=5)]
+    start = int((STARTED - datetime(1970, 1, 1)).total_seconds() * 1000)
+    assert _backfill_ids(created, None) == [(start, 0), (start, 1), (start + 5, 0)]
+    # Последнее сообщение создано в ту же миллисекунду, что и старейшая запись стрима
+    assert _backfill_ids(created, (start + 5, 0)) == [(start, 0), (start, 1), (start + 4, 0)]
+
+def test_warm_stream_keeps_existing_entry_ids(monkeypatch):
+    redis_client = FakeRedis()
+
+    async def get_redis():
+        return redis_client
+    monkeypatch.setattr(cache, "get_redis", get_redis)
+    messages = [stored_message(message_id, offset_ms=message_id * 10) for message_id in range(1, 6)]
+    use_database(monkeypatch, messages)
+
+    async def scenario():
+        # Два последних сообщения уже в стриме, на их id ссылаются выданные курсоры
+        for message in messages[3:]:
+            await redis_client.xadd(stream_key(1), {"mid": message.message_id, "data": "{}"})
+        before = await redis_client.xrange(stream_key(1))
+
+        await cache.warm_stream(1)
+        entries = await redis_client.xrange(stream_key(1))
+        assert [int(fields["mid"]) for _, fields in entries] == [1, 2, 3, 4, 5]
+        assert entries[3:] == before
+        assert [cache._stream_id(entry_id) for entry_id, _ in entries] == sorted(
+            cache._stream_id(entry_id) for entry_id, _ in entries
+        )
+        assert await redis_client.get(warm_key(1)) == "full"
+
+    asyncio.run(scenario())
@@ -0,0 +1,126 @@
+import asyncio
+import time
+import pytest
+
+for module in ("fastapi", "sqlalchemy", "asyncpg", "redis"):
+    pytest.importorskip(module)
+
+from src.chat import ingest
+from src.chat.ingest import MessageWriter, pending_key
+from tests.fakes import FakeRedis, eventually
+
+class Sequence:
+    """Общая для воркеров последовательность message_id; allocating задерживает выдачу после hold."""
+
+    def __init__(self):
+        self.last_value = 0
+        self.allocating = asyncio.Event()
+        self.allocating.set()
+
+    async def next_ids(self, count, hold):
+        await hold(self.last_value)
+        await self.allocating.wait()
+        ids = list(range(self.last_value + 1, self.last_value + count + 1))
+        self.last_value += count
+        return ids
+
+def make_writer(monkeypatch, sequence: Sequence, written: list) -> tuple:
+    """Писатель одного воркера: пачки попадают в written, когда открыт его commit."""
+    writer = MessageWriter(max_batch=10, max_linger=0.01)
+    commit = asyncio.Event()
+
+    async def insert(rows):
+        await commit.wait()
+        written.extend(row["message_id"] for row in rows)
+
+    monkeypatch.setattr(writer, "_next_ids", sequence.next_ids)
+    monkeypatch.setattr(writer, "_insert", insert)
+    writer.start()
+    return writer, commit
+
+def visible(written: list, bound) -> list:
+    """Что отдал бы читатель по ключу: записанные id ниже границы."""
+    return sorted(mid for mid in written if bound is None or mid < bound)
+
+def test_keyset_readers_wait_for_lower_ids_of_other_workers(monkeypatch):
+    redis_client = FakeRedis()
+
+    async def get_redis():
+        return redis_client
+    monkeypatch.setattr(ingest, "get_redis", get_redis)
+
+    async def scenario():
+        sequence, written = Sequence(), []
+        first, first_commit = make_writer(monkeypatch, sequence, written)
+        second, second_commit = make_writer(monkeypatch, sequence, written)
+
+        slow = await first.submit(1, 10, "раньше")
+        fast = await second.submit(1, 20, "позже")
+        assert slow["message_id"] < fast["message_id"]
+
+        # Второй воркер записал больший id раньше: читатель не должен его отдать,
+        # иначе следующий запрос after_id пропустит меньший
+        second_commit.set()
+        await eventually(lambda: fast["message_id"] in written)
+        for writer in (first, second):
+            bound = await writer.visible_bound(1)
+            assert bound == slow["message_id"]
+            assert visible(written, bound) == []
+        assert await second.visible_bound(2) is None
+
+        first_commit.set()
+        await eventually(lambda: slow["message_id"] in written)
+        await eventually(lambda: not redis_client.sorted_sets)
+        assert await second.visible_bound(1) is None
+        assert visible(written, None) == [slow["message_id"], fast["message_id"]]
+
+        await first.stop()
+        await second.stop()
+
+    asyncio.run(scenario())
+
+def test_bound_is_held_while_ids_are_being_allocated(monkeypatch):
+    redis_client = FakeRedis()
+
+    async def get_redis():
+        return redis_client
+    monkeypatch.setattr(ingest, "get_redis", get_redis)
+
+    async def scenario():
+        sequence, written = Sequence(), []
+        sequence.last_value = 41
+        writer, commit = make_writer(monkeypatch, sequence, written)
+        other = MessageWriter(max_batch=10, max_linger=0.01)
+        commit.set()
+
+        # Между nextval и регистрацией id граница держится значением last_value
+        sequence.allocating.clear()
+        submitted = asyncio.create_task(writer.submit(1, 10, "текст"))
+        await eventually(lambda: redis_client.sorted_sets)
+        assert await other.visible_bound(1) == 41
+
+        sequence.allocating.set()
+        message = await submitted
+        assert message["message_id"] == 42
+        await eventually(lambda: written == [42])
+        await eventually(lambda: not redis_client.sorted_sets)
+        assert await other.visible_bound(1) is None
+        await writer.stop()
+
+    asyncio.run(scenario())
+
+def test_expired_entries_of_a_crashed_worker_do_not_hold_readers(monkeypatch):
+    redis_client = FakeRedis()
+
+    async def get_redis():
+        return redis_client
+    monkeypatch.setattr(ingest, "get_redis", get_redis)
+
+    async def scenario():
+        expired = int(time.time() * 1000) - 1
+        await redis_client.zadd(pending_key(1), {f"5:{expired}": 5})
+        writer = MessageWriter(max_batch=10, max_linger=0.01)
+        assert await writer.visible_bound(1) is None
+        assert pending_key(1) not in redis_client.sorted_sets
+
+    asyncio.run(scenario())
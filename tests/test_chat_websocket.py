@@ -0,0 +1,150 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+
+for module in ("fastapi", "sqlalchemy", "asyncpg", "redis", "msgpack", "jose", "bcrypt", "aiosqlite"):
+    pytest.importorskip(module)
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.sql import text
+import msgpack
+from src.chat import routes
+from src.chat.protocol import BINARY_SUBPROTOCOL, FIELD_TAGS
+from src.chat.websocket import ChatBroker
+from tests.fakes import FakeWebSocket, eventually
+
+IDLE_SOCKETS = 25
+
+class Database:
+    """Настоящий асинхронный движок с пулом соединений (SQLite в файле) вместо Postgres."""
+
+    def __init__(self, path):
+        # Пул заметно меньше числа сокетов: если бы открытый сокет держал
+        # соединение, остальные подключения упёрлись бы в pool_timeout
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{path}", pool_size=5, max_overflow=0, pool_timeout=1
+        )
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.checkouts = 0
+        event.listen(self.engine.sync_engine, "checkout", self._count)
+
+    def _count(self, *args) -> None:
+        self.checkouts += 1
+
+    @property
+    def checked_out(self) -> int:
+        return self.engine.sync_engine.pool.checkedout()
+
+async def use_connection(db) -> None:
+    """Как настоящие проверки: запрос берёт соединение из пула в сессию."""
+    await db.execute(text("SELECT 1"))
+    assert db.get_bind().pool.checkedout()
+
+@pytest.fixture
+def chat(monkeypatch, tmp_path):
+    database = Database(tmp_path / "chat.db")
+    broker = ChatBroker()
+    writes = []
+
+    async def authenticate_token(token, db):
+        await use_connection(db)
+        return SimpleNamespace(user_id=int(token), username=f"user{token}")
+
+    async def is_member(chat_id, user_id, db):
+        await use_connection(db)
+        return True
+
+    async def replay(chat_id, since, db):
+        await use_connection(db)
+        return []
+
+    async def touch_presence(chat_id, user_id, joined=False):
+        return joined
+
+    async def leave_presence(chat_id, user_id):
+        return True
+
+    async def submit(chat_id, user_id, content):
+        # Запись идёт через общий писатель, а не через сессию сокета
+        writes.append(database.checked_out)
+        return {"message_id": len(writes), "created_at": datetime.utcnow()}
+
+    async def append_message(message, payload):
+        pass
+
+    monkeypatch.setattr(routes, "async_session", database.sessions)
+    monkeypatch.setattr(routes, "broker", broker)
+    monkeypatch.setattr(routes, "authenticate_token", authenticate_token)
+    monkeypatch.setattr(routes.membership_cache, "is_member", is_member)
+    monkeypatch.setattr(routes, "replay", replay)
+    monkeypatch.setattr(routes, "touch_presence", touch_presence)
+    monkeypatch.setattr(routes, "leave_presence", leave_presence)
+    monkeypatch.setattr(routes, "message_writer", SimpleNamespace(submit=submit))
+    monkeypatch.setattr(routes, "append_message", append_message)
+    yield SimpleNamespace(database=database, broker=broker, writes=writes)
+    asyncio.run(database.engine.dispose())
+
+def test_idle_sockets_hold_no_pool_connections(chat):
+    async def scenario():
+        sockets = [FakeWebSocket(token=str(user_id)) for user_id in range(1, IDLE_SOCKETS + 1)]
+        handlers = [asyncio.create_task(routes.websocket_chat(ws, chat_id=1, since=None)) for ws in sockets]
+        await eventually(lambda: all(ws.waiting for ws in sockets))
+
+        # Проверки при подключении берут сессию и сразу её возвращают
+        assert chat.broker.connection_count == IDLE_SOCKETS
+        assert chat.database.checkouts == 2 * IDLE_SOCKETS
+        assert chat.database.checked_out == 0
+
+        sockets[0].incoming.put_nowait({"type": "websocket.receive", "text": "hello"})
+        await eventually(lambda: all(any('"hello"' in frame for frame in ws.sent) for ws in sockets))
+        assert chat.writes == [0]
+        assert chat.database.checkouts == 2 * IDLE_SOCKETS
+        assert chat.database.checked_out == 0
+
+        for ws in sockets:
+            ws.disconnect()
+        await asyncio.gather(*handlers)
+        assert chat.broker.connection_count == 0
+        assert chat.database.checked_out == 0
+
+    asyncio.run(scenario())
+
+def test_rejected_socket_releases_its_session(chat, monkeypatch):
+    async def not_member(chat_id, user_id, db):
+        return False
+    monkeypatch.setattr(routes.membership_cache, "is_member", not_member)
+
+    async def scenario():
+        ws = FakeWebSocket(token="1")
+        await routes.websocket_chat(ws, chat_id=1, since=None)
+        assert ws.close_code == 1008
+        assert chat.database.checkouts == 1
+        assert chat.database.checked_out == 0
+
+    asyncio.run(scenario())
+
+def test_malformed_binary_frame_gets_an_error_event(chat):
+    async def scenario():
+        ws = FakeWebSocket(token="1", subprotocols=[BINARY_SUBPROTOCOL])
+        handler = asyncio.create_task(routes.websocket_chat(ws, chat_id=1, since=None))
+        await eventually(lambda: ws.waiting)
+
+        ws.incoming.put_nowait({"type": "websocket.receive", "bytes": b"\xc1"})
+        ws.incoming.put_nowait({"type": "websocket.receive", "bytes": msgpack.packb([1, 2])})
+        ws.incoming.put_nowait({"type": "websocket.receive", "bytes": msgpack.packb({FIELD_TAGS["content"]: "hello"})})
+        def received():
+            return [message for frame in ws.sent for message in msgpack.unpackb(frame, strict_map_key=False)]
+        # Сообщение после испорченных кадров всё равно записано и разослано
+        await eventually(lambda: any(message.get(FIELD_TAGS["content"]) == "hello" for message in received()))
+
+        errors = [message for message in received() if message.get(FIELD_TAGS["event"]) == "error"]
+        assert len(errors) == 2
+        assert chat.writes == [0]
+        assert ws.close_code is None
+
+        ws.disconnect()
+        await handler
+
+    asyncio.run(scenario())